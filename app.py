@@ -1,5 +1,9 @@
 import os
 import sys
+import time
+
+# Measured from here, so /api/startup can report how long the app took to import
+_import_started = time.perf_counter()
 
 # Add the project root to Python path to make imports work
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
@@ -9,16 +13,92 @@ from dotenv import load_dotenv
 from models.log_analyzer import LogAnalyzer
 from models.web_scraper import WebScraper
 from models.knowledge_base import KnowledgeBase
+from models.solution_index import DEFAULT_SEARCH_CANDIDATES
+from models.result_cache import ResultCache, DEFAULT_MAX_ENTRIES, DEFAULT_MAX_BYTES, DEFAULT_TTL_SECONDS
+from models.chunk_scan import (DEFAULT_CHUNK_CACHE_ENTRIES, DEFAULT_CHUNK_CACHE_BYTES,
+                               DEFAULT_CHUNK_CACHE_TTL_SECONDS)
+from models.finding_store import DEFAULT_SAMPLE_LIMIT, DEFAULT_EDGE_LIMIT
+from models.lazy import LazyComponent, warm_up
+from models.analysis_timings import AnalysisTimings
+from models.slow_log import SlowLog, DEFAULT_SLOW_SECONDS
+from models.write_behind import exit_on_sigterm
+from models.log_source import LogTooLarge, DEFAULT_MAX_UPLOAD_BYTES
 
 # Load environment variables
 load_dotenv()
 
 app = Flask(__name__)
 
-# Initialize components
-log_analyzer = LogAnalyzer()
-web_scraper = WebScraper()
-knowledge_base = KnowledgeBase()
+# The knowledge base writes its buffered statistics at exit, which a plain
+# SIGTERM would skip
+exit_on_sigterm()
+
+# Initialize components; scans of log chunks are cached so that a rerun of a
+# job only scans the parts of its log that changed
+chunk_cache = ResultCache(
+    max_entries=int(os.environ.get('ANALYSIS_CHUNK_CACHE_ENTRIES', DEFAULT_CHUNK_CACHE_ENTRIES)),
+    max_bytes=int(os.environ.get('ANALYSIS_CHUNK_CACHE_MB', DEFAULT_CHUNK_CACHE_BYTES // (1024 * 1024))) * 1024 * 1024,
+    ttl=float(os.environ.get('ANALYSIS_CHUNK_CACHE_TTL', DEFAULT_CHUNK_CACHE_TTL_SECONDS))
+)
+
+
+# Output budget of an analysis: ANALYSIS_SAMPLE_LIMIT=all returns every finding
+_sample_limit = os.environ.get('ANALYSIS_SAMPLE_LIMIT', str(DEFAULT_SAMPLE_LIMIT))
+sample_limit = None if _sample_limit.lower() == 'all' else int(_sample_limit)
+edge_limit = int(os.environ.get('ANALYSIS_EDGE_LIMIT', DEFAULT_EDGE_LIMIT))
+
+# Analyses slower than ANALYSIS_SLOW_SECONDS are written with their stage
+# breakdown to ANALYSIS_SLOW_LOG; an empty path turns the slow log off
+_slow_log_path = os.environ.get('ANALYSIS_SLOW_LOG', os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                                  'slow_analyses.log'))
+slow_log = SlowLog(_slow_log_path, float(os.environ.get('ANALYSIS_SLOW_SECONDS', DEFAULT_SLOW_SECONDS))) \
+    if _slow_log_path else None
+
+
+# Uploaded logs, and logs and pages fetched from URLs, are refused once they
+# decompress to more than ANALYSIS_UPLOAD_MAX_MB; 0 accepts logs of any size
+upload_max_bytes = int(os.environ.get('ANALYSIS_UPLOAD_MAX_MB',
+                                      DEFAULT_MAX_UPLOAD_BYTES // (1024 * 1024))) * 1024 * 1024
+
+
+def _profile_requested(value):
+    """Whether a request flag asks for the stage timings of the analysis."""
+    return value is True or str(value).lower() in ('1', 'true', 'yes')
+
+
+def _build_knowledge_base():
+    """Load the knowledge base and fit its vectors, so the first ranking does not pay for it."""
+    # Solutions scored per search of a large knowledge base; 0 searches exactly
+    kb = KnowledgeBase(search_candidates=int(os.environ.get('KNOWLEDGE_SEARCH_CANDIDATES',
+                                                            DEFAULT_SEARCH_CANDIDATES)))
+    kb.train()
+    return kb
+
+
+# Components are built on first use, so the app serves requests as soon as it
+# is imported. COMPONENT_INIT picks when they are built: 'background' (the
+# default) starts building them in a thread right away, 'eager' builds them
+# before the app starts, 'lazy' waits for the first request that needs them.
+# None of them touches the network while being built.
+log_analyzer = LazyComponent(lambda: LogAnalyzer(chunk_cache=chunk_cache, sample_limit=sample_limit,
+                                                 edge_limit=edge_limit), 'log_analyzer')
+web_scraper = LazyComponent(lambda: WebScraper(max_log_bytes=upload_max_bytes or None), 'web_scraper')
+knowledge_base = LazyComponent(_build_knowledge_base, 'knowledge_base')
+components = [log_analyzer, knowledge_base, web_scraper]
+
+component_init = os.environ.get('COMPONENT_INIT', 'background').lower()
+if component_init not in ('lazy', 'background', 'eager'):
+    print(f"Warning: Unknown COMPONENT_INIT {component_init!r}, using 'background'")
+    component_init = 'background'
+if component_init != 'lazy':
+    warm_up(components, background=component_init == 'background')
+
+# Results of recently analyzed logs, so a log pasted again is answered without re-analysis
+analysis_cache = ResultCache(
+    max_entries=int(os.environ.get('ANALYSIS_CACHE_ENTRIES', DEFAULT_MAX_ENTRIES)),
+    max_bytes=int(os.environ.get('ANALYSIS_CACHE_MB', DEFAULT_MAX_BYTES // (1024 * 1024))) * 1024 * 1024,
+    ttl=float(os.environ.get('ANALYSIS_CACHE_TTL', DEFAULT_TTL_SECONDS))
+)
 
 @app.route('/')
 def index():
@@ -29,18 +109,23 @@ def index():
 def analyze_log():
     """Analyze log from a URL or direct input."""
     try:
+        # A log posted as the raw request body may be compressed; it is bounded
+        # by its decompressed size instead of the timeout below
+        if not request.is_json:
+            return analyze_upload()
+        
         data = request.get_json()
         if not data:
             return jsonify({'error': 'No JSON data provided'}), 400
             
         log_url = data.get('log_url')
         log_content = data.get('log_content')
+        profile = _profile_requested(data.get('profile', request.args.get('profile')))
         
         # Set a processing timeout for long-running operations
         def process_with_timeout(timeout=15):
             """Run log processing with a timeout to prevent hanging"""
             import threading
-            import time
             import ctypes
             import inspect
             
@@ -66,18 +151,21 @@ def analyze_log():
             def process_log():
                 nonlocal result
                 try:
-                    # Get log content if provided by URL
+                    # A log given by URL is analyzed as it downloads, without
+                    # holding it in memory
                     nonlocal log_content
                     if log_url and not log_content:
-                        log_content = web_scraper.fetch_content(log_url)
+                        result = analyze_url(log_url, profile, data.get('feedback'))
+                        return
                     
                     if not log_content:
                         result = {'success': False, 'error': 'No log content provided or could not fetch from URL'}
                         return
                     
                     # Check if the log content contains requests-related errors
-                    if 'requests' in log_content.lower() and any(term in log_content.lower() for term in 
-                                                                ['modulenotfounderror', 'importerror', 'no module named']):
+                    lowered_content = log_content.lower()
+                    if 'requests' in lowered_content and any(term in lowered_content for term in 
+                                                             ['modulenotfounderror', 'importerror', 'no module named']):
                         # Return a specific solution for requests module issues
                         result = {
                             'success': True,
@@ -170,22 +258,44 @@ def analyze_log():
                                 }
                                 return
                     
-                    # If we didn't return early with a module solution, do full analysis
-                    # Analyze the log
-                    analysis_result = log_analyzer.analyze(log_content)
+                    # If we didn't return early with a module solution, do full analysis,
+                    # unless the same log was analyzed with the same patterns and knowledge
+                    log_analyzer.reload_patterns()
+                    analysis_cache.set_version(log_analyzer.patterns_version, knowledge_base.solutions_version)
+                    cache_key = analysis_cache.key(log_content)
+                    # A profiled analysis is timed afresh, and its timings are not cached
+                    cached = analysis_cache.get(cache_key) if not profile else None
                     
-                    # Get solution suggestions
-                    if not solutions:  # Only get more solutions if we don't already have module solutions
-                        solutions.extend(knowledge_base.get_solutions(analysis_result['error_type'], analysis_result.get('context', [])))
+                    if cached is not None:
+                        analysis_result, response_body = cached
+                    else:
+                        # Analyze the log
+                        timings = AnalysisTimings() if profile or slow_log is not None else None
+                        analysis_result = log_analyzer.analyze(log_content, timings)
+                        if slow_log is not None:
+                            slow_log.record(timings, log_content, 'paste', url=log_url)
+                        if profile:
+                            analysis_result = dict(analysis_result, timings=timings.summary())
+                        
+                        # Get solution suggestions
+                        if not solutions:  # Only get more solutions if we don't already have module solutions
+                            solutions.extend(knowledge_base.get_solutions(analysis_result['error_type'], analysis_result.get('context', []),
+                                                                         exception=analysis_result.get('primary_exception')))
+                        
+                        # Cache the encoded response, so a hit skips serializing it again
+                        response_body = app.json.dumps({
+                            'analysis': analysis_result,
+                            'solutions': solutions
+                        })
+                        if not profile:
+                            analysis_cache.put(cache_key, (analysis_result, response_body), len(response_body))
                     
                     # Learn from this analysis
                     knowledge_base.learn(log_content, analysis_result, data.get('feedback'))
                     
-                    # Add the solutions to the result
                     result = {
                         'success': True,
-                        'analysis': analysis_result,
-                        'solutions': solutions
+                        'response_body': response_body
                     }
                 except Exception as e:
                     app.logger.error(f"Error in process_log: {str(e)}")
@@ -197,9 +307,7 @@ def analyze_log():
             thread.start()
             
             # Wait with timeout
-            start_time = time.time()
-            while thread.is_alive() and (time.time() - start_time) < timeout:
-                time.sleep(0.1)
+            thread.join(timeout)
             
             # If thread is still running after timeout, terminate it
             if thread.is_alive():
@@ -212,7 +320,11 @@ def analyze_log():
         processing_result = process_with_timeout()
         
         if not processing_result.get('success', False):
-            return jsonify({'error': processing_result.get('error', 'Unknown error during analysis')}), 500
+            return (jsonify({'error': processing_result.get('error', 'Unknown error during analysis')}),
+                    processing_result.get('status', 500))
+        
+        if 'response_body' in processing_result:
+            return app.response_class(processing_result['response_body'], mimetype=app.json.mimetype)
             
         return jsonify({
             'analysis': processing_result['analysis'],
@@ -223,6 +335,136 @@ def analyze_log():
         app.logger.error(f"Error analyzing log: {str(e)}")
         return jsonify({'error': f'Analysis failed: {str(e)}'}), 500
 
+def analyze_url(url, profile=False, feedback=None):
+    """
+    Analyze a log fetched from a URL as it downloads.
+    
+    The log may be compressed with gzip, bzip2, xz or zstd, and is refused
+    once it decompresses to more than ANALYSIS_UPLOAD_MAX_MB. As its content
+    is only known once it was read, the result is not cached.
+    
+    Args:
+        url (str): URL of the log
+        profile (bool): Add the stage timings of the analysis to the result
+        feedback (str, optional): User feedback to learn from
+        
+    Returns:
+        dict: success and the encoded response_body, or success, error and
+            the HTTP status to answer with
+    """
+    import requests
+    from urllib3.exceptions import HTTPError as TransferError
+    
+    log_analyzer.reload_patterns()
+    timings = AnalysisTimings() if profile or slow_log is not None else None
+    try:
+        with web_scraper.open_content(url) as stream:
+            analysis_result = log_analyzer.analyze_stream(stream, timings)
+    except requests.RequestException as e:
+        return {'success': False, 'error': f'Could not fetch the log from {url}: {e}', 'status': 502}
+    except TransferError as e:
+        # The connection broke off while the log was downloading
+        return {'success': False, 'error': f'Could not download the log from {url}: {e}', 'status': 502}
+    except LogTooLarge:
+        return {'success': False, 'status': 413,
+                'error': f'The log at {url} is larger than {upload_max_bytes // (1024 * 1024)} MB once decompressed'}
+    except ValueError as e:
+        # A truncated or corrupt compressed log, or zstd without the zstandard package
+        return {'success': False, 'error': f'Could not decompress the log from {url}: {e}', 'status': 400}
+    
+    if slow_log is not None:
+        slow_log.record(timings, None, 'url', url=url)
+    if profile:
+        analysis_result = dict(analysis_result, timings=timings.summary())
+    solutions = knowledge_base.get_solutions(analysis_result['error_type'], analysis_result.get('context', []),
+                                             exception=analysis_result.get('primary_exception'))
+    knowledge_base.learn('', analysis_result, feedback)
+    return {
+        'success': True,
+        'response_body': app.json.dumps({
+            'analysis': analysis_result,
+            'solutions': solutions
+        })
+    }
+
+def analyze_upload():
+    """
+    Analyze a log posted as the raw request body.
+    
+    The body may be compressed with gzip, bzip2, xz or zstd; it is
+    decompressed as the analyzer reads it, so the decompressed log is never
+    held in memory. Feedback can be passed as the 'feedback' query parameter,
+    and profile=1 adds the stage timings of the analysis to the result.
+    
+    Unlike a log posted as JSON, an upload is not analyzed under the 15 second
+    timeout: a log that decompresses to more than ANALYSIS_UPLOAD_MAX_MB is
+    refused with 413 instead, which bounds the work a small compressed body
+    can cause.
+    """
+    body = request.get_data(cache=False)
+    if not body:
+        return jsonify({'error': 'No log content provided'}), 400
+    profile = _profile_requested(request.args.get('profile'))
+    
+    log_analyzer.reload_patterns()
+    analysis_cache.set_version(log_analyzer.patterns_version, knowledge_base.solutions_version)
+    # Uploads are analyzed as streams, so they are kept apart from pasted logs
+    cache_key = analysis_cache.key(body, 'upload')
+    cached = analysis_cache.get(cache_key) if not profile else None
+    
+    if cached is not None:
+        analysis_result, response_body = cached
+    else:
+        timings = AnalysisTimings() if profile or slow_log is not None else None
+        try:
+            analysis_result = log_analyzer.analyze_stream(body, timings, max_bytes=upload_max_bytes or None)
+        except LogTooLarge:
+            return jsonify({'error': f'The log is larger than {upload_max_bytes // (1024 * 1024)} MB '
+                                     f'once decompressed'}), 413
+        except ValueError as e:
+            # A truncated or corrupt compressed body, or zstd without the zstandard package
+            return jsonify({'error': f'Could not decompress the request body: {e}'}), 400
+        if slow_log is not None:
+            slow_log.record(timings, body, 'upload')
+        if profile:
+            analysis_result = dict(analysis_result, timings=timings.summary())
+        solutions = knowledge_base.get_solutions(analysis_result['error_type'], analysis_result.get('context', []),
+                                                 exception=analysis_result.get('primary_exception'))
+        response_body = app.json.dumps({
+            'analysis': analysis_result,
+            'solutions': solutions
+        })
+        if not profile:
+            analysis_cache.put(cache_key, (analysis_result, response_body), len(response_body))
+    
+    knowledge_base.learn('', analysis_result, request.args.get('feedback'))
+    return app.response_class(response_body, mimetype=app.json.mimetype)
+
+@app.route('/api/analyze/cache', methods=['GET'])
+def analysis_cache_stats():
+    """Report the hit, miss and eviction counters of the result and chunk caches."""
+    return jsonify({
+        'results': analysis_cache.stats(),
+        'chunks': chunk_cache.stats()
+    })
+
+@app.route('/api/patterns/stats', methods=['GET'])
+def pattern_stats():
+    """Report hit counts and match time of every pattern, and the patterns rejected as unsafe."""
+    return jsonify({
+        'error_patterns': log_analyzer.pattern_stats(),
+        'knowledge_base': knowledge_base.pattern_stats()
+    })
+
+@app.route('/api/startup', methods=['GET'])
+def startup_status():
+    """Report how long the app took to import and which components are built."""
+    return jsonify({
+        'import_seconds': round(import_seconds, 4),
+        'component_init': component_init,
+        'components': [component.status() for component in components]
+    })
+
 @app.route('/api/learn', methods=['POST'])
 def learn():
     """Endpoint for the system to learn from user feedback."""
@@ -763,6 +1005,8 @@ def add_custom_solutions():
     }
     knowledge_base.add_solution('exception', ['TypeError', 'type', 'conversion'], type_error_solution)
 
+import_seconds = time.perf_counter() - _import_started
+
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5002))  # Changed from 5001 to 5002
     debug = os.environ.get('DEBUG', 'true').lower() == 'true'
@@ -1,4 +1,16 @@
-# Import models for easy access
-from .log_analyzer import LogAnalyzer
-from .web_scraper import WebScraper
-from .knowledge_base import KnowledgeBase
+# Import models for easy access; the modules are loaded on first use, so that
+# importing one model does not pay for the dependencies of the others
+_EXPORTS = {
+    'LogAnalyzer': 'log_analyzer',
+    'WebScraper': 'web_scraper',
+    'KnowledgeBase': 'knowledge_base'
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    import importlib
+    return getattr(importlib.import_module(f'.{_EXPORTS[name]}', __name__), name)
@@ -0,0 +1,76 @@
+import time
+from contextlib import contextmanager, nullcontext
+
+
+class AnalysisTimings:
+    """
+    Wall and CPU time of each stage of one analysis, with the work it did.
+
+    Stages are recorded in the order they ran. CPU time is that of the
+    analyzing thread, so other requests served meanwhile do not count. An
+    analyzer given no timings skips the bookkeeping entirely.
+    """
+
+    def __init__(self):
+        """Start the clock of a new analysis."""
+        self.stages = []
+        self._wall_started = time.perf_counter()
+        self._cpu_started = time.thread_time()
+
+    @contextmanager
+    def stage(self, name, lines=None, bytes_scanned=None, regex_calls=None):
+        """
+        Time a stage of the analysis.
+
+        Args:
+            name (str): Name of the stage
+            lines (int, optional): Lines the stage processed
+            bytes_scanned (int, optional): Bytes the stage scanned
+            regex_calls (int, optional): Regex matches the stage attempted
+
+        Yields:
+            dict: The stage's record, whose counters can be set while it runs
+        """
+        record = {'name': name, 'wall_ms': 0.0, 'cpu_ms': 0.0,
+                  'lines': lines, 'bytes': bytes_scanned, 'regex_calls': regex_calls}
+        wall_started = time.perf_counter()
+        cpu_started = time.thread_time()
+        try:
+            yield record
+        finally:
+            record['wall_ms'] = (time.perf_counter() - wall_started) * 1000
+            record['cpu_ms'] = (time.thread_time() - cpu_started) * 1000
+            self.stages.append(record)
+
+    def summary(self):
+        """
+        Report the stages.
+
+        Returns:
+            dict: total_wall_ms, total_cpu_ms and, per stage, name, wall_ms,
+                cpu_ms, lines, bytes and regex_calls (None when the stage does
+                not count them); times are rounded to microseconds
+        """
+        return {
+            'total_wall_ms': round((time.perf_counter() - self._wall_started) * 1000, 3),
+            'total_cpu_ms': round((time.thread_time() - self._cpu_started) * 1000, 3),
+            'stages': [dict(record, wall_ms=round(record['wall_ms'], 3), cpu_ms=round(record['cpu_ms'], 3))
+                       for record in self.stages]
+        }
+
+
+def timed_stage(timings, name, **counters):
+    """
+    Time a stage on timings, or do nothing when there are no timings.
+
+    Args:
+        timings (AnalysisTimings): Timings of the analysis, or None
+        name (str): Name of the stage
+        **counters: Counters of the stage, see AnalysisTimings.stage
+
+    Returns:
+        context manager: Yields the stage's record, a throwaway dict without timings
+    """
+    if timings is None:
+        return nullcontext({})
+    return timings.stage(name, **counters)
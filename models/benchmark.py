@@ -0,0 +1,643 @@
+"""
+Benchmarks of the log analyzer on synthetic logs.
+
+Run ``python -m models.benchmark run --output bench.json`` from the project
+root. It writes deterministic logs of each kind and size (see log_generator)
+to a data directory, where they are kept for later runs, and analyzes each
+one in each mode. Every measurement runs in a fresh interpreter, so its peak
+RSS is that of one analysis. The report gives lines per second, the time
+spent in each stage of the analyzer and the peak RSS, as JSON.
+
+``python -m models.benchmark compare baseline.json bench.json`` lists what
+got slower or bigger than the stored baseline; its exit status is 1 if
+anything regressed past the threshold.
+
+``python -m models.benchmark memory`` checks that the modes meant to run in
+bounded memory keep their peak RSS about flat as the log grows from 16MB to
+64MB; ``run`` makes the same check when it measures two sizes of 16MB or more.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import datetime
+import tempfile
+import subprocess
+from .log_generator import LOG_KINDS, GENERATOR_VERSION, cached_log, parse_size, format_size
+
+REPORT_VERSION = 1
+
+DEFAULT_SIZES = ('1KB', '1MB', '16MB')
+DEFAULT_REPEAT = 3
+DEFAULT_DATA_DIR = os.path.join(tempfile.gettempdir(), 'devdebug-benchmark')
+
+# A run is a regression when it is this much slower, or bigger, than the
+# baseline, and by more than the noise floor
+DEFAULT_TIME_THRESHOLD = 0.10
+DEFAULT_RSS_THRESHOLD = 0.10
+MIN_SECONDS_DELTA = 0.005
+MIN_RSS_DELTA = 4 * 1024 * 1024
+
+# Pieces the log is appended in for the incremental mode, one poll after each
+INCREMENTAL_PIECES = 10
+
+# Modes whose memory must not grow with the log, and the peak RSS they may gain
+# per byte of log between the two largest sizes measured. Sizes under
+# MIN_GROWTH_LOG_BYTES are left out, as fixed costs dominate their RSS.
+BOUNDED_MODES = ('stream', 'gzip')
+DEFAULT_MAX_RSS_GROWTH = 0.5
+MIN_GROWTH_LOG_BYTES = parse_size('16MB')
+MEMORY_CHECK_SIZES = ('16MB', '64MB')
+MEMORY_CHECK_KINDS = ('errors',)
+
+
+class _StageTimer:
+    """Times calls to analyzer methods by stage, each call's own time without the timed calls it makes."""
+
+    def __init__(self):
+        self.seconds = {}
+        self._nested = []
+        self._replaced = []
+
+    def wrap(self, owner, attribute, stage):
+        """Replace owner.attribute with a version that adds its time to stage."""
+        function = getattr(owner, attribute, None)
+        if function is None:
+            return
+
+        def timed(*args, **kwargs):
+            self._nested.append(0.0)
+            started = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - started
+                nested = self._nested.pop()
+                self.seconds[stage] = self.seconds.get(stage, 0.0) + elapsed - nested
+                if self._nested:
+                    self._nested[-1] += elapsed
+
+        self._replaced.append((owner, attribute, function))
+        setattr(owner, attribute, timed)
+
+    def restore(self):
+        """Put back everything wrap() replaced."""
+        for owner, attribute, function in reversed(self._replaced):
+            setattr(owner, attribute, function)
+        self._replaced = []
+
+    def instrument(self, analyzer):
+        """Time the stages of an analyzer."""
+        from . import log_analyzer
+        self.wrap(sys.modules[__name__], '_read_text', 'read')
+        self.wrap(log_analyzer, 'detect_format', 'detect')
+        self.wrap(log_analyzer, 'scan_file_parallel', 'scan')
+        self.wrap(analyzer.scanner, 'scan', 'scan')
+        self.wrap(analyzer.mapped_scanner, 'scan', 'scan')
+        self.wrap(analyzer.chunked_scanner, 'scan', 'scan')
+        self.wrap(analyzer.scanner, 'append', 'merge')
+        self.wrap(analyzer.scanner, 'merge', 'merge')
+        self.wrap(analyzer.scanner, 'summarize', 'summarize')
+        self.wrap(analyzer, '_extract_context', 'context')
+        self.wrap(analyzer, '_extract_code_snippets', 'snippets')
+        self.wrap(analyzer, '_build_result', 'build')
+
+
+def _read_text(path):
+    """Read a whole log as text, the way an upload is read."""
+    with open(path, encoding='utf-8', errors='replace', newline='') as f:
+        return f.read()
+
+
+def _analyzer(chunk_cache=False):
+    """Build an analyzer with the app's defaults."""
+    from .log_analyzer import LogAnalyzer
+    if not chunk_cache:
+        return LogAnalyzer()
+    from .result_cache import ResultCache
+    from .chunk_scan import DEFAULT_CHUNK_CACHE_ENTRIES, DEFAULT_CHUNK_CACHE_BYTES
+    return LogAnalyzer(chunk_cache=ResultCache(DEFAULT_CHUNK_CACHE_ENTRIES, DEFAULT_CHUNK_CACHE_BYTES, ttl=None))
+
+
+def _prepare_analyze(path, scratch):
+    """Read the log and analyze() it, as for an upload."""
+    analyzer = _analyzer()
+    return analyzer, lambda: analyzer.analyze(_read_text(path))
+
+
+def _prepare_chunked_cold(path, scratch):
+    """analyze() with an empty chunk cache."""
+    analyzer = _analyzer(chunk_cache=True)
+    return analyzer, lambda: analyzer.analyze(_read_text(path))
+
+
+def _prepare_chunked_warm(path, scratch):
+    """analyze() again, with the chunks of the log already cached."""
+    analyzer = _analyzer(chunk_cache=True)
+    analyzer.analyze(_read_text(path))
+    return analyzer, lambda: analyzer.analyze(_read_text(path))
+
+
+def _prepare_stream(path, scratch):
+    """analyze_stream() over the file."""
+    from .log_source import open_log
+    analyzer = _analyzer()
+
+    def run():
+        with open_log(path) as f:
+            return analyzer.analyze_stream(f)
+    return analyzer, run
+
+
+def _prepare_mmap(path, scratch):
+    """analyze_file(), through a memory map."""
+    analyzer = _analyzer()
+    return analyzer, lambda: analyzer.analyze_file(path)
+
+
+def _prepare_parallel(path, scratch):
+    """analyze_parallel() with the default workers and chunk size."""
+    analyzer = _analyzer()
+    return analyzer, lambda: analyzer.analyze_parallel(path)
+
+
+def _prepare_gzip(path, scratch):
+    """analyze_file() on the gzip-compressed copy of the log."""
+    analyzer = _analyzer()
+    return analyzer, lambda: analyzer.analyze_file(path + '.gz')
+
+
+def _prepare_incremental(path, scratch):
+    """analyze_incremental() after each of INCREMENTAL_PIECES appends that make up the log."""
+    analyzer = _analyzer()
+    target = os.path.join(scratch, 'incremental.log')
+    open(target, 'wb').close()
+    bounds = _line_bounds(path, INCREMENTAL_PIECES)
+
+    def run():
+        checkpoint = None
+        for start, end in zip(bounds[:-1], bounds[1:]):
+            _append_range(path, target, start, end)
+            result, checkpoint = analyzer.analyze_incremental(target, checkpoint)
+        return result
+    return analyzer, run
+
+
+# How each mode prepares an analyzer and the analysis to time
+MODES = {
+    'analyze': _prepare_analyze,
+    'chunked_cold': _prepare_chunked_cold,
+    'chunked_warm': _prepare_chunked_warm,
+    'stream': _prepare_stream,
+    'mmap': _prepare_mmap,
+    'parallel': _prepare_parallel,
+    'gzip': _prepare_gzip,
+    'incremental': _prepare_incremental,
+}
+
+
+def _line_bounds(path, pieces):
+    """Byte offsets splitting a file into about equal pieces at line ends."""
+    size = os.path.getsize(path)
+    bounds = [0]
+    with open(path, 'rb') as f:
+        for i in range(1, pieces):
+            f.seek(max(size * i // pieces - 1, bounds[-1]))
+            f.readline()
+            if f.tell() > bounds[-1]:
+                bounds.append(f.tell())
+    if bounds[-1] < size:
+        bounds.append(size)
+    return bounds
+
+
+def _append_range(source, target, start, end):
+    """Append a byte range of one file to another."""
+    with open(source, 'rb') as src, open(target, 'ab') as dst:
+        src.seek(start)
+        remaining = end - start
+        while remaining:
+            block = src.read(min(remaining, 16 * 1024 * 1024))
+            dst.write(block)
+            remaining -= len(block)
+
+
+def _peak_rss():
+    """Peak resident set size of this process and of its finished children, in bytes."""
+    try:
+        import resource
+    except ImportError:
+        return None, None
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    scale = 1 if sys.platform == 'darwin' else 1024
+    return (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale,
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale)
+
+
+def measure(mode, path, repeat=DEFAULT_REPEAT):
+    """
+    Time one mode of analysis on one log, in this process.
+
+    Args:
+        mode (str): Name of the mode in MODES
+        path (str): Path to the log
+        repeat (int): Times to run the analysis; the fastest run is reported
+
+    Returns:
+        dict: seconds of the fastest run, seconds of every run, stages (own
+            seconds of each analyzer stage in the fastest run, 'other' for the
+            rest), peak_rss_bytes, children_peak_rss_bytes and
+            startup_rss_bytes (peak RSS before the first analysis)
+    """
+    prepare = MODES[mode]
+    _analyzer()  # Imports the analyzer before the startup RSS is read
+    startup_rss, _ = _peak_rss()
+    runs = []
+    best = None
+
+    for _ in range(repeat):
+        scratch = tempfile.mkdtemp(prefix='devdebug-benchmark-')
+        try:
+            analyzer, run = prepare(path, scratch)
+            timer = _StageTimer()
+            timer.instrument(analyzer)
+            try:
+                started = time.perf_counter()
+                run()
+                seconds = time.perf_counter() - started
+            finally:
+                timer.restore()
+        finally:
+            shutil.rmtree(scratch, ignore_errors=True)
+
+        runs.append(seconds)
+        if best is None or seconds < best[0]:
+            best = (seconds, timer.seconds)
+
+    seconds, stages = best
+    stages = {stage: round(value, 6) for stage, value in sorted(stages.items())}
+    stages['other'] = round(max(seconds - sum(stages.values()), 0.0), 6)
+    peak_rss, children_peak_rss = _peak_rss()
+    return {
+        'seconds': round(seconds, 6),
+        'runs': [round(run, 6) for run in runs],
+        'stages': stages,
+        'peak_rss_bytes': peak_rss,
+        'children_peak_rss_bytes': children_peak_rss,
+        'startup_rss_bytes': startup_rss
+    }
+
+
+def _count_lines(path):
+    """Lines in a log file, counting a last line without a newline."""
+    lines = 0
+    last = b'\n'
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(16 * 1024 * 1024), b''):
+            lines += block.count(b'\n')
+            last = block[-1:]
+    return lines + (last != b'\n')
+
+
+def run_benchmarks(kinds=LOG_KINDS, sizes=DEFAULT_SIZES, modes=tuple(MODES), repeat=DEFAULT_REPEAT,
+                   data_dir=DEFAULT_DATA_DIR, seed=0, root=None, progress=None):
+    """
+    Benchmark each mode on a synthetic log of each kind and size.
+
+    Args:
+        kinds (iterable): Kinds of log, from LOG_KINDS
+        sizes (iterable): Sizes of log, such as '64MB'
+        modes (iterable): Modes of analysis, from MODES
+        repeat (int): Runs of each measurement; the fastest is reported
+        data_dir (str): Directory keeping the generated logs
+        seed (int): Seed of the generated logs
+        root (str, optional): Project root to benchmark, defaults to the
+            parent of this package
+        progress (callable, optional): Called with a line of text as each
+            measurement finishes
+
+    Returns:
+        dict: The report: the environment it ran in and, under 'results',
+            one entry per "kind/size/mode"
+
+    Raises:
+        ValueError: If a kind, size or mode is unknown
+    """
+    root = root or os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    sizes = [parse_size(size) if isinstance(size, str) else size for size in sizes]
+    for kind in kinds:
+        if kind not in LOG_KINDS:
+            raise ValueError(f"Unknown log kind {kind!r}; expected one of {', '.join(LOG_KINDS)}")
+    for mode in modes:
+        if mode not in MODES:
+            raise ValueError(f"Unknown mode {mode!r}; expected one of {', '.join(MODES)}")
+
+    report = {
+        'version': REPORT_VERSION,
+        'generator_version': GENERATOR_VERSION,
+        'created': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'commit': _git_commit(root),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'repeat': repeat,
+        'results': {}
+    }
+
+    for kind in kinds:
+        for size in sizes:
+            path = cached_log(data_dir, kind, size, seed)
+            if 'gzip' in modes:
+                cached_log(data_dir, kind, size, seed, compressed=True)
+            log_bytes = os.path.getsize(path)
+            log_lines = _count_lines(path)
+
+            for mode in modes:
+                name = f"{kind}/{format_size(size)}/{mode}"
+                entry = {'kind': kind, 'size': format_size(size), 'mode': mode,
+                         'bytes': log_bytes, 'lines': log_lines}
+                try:
+                    entry.update(_measure_in_subprocess(root, mode, path, repeat))
+                    entry['lines_per_second'] = round(log_lines / entry['seconds']) if entry['seconds'] else None
+                    entry['mb_per_second'] = round(log_bytes / 1e6 / entry['seconds'], 3) if entry['seconds'] else None
+                    line = f"{name}: {entry['seconds']:.4f}s, {entry['lines_per_second']} lines/s"
+                except RuntimeError as e:
+                    entry['error'] = str(e)
+                    line = f"{name}: failed: {e}"
+                report['results'][name] = entry
+                if progress is not None:
+                    progress(line)
+    return report
+
+
+def _measure_in_subprocess(root, mode, path, repeat):
+    """Run measure() in a fresh interpreter."""
+    result = subprocess.run([sys.executable, '-m', 'models.benchmark', 'measure', mode, path, '--repeat', str(repeat)],
+                            cwd=root, env=dict(os.environ, PYTHONDONTWRITEBYTECODE='1'),
+                            capture_output=True, text=True)
+    report_lines = result.stdout.strip().splitlines()
+    if result.returncode != 0 or not report_lines:
+        raise RuntimeError(result.stderr.strip()[-2000:] or f"exit status {result.returncode}")
+    return json.loads(report_lines[-1])
+
+
+def _git_commit(root):
+    """Commit checked out in root, None outside a git checkout."""
+    try:
+        result = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=root, capture_output=True, text=True)
+    except OSError:
+        return None
+    return result.stdout.strip() or None
+
+
+def compare_reports(baseline, current, time_threshold=DEFAULT_TIME_THRESHOLD, rss_threshold=DEFAULT_RSS_THRESHOLD):
+    """
+    Compare a report with a baseline report.
+
+    A measurement regressed if it got slower, or its peak RSS grew, by more
+    than the threshold and by more than the noise floor (MIN_SECONDS_DELTA,
+    MIN_RSS_DELTA). It improved if it got faster by as much.
+
+    Args:
+        baseline (dict): Report of the baseline
+        current (dict): Report to check
+        time_threshold (float): Share of the baseline time allowed on top of it
+        rss_threshold (float): Share of the baseline peak RSS allowed on top of it
+
+    Returns:
+        list: One dict per measurement in either report, with name, status
+            ('regression', 'improvement', 'unchanged', 'failed', 'new' or
+            'missing'), the baseline and current seconds and peak RSS, and
+            reasons for a regression
+    """
+    rows = []
+    names = list(baseline['results']) + [name for name in current['results'] if name not in baseline['results']]
+    for name in names:
+        before = baseline['results'].get(name)
+        after = current['results'].get(name)
+        row = {'name': name, 'reasons': [],
+               'baseline_seconds': before and before.get('seconds'), 'seconds': after and after.get('seconds'),
+               'baseline_rss': before and before.get('peak_rss_bytes'), 'rss': after and after.get('peak_rss_bytes')}
+        rows.append(row)
+
+        if after is None:
+            row['status'] = 'missing'
+            continue
+        if 'error' in after:
+            row['status'] = 'failed'
+            row['reasons'].append(after['error'].splitlines()[-1] if after['error'] else 'failed')
+            continue
+        if before is None or 'error' in before:
+            row['status'] = 'new'
+            continue
+
+        slower = after['seconds'] - before['seconds']
+        if slower > before['seconds'] * time_threshold and slower > MIN_SECONDS_DELTA:
+            row['reasons'].append(f"{after['seconds'] / before['seconds']:.2f}x slower")
+        if row['rss'] is not None and row['baseline_rss'] is not None:
+            bigger = row['rss'] - row['baseline_rss']
+            if bigger > row['baseline_rss'] * rss_threshold and bigger > MIN_RSS_DELTA:
+                row['reasons'].append(f"peak RSS {row['rss'] / row['baseline_rss']:.2f}x")
+
+        if row['reasons']:
+            row['status'] = 'regression'
+        elif -slower > before['seconds'] * time_threshold and -slower > MIN_SECONDS_DELTA:
+            row['status'] = 'improvement'
+        else:
+            row['status'] = 'unchanged'
+    return rows
+
+
+def check_memory_growth(report, modes=BOUNDED_MODES, max_growth=DEFAULT_MAX_RSS_GROWTH):
+    """
+    Check that bounded-memory modes keep their peak RSS flat as the log grows.
+
+    For each kind and mode, the two largest logs generated at
+    MIN_GROWTH_LOG_BYTES or more are compared: the peak RSS gained between them, per
+    byte of log added, must stay under max_growth.
+
+    Args:
+        report (dict): Report of run_benchmarks()
+        modes (iterable): Modes to check
+        max_growth (float): Peak RSS bytes allowed per byte of log
+
+    Returns:
+        list: One dict per kind and mode measured at two such sizes, with
+            name, sizes, growth (RSS bytes per log byte) and status ('ok' or
+            'regression')
+    """
+    measured = {}
+    for entry in report['results'].values():
+        if (entry['mode'] in modes and 'error' not in entry and entry.get('peak_rss_bytes') is not None
+                and parse_size(entry['size']) >= MIN_GROWTH_LOG_BYTES):
+            measured.setdefault((entry['kind'], entry['mode']), []).append(entry)
+
+    rows = []
+    for (kind, mode), entries in measured.items():
+        if len(entries) < 2:
+            continue
+        smaller, larger = sorted(entries, key=lambda entry: entry['bytes'])[-2:]
+        if larger['bytes'] == smaller['bytes']:
+            continue
+        growth = (larger['peak_rss_bytes'] - smaller['peak_rss_bytes']) / (larger['bytes'] - smaller['bytes'])
+        rows.append({'name': f"{kind}/{mode}", 'sizes': [smaller['size'], larger['size']],
+                     'rss': [smaller['peak_rss_bytes'], larger['peak_rss_bytes']], 'growth': round(growth, 3),
+                     'status': 'regression' if growth > max_growth else 'ok'})
+    return rows
+
+
+def format_memory_check(rows, max_growth=DEFAULT_MAX_RSS_GROWTH):
+    """Render the rows of check_memory_growth() as text."""
+    lines = [f"{'bounded memory':<32} {'sizes':<12} {'peak RSS':>19} {'growth':>7}  status "
+             f"(at most {max_growth} bytes of RSS per byte of log)"]
+    for row in rows:
+        lines.append(f"{row['name']:<32} {' -> '.join(row['sizes']):<12} "
+                     f"{' -> '.join(_megabytes(rss) for rss in row['rss']):>19} {row['growth']:>7.3f}  {row['status']}")
+    return '\n'.join(lines)
+
+
+def format_report(report):
+    """Render a benchmark report as text."""
+    lines = [f"{'measurement':<32} {'seconds':>9} {'lines/s':>11} {'MB/s':>8} {'peak RSS':>9}  slowest stages"]
+    for name, entry in report['results'].items():
+        if 'error' in entry:
+            lines.append(f"{name:<32} failed: {entry['error'].splitlines()[-1] if entry['error'] else ''}")
+            continue
+        stages = sorted(entry['stages'].items(), key=lambda item: item[1], reverse=True)[:3]
+        lines.append(f"{name:<32} {entry['seconds']:>9.4f} {entry['lines_per_second'] or 0:>11,} "
+                     f"{entry['mb_per_second'] or 0:>8.1f} {_megabytes(entry['peak_rss_bytes']):>9}  "
+                     + ', '.join(f"{stage} {seconds:.4f}s" for stage, seconds in stages))
+    return '\n'.join(lines)
+
+
+def format_comparison(rows):
+    """Render the rows of compare_reports() as text, regressions first."""
+    order = {'regression': 0, 'failed': 1, 'missing': 2, 'improvement': 3, 'new': 4, 'unchanged': 5}
+    lines = [f"{'measurement':<32} {'status':<12} {'baseline':>9} {'current':>9} {'base RSS':>9} {'RSS':>9}"]
+    for row in sorted(rows, key=lambda row: order[row['status']]):
+        line = (f"{row['name']:<32} {row['status']:<12} {_seconds(row['baseline_seconds']):>9} "
+                f"{_seconds(row['seconds']):>9} {_megabytes(row['baseline_rss']):>9} {_megabytes(row['rss']):>9}")
+        if row['reasons']:
+            line += '  ' + '; '.join(row['reasons'])
+        lines.append(line)
+
+    counts = {}
+    for row in rows:
+        counts[row['status']] = counts.get(row['status'], 0) + 1
+    lines.append('')
+    lines.append(', '.join(f"{count} {status}" for status, count in sorted(counts.items(), key=lambda i: order[i[0]])))
+    return '\n'.join(lines)
+
+
+def _seconds(value):
+    """Render seconds for a table, '-' when unknown."""
+    return f"{value:.4f}" if value is not None else '-'
+
+
+def _megabytes(value):
+    """Render bytes as megabytes for a table, '-' when unknown."""
+    return f"{value / (1024 * 1024):.1f}MB" if value is not None else '-'
+
+
+def _load_report(path):
+    """Read a report written by the run command."""
+    with open(path) as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the log analyzer on synthetic logs.')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run = commands.add_parser('run', help='benchmark every mode on every log')
+    run.add_argument('--kinds', default=','.join(LOG_KINDS), help='comma-separated kinds of log')
+    run.add_argument('--sizes', default=','.join(DEFAULT_SIZES), help='comma-separated sizes of log, 1KB to 1GB')
+    run.add_argument('--modes', default=','.join(MODES), help='comma-separated modes of analysis')
+    run.add_argument('--repeat', type=int, default=DEFAULT_REPEAT, help='runs of each measurement')
+    run.add_argument('--seed', type=int, default=0, help='seed of the generated logs')
+    run.add_argument('--data-dir', default=DEFAULT_DATA_DIR, help='directory keeping the generated logs')
+    run.add_argument('--output', help='file to write the JSON report to')
+    run.add_argument('--baseline', help='report to compare the results with')
+    run.add_argument('--threshold', type=float, default=DEFAULT_TIME_THRESHOLD,
+                     help='slowdown that counts as a regression, as a share of the baseline')
+
+    compare = commands.add_parser('compare', help='compare a report with a baseline report')
+    compare.add_argument('baseline', help='baseline report')
+    compare.add_argument('current', help='report to check')
+    compare.add_argument('--threshold', type=float, default=DEFAULT_TIME_THRESHOLD,
+                         help='slowdown that counts as a regression, as a share of the baseline')
+    compare.add_argument('--rss-threshold', type=float, default=DEFAULT_RSS_THRESHOLD,
+                         help='peak RSS growth that counts as a regression, as a share of the baseline')
+
+    memory = commands.add_parser('memory', help='check that bounded-memory modes do not grow with the log')
+    memory.add_argument('--kinds', default=','.join(MEMORY_CHECK_KINDS), help='comma-separated kinds of log')
+    memory.add_argument('--sizes', default=','.join(MEMORY_CHECK_SIZES),
+                        help='comma-separated sizes of log, the two largest of them at least 16MB')
+    memory.add_argument('--seed', type=int, default=0, help='seed of the generated logs')
+    memory.add_argument('--data-dir', default=DEFAULT_DATA_DIR, help='directory keeping the generated logs')
+    memory.add_argument('--max-growth', type=float, default=DEFAULT_MAX_RSS_GROWTH,
+                        help='peak RSS bytes allowed per byte of log')
+
+    measure_command = commands.add_parser('measure', help='time one mode on one log in this process')
+    measure_command.add_argument('mode', choices=list(MODES))
+    measure_command.add_argument('path')
+    measure_command.add_argument('--repeat', type=int, default=DEFAULT_REPEAT)
+
+    args = parser.parse_args()
+
+    if args.command == 'measure':
+        # The result is the last line printed; the analyzer may print warnings before it
+        print(json.dumps(measure(args.mode, args.path, args.repeat)))
+        return 0
+
+    if args.command == 'compare':
+        rows = compare_reports(_load_report(args.baseline), _load_report(args.current),
+                               args.threshold, args.rss_threshold)
+        print(format_comparison(rows))
+        return 1 if any(row['status'] == 'regression' for row in rows) else 0
+
+    if args.command == 'memory':
+        try:
+            report = run_benchmarks(args.kinds.split(','), args.sizes.split(','), BOUNDED_MODES, 1, args.data_dir,
+                                    args.seed, progress=lambda line: print(line, file=sys.stderr))
+        except ValueError as e:
+            print(e, file=sys.stderr)
+            return 2
+        rows = check_memory_growth(report, max_growth=args.max_growth)
+        if not rows:
+            print('No two sizes of 16MB or more were measured', file=sys.stderr)
+            return 2
+        print(format_memory_check(rows, args.max_growth))
+        return 1 if any(row['status'] == 'regression' for row in rows) else 0
+
+    try:
+        report = run_benchmarks(args.kinds.split(','), args.sizes.split(','), args.modes.split(','), args.repeat,
+                                args.data_dir, args.seed, progress=lambda line: print(line, file=sys.stderr))
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 2
+    memory_rows = check_memory_growth(report)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    print(format_report(report))
+    if memory_rows:
+        print()
+        print(format_memory_check(memory_rows))
+    status = 1 if any(row['status'] == 'regression' for row in memory_rows) else 0
+
+    if args.baseline:
+        rows = compare_reports(_load_report(args.baseline), report, args.threshold)
+        print()
+        print(format_comparison(rows))
+        if any(row['status'] == 'regression' for row in rows):
+            status = 1
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
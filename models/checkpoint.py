@@ -0,0 +1,94 @@
+import zlib
+import pickle
+import hashlib
+
+# Bytes at the start of a log used to recognize it again after a restart
+FINGERPRINT_BYTES = 4096
+
+_MAGIC = b'DDCK'
+_VERSION = 6
+
+
+def fingerprint(f, length):
+    """Digest of the first ``length`` bytes of an open binary file."""
+    f.seek(0)
+    return hashlib.blake2b(f.read(length), digest_size=16).hexdigest()
+
+
+class AnalyzerCheckpoint:
+    """
+    Where an incremental analysis of a growing log left off.
+
+    Holds the byte offset after the last complete line analyzed, a fingerprint
+    of the start of the file to notice rotation or truncation, a digest of the
+    analyzer settings, and the merged scan so far: running counters, error and
+    performance findings, template clusters, the time series, the last lines
+    (for the context of the next errors) and context windows still waiting for
+    lines. Checkpoints are pickled, so only load ones written by a trusted
+    process.
+    """
+
+    def __init__(self, config, offset=0, head_digest=None, scan=None):
+        """
+        Create a checkpoint.
+
+        Args:
+            config (str): Digest of the analyzer settings the scan was made with
+            offset (int): Bytes of the log analyzed so far
+            head_digest (str, optional): Fingerprint of the first bytes of the log
+            scan (dict, optional): Merged scan of the log so far
+        """
+        self.config = config
+        self.offset = offset
+        self.head_digest = head_digest
+        self.scan = scan
+
+    def matches(self, f, size, config):
+        """
+        Check that the checkpoint can be resumed on an open log file.
+
+        Args:
+            f (file): The log, opened in binary mode
+            size (int): Current size of the log
+            config (str): Digest of the current analyzer settings
+
+        Returns:
+            bool: False if the settings changed or the file was truncated or replaced
+        """
+        if config != self.config or size < self.offset:
+            return False
+        if self.offset == 0:
+            return True
+        return fingerprint(f, min(self.offset, FINGERPRINT_BYTES)) == self.head_digest
+
+    def to_bytes(self):
+        """Serialize the checkpoint for storage."""
+        state = {
+            'config': self.config,
+            'offset': self.offset,
+            'head_digest': self.head_digest,
+            'scan': self.scan
+        }
+        return _MAGIC + bytes([_VERSION]) + zlib.compress(pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL))
+
+    @classmethod
+    def from_bytes(cls, data):
+        """
+        Restore a checkpoint written by to_bytes().
+
+        Args:
+            data (bytes): Serialized checkpoint
+
+        Returns:
+            AnalyzerCheckpoint: The restored checkpoint
+
+        Raises:
+            ValueError: If the data is not a checkpoint of this version
+        """
+        if data[:len(_MAGIC)] != _MAGIC or data[len(_MAGIC):len(_MAGIC) + 1] != bytes([_VERSION]):
+            raise ValueError("Not an analyzer checkpoint of a supported version")
+        try:
+            state = pickle.loads(zlib.decompress(data[len(_MAGIC) + 1:]))
+        except (zlib.error, pickle.UnpicklingError, EOFError) as e:
+            raise ValueError(f"Corrupted analyzer checkpoint: {e}")
+        return cls(state['config'], state['offset'], state['head_digest'], state['scan'])
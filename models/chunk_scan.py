@@ -0,0 +1,185 @@
+import numpy as np
+from .stack_traces import can_split
+
+# Bytes before each newline that decide whether a chunk may end there
+CHUNK_WINDOW_BYTES = 16
+
+# Bytes at the start of the lines around a boundary that tell whether it cuts a stack trace
+TRACE_PREFIX_BYTES = 48
+
+# Chunk sizes in lines: boundaries are taken on average every CHUNK_AVERAGE_LINES
+# lines (a power of two), but never closer than CHUNK_MIN_LINES apart and never
+# further than CHUNK_MAX_LINES, unless that would cut a stack trace
+CHUNK_AVERAGE_LINES = 256
+CHUNK_MIN_LINES = 64
+CHUNK_MAX_LINES = 4096
+
+# Chunk cache limits: enough for the logs of a day or two of pipeline runs
+DEFAULT_CHUNK_CACHE_ENTRIES = 16384
+DEFAULT_CHUNK_CACHE_BYTES = 256 * 1024 * 1024
+DEFAULT_CHUNK_CACHE_TTL_SECONDS = 2 * 24 * 3600
+
+_MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+
+
+def line_chunks(data, average_lines=CHUNK_AVERAGE_LINES, min_lines=CHUNK_MIN_LINES, max_lines=CHUNK_MAX_LINES):
+    """
+    Split a log into content-defined chunks of whole lines.
+
+    A rolling hash of the bytes just before every newline decides whether a
+    chunk may end there, so boundaries depend only on the nearby content: an
+    edit moves at most the boundaries around it, and the chunks before and
+    after it come out byte-for-byte the same as in the unedited log. A chunk
+    never ends inside a stack trace; one that would grow past max_lines ends
+    at the first line after it that does not cut one.
+
+    Args:
+        data (bytes): The log encoded as UTF-8
+        average_lines (int): Expected chunk length in lines, a power of two
+        min_lines (int): Shortest chunk, except for the last one
+        max_lines (int): Longest chunk
+
+    Returns:
+        list: (first line, end line, start byte, end byte) per chunk, in log order,
+            where the end line is exclusive and the end byte includes the newline;
+            chunks with the same bytes always hold the same lines
+    """
+    view = np.frombuffer(data, dtype=np.uint8)
+    newlines = np.flatnonzero(view == 10)
+
+    # Polynomial hash of the window before each newline, reading zeros before
+    # the start of the log
+    window_hash = np.zeros(len(newlines), dtype=np.uint64)
+    with np.errstate(over='ignore'):
+        for back in range(CHUNK_WINDOW_BYTES, 0, -1):
+            positions = newlines - back
+            values = view[np.maximum(positions, 0)].astype(np.uint64)
+            values[positions < 0] = 0
+            window_hash = window_hash * _MULTIPLIER + values
+        window_hash *= _MULTIPLIER
+    candidates = np.flatnonzero((window_hash >> np.uint64(40)) & np.uint64(average_lines - 1) == 0)
+
+    # Line i ends at newlines[i]; a chunk ending after it ends at line i + 1
+    ends = []
+    start = 0
+    for line in candidates.tolist():
+        end = line + 1
+        while end - start > max_lines:
+            cut = _clean_cut(data, newlines, start + max_lines, end)
+            if cut is None:
+                break
+            start = cut
+            ends.append(cut)
+        if end - start >= min_lines and _splits_cleanly(data, newlines, end):
+            ends.append(end)
+            start = end
+
+    total_lines = len(newlines) + 1
+    while total_lines - start > max_lines:
+        cut = _clean_cut(data, newlines, start + max_lines, total_lines)
+        if cut is None:
+            break
+        start = cut
+        ends.append(cut)
+    if not ends or ends[-1] < total_lines:
+        ends.append(total_lines)
+
+    # A log ending with a newline ends with an empty line, which gets a chunk of
+    # its own: the chunk before it then has the same bytes and lines as it would
+    # have with more of the log after it
+    if data.endswith(b'\n') and (len(ends) < 2 or ends[-2] < total_lines - 1):
+        ends.insert(-1, total_lines - 1)
+
+    chunks = []
+    first = 0
+    for end in ends:
+        start_byte = int(newlines[first - 1]) + 1 if first > 0 else 0
+        end_byte = int(newlines[end - 1]) + 1 if end <= len(newlines) else len(data)
+        chunks.append((first, end, start_byte, end_byte))
+        first = end
+    return chunks
+
+
+def _splits_cleanly(data, newlines, end):
+    """Check that a chunk ending before line ``end`` does not cut a stack trace."""
+    last_start = int(newlines[end - 2]) + 1 if end > 1 else 0
+    next_start = int(newlines[end - 1]) + 1
+    return can_split(data[last_start:last_start + TRACE_PREFIX_BYTES],
+                     data[next_start:next_start + TRACE_PREFIX_BYTES])
+
+
+def _clean_cut(data, newlines, end, limit):
+    """First chunk end from ``end`` on, and before ``limit``, that does not cut a stack trace, or None."""
+    for cut in range(end, limit):
+        if _splits_cleanly(data, newlines, cut):
+            return cut
+    return None
+
+
+class ChunkedLogScanner:
+    """
+    Scans a log as content-defined chunks, reusing the scans of chunks seen before.
+
+    Successive runs of the same job produce logs that are mostly identical.
+    Each chunk's scan is cached under a digest of its bytes, so only chunks
+    that were not seen before are scanned and the rest are merged from the
+    cache. Cached scans are only read when merging, so they can be shared by
+    concurrent analyses.
+    """
+
+    def __init__(self, scanner, cache, version):
+        """
+        Create a chunked scanner.
+
+        Args:
+            scanner (LogScanner): Scanner for the chunks and the merge
+            cache (ResultCache): Cache for the chunk scans
+            version (str): Digest of the scanner's settings; cached scans made
+                with other settings are dropped
+        """
+        self.scanner = scanner
+        self.cache = cache
+        self.version = version
+
+    def scan(self, log_content, lines, log_format=None, stats=None):
+        """
+        Scan a log, reusing cached scans of its unchanged chunks.
+
+        Args:
+            log_content (str): The whole log
+            lines (list): The log split on newlines
+            log_format (str, optional): Name of the log's format in LOG_FORMATS
+            stats (dict, optional): Gets the lines and bytes that were scanned,
+                and the chunks that were and were not in the cache
+
+        Returns:
+            dict: A scan result in the LogScanner.merge format
+        """
+        scanner = self.scanner
+        cache = self.cache
+        cache.set_version(self.version)
+
+        data = log_content.encode('utf-8', errors='surrogatepass')
+        chunks = line_chunks(data)
+        data_view = memoryview(data)
+
+        merged = scanner.empty_scan()
+        scanned_lines = scanned_bytes = cached_chunks = 0
+        for first, end, start_byte, end_byte in chunks:
+            key = cache.key(data_view[start_byte:end_byte], log_format)
+            partial = cache.get(key)
+            if partial is None:
+                partial = scanner.scan(lines[first:end], log_format=log_format)
+                # Parse the buffered stamps now, so merging never changes the cached scan
+                partial['time_series'].flush()
+                cache.put(key, partial, end_byte - start_byte)
+                scanned_lines += end - first
+                scanned_bytes += end_byte - start_byte
+            else:
+                cached_chunks += 1
+            scanner.append(merged, partial)
+
+        if stats is not None:
+            stats.update(lines=scanned_lines, bytes=scanned_bytes,
+                         cached_chunks=cached_chunks, scanned_chunks=len(chunks) - cached_chunks)
+        return merged
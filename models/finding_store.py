@@ -0,0 +1,261 @@
+import zlib
+import heapq
+from array import array
+
+# Severity names by code; a higher code ranks higher
+SEVERITIES = ['low', 'medium', 'high', 'critical']
+SEVERITY_CODES = {name: code for code, name in enumerate(SEVERITIES)}
+
+# Output budget of a bounded store: distinct lines in the severity-weighted
+# sample, and findings kept at the start and at the end of each kind
+DEFAULT_SAMPLE_LIMIT = 500
+DEFAULT_EDGE_LIMIT = 20
+
+# Sampling weight by severity code; a critical line is as likely to be sampled
+# as 64 low ones
+SAMPLE_WEIGHTS = (1, 4, 16, 64)
+
+# Findings a bounded store holds before it drops the ones outside its budget
+MIN_COMPACT_SIZE = 4096
+
+
+class FindingStore:
+    """
+    Compact columnar store for per-line findings such as errors or performance issues.
+
+    Line numbers, kind ids and severity codes live in parallel arrays, and each
+    finding keeps a reference to its own line. Context windows are only kept for
+    the top findings (highest severity first, then earliest line), so memory
+    grows with the number of findings rather than findings times window size.
+
+    A store with a sample limit is bounded: it counts every finding but keeps
+    only the first and last edge_limit findings of each kind, the findings
+    that rank within the context limit, and a sample of distinct lines
+    weighted by severity, represented by their first finding. Each line's
+    sampling key is derived from its text, so the kept findings depend only on
+    the findings of the whole log, never on how it was split into pieces.
+    """
+
+    def __init__(self, kinds, context_limit=None, sample_limit=None, edge_limit=DEFAULT_EDGE_LIMIT):
+        """
+        Create an empty store.
+
+        Args:
+            kinds (list): Names of the finding kinds, indexed by kind id
+            context_limit (int, optional): Number of findings that keep a context
+                window; None keeps one for every finding
+            sample_limit (int, optional): Distinct lines in the weighted sample of
+                a bounded store; None keeps every finding
+            edge_limit (int): Findings of each kind kept from the start and from
+                the end of the log by a bounded store
+        """
+        self.kinds = kinds
+        self.context_limit = context_limit
+        self.sample_limit = sample_limit
+        self.edge_limit = edge_limit
+        self.line_numbers = array('q')
+        self.kind_ids = array('H')
+        self.severities = array('B')
+        self.lines = []
+        self.contexts = {}
+        self._ranked = []
+        self.kind_counts = [0] * len(kinds)
+        self.severity_counts = [0] * len(SEVERITIES)
+
+        if sample_limit is not None:
+            self.sample_keys = array('d')
+            budget = sample_limit + 2 * edge_limit * len(kinds) + (context_limit or 0)
+            self._compact_size = max(2 * budget, MIN_COMPACT_SIZE)
+        else:
+            self.sample_keys = None
+            self._compact_size = None
+
+    def __len__(self):
+        return len(self.line_numbers)
+
+    @property
+    def total(self):
+        """Number of findings recorded, including the ones a bounded store dropped."""
+        return sum(self.kind_counts)
+
+    def add(self, line_number, kind_id, line, severity=0):
+        """
+        Record a finding.
+
+        Args:
+            line_number (int): 1-based line number
+            kind_id (int): Index into ``kinds``
+            line (str): The line the finding was made on
+            severity (int): Severity code from SEVERITY_CODES
+
+        Returns:
+            int: Index of the new finding, valid until the next finding is added
+        """
+        self.kind_counts[kind_id] += 1
+        self.severity_counts[severity] += 1
+        if self.sample_keys is not None:
+            if len(self.line_numbers) >= self._compact_size:
+                self.compact()
+            self.sample_keys.append(_sample_key(line, severity))
+
+        index = len(self.line_numbers)
+        self.line_numbers.append(line_number)
+        self.kind_ids.append(kind_id)
+        self.severities.append(severity)
+        self.lines.append(line)
+        return index
+
+    def _rank(self, index):
+        """Sort key of a finding; larger ranks higher."""
+        return (self.severities[index], -self.line_numbers[index], index)
+
+    def offer_context(self, index):
+        """
+        Decide whether a finding ranks high enough to keep a context window.
+
+        When the store is full, the lowest-ranked finding loses its window to
+        make room.
+
+        Args:
+            index (int): Index of a finding just added
+
+        Returns:
+            bool: True if the caller should attach a window with set_context()
+        """
+        if self.context_limit is None:
+            return True
+        if self.context_limit <= 0:
+            return False
+
+        rank = self._rank(index)
+        if len(self._ranked) < self.context_limit:
+            heapq.heappush(self._ranked, rank)
+            return True
+        if rank > self._ranked[0]:
+            evicted = heapq.heapreplace(self._ranked, rank)[2]
+            self.contexts.pop(evicted, None)
+            return True
+        return False
+
+    def set_context(self, index, context):
+        """Attach a context window to a finding."""
+        self.contexts[index] = context
+
+    def top_indices(self):
+        """Indices of the findings that rank within the context limit."""
+        if self.context_limit is None:
+            return range(len(self))
+        return [rank[2] for rank in heapq.nlargest(self.context_limit, map(self._rank, range(len(self))))]
+
+    def extend(self, other, line_offset=0, context=None):
+        """
+        Append the findings of a store that covers a later piece of the same log.
+
+        Args:
+            other (FindingStore): Store to append
+            line_offset (int): Lines before the other store's piece
+            context (callable, optional): Maps (line index within the piece,
+                window) to the window to keep for the merged log
+        """
+        offset = len(self)
+        self.line_numbers.extend(line_number + line_offset for line_number in other.line_numbers)
+        self.kind_ids.extend(other.kind_ids)
+        self.severities.extend(other.severities)
+        self.lines.extend(other.lines)
+        for kind_id, count in enumerate(other.kind_counts):
+            self.kind_counts[kind_id] += count
+        for severity, count in enumerate(other.severity_counts):
+            self.severity_counts[severity] += count
+        if self.sample_keys is not None:
+            if other.sample_keys is not None:
+                self.sample_keys.extend(other.sample_keys)
+            else:
+                self.sample_keys.extend(_sample_key(line, severity)
+                                        for line, severity in zip(other.lines, other.severities))
+
+        # Any finding in the overall top also ranks within the top of its own
+        # store, so only findings that come with a window need to be offered
+        for index, window in other.contexts.items():
+            if self.offer_context(index + offset):
+                if context is not None:
+                    window = context(other.line_numbers[index] - 1, window)
+                self.contexts[index + offset] = window
+
+        if self.sample_keys is not None and len(self) >= self._compact_size:
+            self.compact()
+
+    def compact(self):
+        """
+        Drop the findings of a bounded store that fall outside its budget.
+
+        The kept findings are the same whenever this runs: a finding dropped
+        now can never make the budget later, as later findings only come after
+        it and raise the bar of the sample and of the context ranking.
+        """
+        if self.sample_keys is None:
+            return
+
+        keep = set()
+        by_kind = {}
+        for index, kind_id in enumerate(self.kind_ids):
+            by_kind.setdefault(kind_id, []).append(index)
+        for indices in by_kind.values():
+            keep.update(indices[:self.edge_limit])
+            keep.update(indices[-self.edge_limit:] if self.edge_limit > 0 else ())
+
+        if self.context_limit:
+            keep.update(self.top_indices())
+
+        # The sample holds distinct lines, each represented by its first finding;
+        # on equal keys the earlier line wins
+        first_seen = {}
+        for index, line in enumerate(self.lines):
+            first_seen.setdefault(line, index)
+        sample_keys = self.sample_keys
+        keep.update(heapq.nlargest(self.sample_limit, first_seen.values(),
+                                   key=lambda index: (sample_keys[index], -index)))
+
+        if len(keep) == len(self):
+            return
+        kept = sorted(keep)
+        self.line_numbers = array('q', (self.line_numbers[index] for index in kept))
+        self.kind_ids = array('H', (self.kind_ids[index] for index in kept))
+        self.severities = array('B', (self.severities[index] for index in kept))
+        self.lines = [self.lines[index] for index in kept]
+        self.sample_keys = array('d', (sample_keys[index] for index in kept))
+
+        contexts = self.contexts
+        self.contexts = {new: contexts[old] for new, old in enumerate(kept) if old in contexts}
+        if self.context_limit:
+            self._ranked = [self._rank(index) for index in self.contexts]
+            heapq.heapify(self._ranked)
+
+    def sampling(self):
+        """
+        Describe how much of the store made it into its rows.
+
+        Returns:
+            dict: total findings, returned and dropped ones, and exact counts
+                by kind and by severity
+        """
+        self.compact()
+        return {
+            'total': self.total,
+            'returned': len(self),
+            'dropped': self.total - len(self),
+            'by_type': {kind: count for kind, count in zip(self.kinds, self.kind_counts) if count},
+            'by_severity': {name: count for name, count in zip(SEVERITIES, self.severity_counts) if count}
+        }
+
+    def rows(self):
+        """Yield (line number, kind, line, severity name, context or None) per finding."""
+        self.compact()
+        for index in range(len(self)):
+            yield (self.line_numbers[index], self.kinds[self.kind_ids[index]], self.lines[index],
+                   SEVERITIES[self.severities[index]], self.contexts.get(index))
+
+
+def _sample_key(line, severity):
+    """Severity-weighted sampling key of a line; the largest keys make the sample."""
+    uniform = (zlib.crc32(line.encode('utf-8', errors='surrogatepass')) + 0.5) / 4294967296.0
+    return uniform ** (1.0 / SAMPLE_WEIGHTS[severity])
@@ -0,0 +1,156 @@
+import re
+
+
+class KeywordAutomaton:
+    """
+    Finds every keyword of a table in a text with one left-to-right scan.
+
+    The keywords are stored in a trie, and the trie is compiled into a single
+    prefix-factored regex, so the regex engine only starts a match where some
+    keyword can begin and then follows one branch of the trie. The cost of a
+    scan grows with the length of the text and of the keywords, but not with
+    the number of keywords. After each hit the scan resumes at the first
+    offset where another keyword could start, which reports overlapping
+    keywords as well, and keywords that are prefixes of the one that matched
+    are checked from the same position.
+
+    Entries may require word boundaries on both sides, with the same meaning
+    as ``\\b`` in a regex, or match anywhere as plain substrings.
+    """
+
+    def __init__(self, entries):
+        """
+        Build the trie and its regex.
+
+        Args:
+            entries (list): (keyword, word_bounded) pairs; keywords are matched
+                against lowercased text, so they are lowercased here
+        """
+        self.entries = [(keyword.lower(), bool(word_bounded)) for keyword, word_bounded in entries]
+
+        # Entries sharing a keyword share one trie node
+        self.keywords = []
+        self.keyword_entries = []
+        self.keyword_ids = {}
+        for entry, (keyword, _) in enumerate(self.entries):
+            if not keyword:
+                raise ValueError("Keywords must not be empty")
+            if keyword not in self.keyword_ids:
+                self.keyword_ids[keyword] = len(self.keywords)
+                self.keywords.append(keyword)
+                self.keyword_entries.append([])
+            self.keyword_entries[self.keyword_ids[keyword]].append(entry)
+
+        # What a match of each keyword reports: for the keyword and every shorter
+        # keyword that is a prefix of it, its substring entries, its word-bounded
+        # entries and its length
+        self.targets = []
+        for keyword in self.keywords:
+            targets = []
+            for other, candidate in enumerate(self.keywords):
+                if keyword.startswith(candidate):
+                    entries = self.keyword_entries[other]
+                    targets.append((tuple(entry for entry in entries if not self.entries[entry][1]),
+                                    tuple(entry for entry in entries if self.entries[entry][1]),
+                                    len(candidate)))
+            self.targets.append(targets)
+
+        # How far the scan may skip after a match: the first offset inside the
+        # keyword where another keyword could start
+        self.skips = []
+        for keyword in self.keywords:
+            skip = 1
+            while skip < len(keyword) and not any(
+                    other.startswith(keyword[skip:]) or keyword[skip:].startswith(other)
+                    for other in self.keywords):
+                skip += 1
+            self.skips.append(skip)
+
+        self.regex = self.compile()
+
+    def compile(self, entries=None, binary=False, flags=0, word_bounded=False):
+        """
+        Compile a regex that matches the keywords of some entries.
+
+        Named groups ``k<keyword id>`` mark where each keyword ends, and longer
+        keywords are tried first, so ``match.lastgroup`` names the longest
+        keyword starting at the match.
+
+        Args:
+            entries (iterable, optional): Entry indices to include, defaults to all
+            binary (bool): Compile for matching UTF-8 bytes instead of str
+            flags (int): Extra regex flags, such as re.IGNORECASE for text that
+                has not been lowercased
+            word_bounded (bool): Only match keywords on word boundaries
+
+        Returns:
+            re.Pattern: The compiled regex, or None if no entries are included
+        """
+        if entries is None:
+            keyword_ids = range(len(self.keywords))
+        else:
+            keyword_ids = sorted({self.keyword_ids[self.entries[entry][0]] for entry in entries})
+        if not keyword_ids:
+            return None
+
+        trie = {}
+        for keyword_id in keyword_ids:
+            node = trie
+            for char in self.keywords[keyword_id]:
+                node = node.setdefault(char, {})
+            node[None] = keyword_id
+
+        pattern = self._render(trie)
+        if word_bounded:
+            pattern = r'\b' + pattern + r'\b'
+        return re.compile(pattern.encode('utf-8') if binary else pattern, flags)
+
+    def _render(self, node):
+        """Turn a trie node into a regex, children before the keyword ending here."""
+        branches = [re.escape(char) + self._render(child)
+                    for char, child in sorted((char, child) for char, child in node.items() if char is not None)]
+        if None in node:
+            branches.append('(?P<k%d>)' % node[None])
+        if len(branches) == 1:
+            return branches[0]
+        return '(?:' + '|'.join(branches) + ')'
+
+    def find(self, text, found=None):
+        """
+        Report the entries whose keywords occur in a text.
+
+        Args:
+            text (str): Lowercased text to scan
+            found (set, optional): Set to add the entry indices to
+
+        Returns:
+            set: Indices of the matching entries
+        """
+        if found is None:
+            found = set()
+
+        search = self.regex.search
+        match = search(text)
+        while match:
+            start = match.start()
+            keyword_id = int(match.lastgroup[1:])
+            for plain, bounded, length in self.targets[keyword_id]:
+                if plain:
+                    found.update(plain)
+                if bounded and _is_boundary(text, start) and _is_boundary(text, start + length):
+                    found.update(bounded)
+            match = search(text, start + self.skips[keyword_id])
+
+        return found
+
+
+def _is_word(char):
+    """Whether a character counts as a word character for ``\\b``."""
+    return char == '_' or char.isalnum()
+
+
+def _is_boundary(text, position):
+    """Whether ``\\b`` would match at a position of a text."""
+    before = position > 0 and _is_word(text[position - 1])
+    after = position < len(text) and _is_word(text[position])
+    return before != after
@@ -1,11 +1,33 @@
 import os
-import json
 import time
+import atexit
 from collections import defaultdict
 import re
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
-import numpy as np
+from .keyword_automaton import KeywordAutomaton
+from .pattern_engine import GuardedRegex, MatchTimeout, PatternStats
+from .solution_index import SolutionIndex, DEFAULT_SEARCH_CANDIDATES
+from .knowledge_store import KnowledgeStore, solution_signature
+from .write_behind import WriteBehind
+
+# Keywords used to guess the technology of learned knowledge, matched as
+# substrings; the first technology in dict order with a hit wins
+TECH_KEYWORDS = {
+    'java': ['java', 'springframework', 'jakarta', 'javax'],
+    'python': ['python', 'traceback', 'importerror', 'modulenotfounderror'],
+    'javascript': ['javascript', 'typescript', 'node.js', 'npm', 'yarn'],
+    'docker': ['docker', 'container', 'image', 'dockerfile'],
+    'kubernetes': ['kubernetes', 'k8s', 'pod', 'deployment', 'kubectl'],
+    'database': ['sql', 'database', 'mysql', 'postgres', 'mongodb'],
+    'requests': ['requests', 'connectionerror', 'connecttimeout', 'readtimeout', 'response', 'requestexception'],
+    'web': ['http', 'https', 'status code', 'request', 'response']
+}
+
+# Pulls the suggested fix out of free-text feedback; improved to capture code
+# snippets and more complex solutions
+FEEDBACK_SOLUTION_PATTERN = r'(?:fix|solve|resolve|solution|install)[\s\:]+([\w\s\.\-\(\)\[\]\{\}\'\"\`\;\:\/\\\.\,\=\+\-\_\*\&\^\%\$\#\@\!\~]+)'
+
+# Frames of each exception in a stack trace that go into a solution query
+EXCEPTION_QUERY_FRAMES = 5
 
 class KnowledgeBase:
     """
@@ -13,63 +35,68 @@ class KnowledgeBase:
     Learns from user feedback and external sources.
     """
     
-    def __init__(self):
-        """Initialize the knowledge base with necessary resources."""
-        self.db_file = os.path.join(os.path.dirname(__file__), 'knowledge_db.json')
-        self.db = self._load_db()
-        self.vectorizer = TfidfVectorizer(stop_words='english')
+    def __init__(self, search_candidates=DEFAULT_SEARCH_CANDIDATES):
+        """
+        Initialize the knowledge base with necessary resources.
         
-        # Create vector representations if we have enough data
-        if len(self.db['solutions']) > 5:
-            self._update_vectors()
+        Args:
+            search_candidates (int): Solutions scored per search of a large
+                knowledge base, trading recall for speed; 0 searches exactly
+        """
+        self.search_candidates = search_candidates
+        self.db_file = os.path.join(os.path.dirname(__file__), 'knowledge_db.sqlite')
+        # The similarity index is saved next to the database, so a restart maps it instead of rebuilding it
+        self.index_dir = os.path.join(os.path.dirname(__file__), 'knowledge_index')
+        # Knowledge bases of earlier versions were a JSON file, imported on first start
+        self.store = KnowledgeStore(self.db_file, legacy_file=os.path.join(os.path.dirname(__file__),
+                                                                           'knowledge_db.json'))
+        self.db = self.store.load()
+        # Statistics and solution counters change with every analysis; they
+        # are written in batches, and whatever is left when the process exits
+        self.pending = WriteBehind(self.store)
+        atexit.register(self.close)
+        # Bumped whenever the solutions change, so cached suggestions can be invalidated
+        self.solutions_version = 0
+        # scikit-learn is slow to import, so the index is built the first time
+        # solutions are ranked; after that new solutions are added to it
+        self.index = None
+        self.tech_entries = [(tech, keyword)
+                             for tech, keywords in TECH_KEYWORDS.items()
+                             for keyword in keywords]
+        self.tech_keywords = KeywordAutomaton([(keyword, False) for _, keyword in self.tech_entries])
+        self.regex_stats = PatternStats(['feedback_solution'])
+        self.feedback_regex = GuardedRegex(FEEDBACK_SOLUTION_PATTERN, re.IGNORECASE, stats=self.regex_stats)
     
-    def _load_db(self):
-        """Load the knowledge database from a JSON file."""
-        if os.path.exists(self.db_file):
-            try:
-                with open(self.db_file, 'r') as f:
-                    return json.load(f)
-            except (json.JSONDecodeError, FileNotFoundError):
-                # Handle corrupted or missing file
-                print(f"Warning: Could not load knowledge DB from {self.db_file}. Creating new database.")
-        
-        # Create a new database if it doesn't exist or can't be loaded
-        db = {
-            'solutions': [],
-            'error_types': {},
-            'technologies': {},
-            'last_updated': time.time()
-        }
-        
-        # Ensure directory exists
-        os.makedirs(os.path.dirname(self.db_file), exist_ok=True)
-        
-        with open(self.db_file, 'w') as f:
-            json.dump(db, f, indent=2)
-        
-        return db
+    def _save_db(self, added=(), updated=()):
+        """Write new and changed solutions to the knowledge database, in one transaction."""
+        self.db['last_updated'] = self.store.save(added, updated)
     
-    def _save_db(self):
-        """Save the knowledge database to a JSON file."""
-        self.db['last_updated'] = time.time()
-        
-        with open(self.db_file, 'w') as f:
-            json.dump(self.db, f, indent=2)
+    def close(self):
+        """Write the pending statistics and close the knowledge database."""
+        self.pending.close()
+        self.store.close()
     
     def _update_vectors(self):
-        """Update vector representations of solutions for similarity matching."""
+        """Rebuild the similarity index of the solutions from scratch."""
         if not self.db['solutions']:
-            self.vectors = None
+            self.index = None
             return
         
-        # Create a corpus of error descriptions and contexts
-        corpus = [f"{solution['error_type']} {solution.get('error_message', '')} {' '.join(solution.get('context', []))}"
-                 for solution in self.db['solutions']]
-        
-        # Fit the vectorizer and transform the corpus
-        self.vectors = self.vectorizer.fit_transform(corpus)
+        solutions = list(self.db['solutions'])
+        self.index = SolutionIndex.build([self._solution_text(solution) for solution in solutions], solutions,
+                                         directory=self.index_dir, search_candidates=self.search_candidates)
     
-    def get_solutions(self, error_type, context, limit=5):
+    def _index_solutions(self, solutions):
+        """Add new solutions, just appended to the database, to the similarity index."""
+        # Without an index yet, the first ranking builds it with them
+        if self.index is not None:
+            self.index.add([self._solution_text(solution) for solution in solutions], solutions)
+    
+    def _solution_text(self, solution):
+        """Text of a solution that queries are matched against: error description and context."""
+        return f"{solution['error_type']} {solution.get('error_message', '')} {' '.join(solution.get('context', []))}"
+    
+    def get_solutions(self, error_type, context, limit=5, exception=None):
         """
         Get solution suggestions for a given error type and context.
         
@@ -77,6 +104,9 @@ class KnowledgeBase:
             error_type (str): The type of error
             context (list): Context lines around the error
             limit (int): Maximum number of solutions to return
+            exception (dict, optional): The stack trace of the error, from the
+                analysis' primary_exception; its exceptions, messages and top
+                frames make a sharper query than the context lines
             
         Returns:
             list: Suggested solutions
@@ -90,26 +120,32 @@ class KnowledgeBase:
                          key=lambda x: x.get('success_rate', 0), 
                          reverse=True)[:limit]
         
-        if not hasattr(self, 'vectors') or self.vectors is None:
+        if self.index is None:
             self._update_vectors()
-            # If still no vectors, just return sorted solutions
-            if not hasattr(self, 'vectors') or self.vectors is None:
+            # If still no index, just return sorted solutions
+            if self.index is None:
                 return sorted(self.db['solutions'], 
                             key=lambda x: x.get('success_rate', 0), 
                             reverse=True)[:limit]
         
-        # Create a query vector
-        query = f"{error_type} {' '.join(context if context else [])}"
-        query_vector = self.vectorizer.transform([query])
-        
-        # Calculate similarity scores
-        similarities = cosine_similarity(query_vector, self.vectors)[0]
-        
-        # Get the indices of the top solutions
-        top_indices = np.argsort(similarities)[-limit:][::-1]
+        # Build the query
+        if exception:
+            query = f"{error_type} {self._exception_query(exception)}"
+        else:
+            query = f"{error_type} {' '.join(context if context else [])}"
         
-        # Return the top solutions
-        return [self.db['solutions'][i] for i in top_indices]
+        # Return the most similar solutions
+        return [solution for _, solution in self.index.top(query, limit)]
+    
+    def _exception_query(self, exception):
+        """Words of a stack trace that identify it: exceptions, messages and top frames."""
+        parts = [exception.get('exception'), exception.get('message')]
+        parts.extend(exception.get('frames', [])[:EXCEPTION_QUERY_FRAMES])
+        root_cause = exception.get('root_cause')
+        if root_cause:
+            parts.extend([root_cause.get('exception'), root_cause.get('message')])
+            parts.extend(root_cause.get('frames', [])[:EXCEPTION_QUERY_FRAMES])
+        return ' '.join(part for part in parts if part)
     
     def learn(self, log_content, analysis, feedback=None, solution_applied=None, solution_worked=None):
         """
@@ -138,6 +174,8 @@ class KnowledgeBase:
             self.db['technologies'][technology] = 1
         else:
             self.db['technologies'][technology] += 1
+        self.pending.count('error_types', error_type)
+        self.pending.count('technologies', technology)
         
         # If a solution was applied and we know if it worked
         if solution_applied and solution_worked is not None:
@@ -150,7 +188,8 @@ class KnowledgeBase:
                     if solution_worked:
                         solution['successes'] += 1
                     solution['success_rate'] = solution['successes'] / solution['attempts']
-                    self._save_db()
+                    self.solutions_version += 1
+                    self.pending.touch(solution)
                     return True
             
             # Add a new solution
@@ -167,19 +206,21 @@ class KnowledgeBase:
             }
             
             self.db['solutions'].append(new_solution)
-            self._save_db()
-            
-            # Update vectors
-            self._update_vectors()
+            self.solutions_version += 1
+            self._index_solutions([new_solution])
+            self._save_db(added=[new_solution])
             
             return True
         
         # If we just have feedback, store it for future analysis
         if feedback:
-            # Extract potential solutions from feedback
-            # Improved pattern to capture code snippets and more complex solutions
-            solution_pattern = r'(?:fix|solve|resolve|solution|install)[\s\:]+([\w\s\.\-\(\)\[\]\{\}\'\"\`\;\:\/\\\.\,\=\+\-\_\*\&\^\%\$\#\@\!\~]+)'
-            solutions = re.findall(solution_pattern, feedback, re.IGNORECASE)
+            # Extract potential solutions from feedback, with a time budget
+            # since the feedback is free text from users
+            try:
+                solutions = self.feedback_regex.findall(feedback)
+            except (MatchTimeout, RuntimeError) as e:
+                print(f"Warning: Could not extract solutions from feedback: {e}")
+                solutions = []
             
             if solutions:
                 new_solution = {
@@ -195,11 +236,11 @@ class KnowledgeBase:
                 }
                 
                 self.db['solutions'].append(new_solution)
-                self._save_db()
+                self.solutions_version += 1
+                self._index_solutions([new_solution])
+                self._save_db(added=[new_solution])
                 return True
         
-        # Just save the updated statistics
-        self._save_db()
         return True
     
     def add_knowledge(self, knowledge_items):
@@ -212,7 +253,7 @@ class KnowledgeBase:
         Returns:
             int: Number of items added
         """
-        added_count = 0
+        added = []
         
         for item in knowledge_items:
             if item['type'] == 'issue':
@@ -232,7 +273,7 @@ class KnowledgeBase:
                     }
                     
                     self.db['solutions'].append(new_solution)
-                    added_count += 1
+                    added.append(new_solution)
             
             elif item['type'] == 'stackoverflow':
                 if 'question' in item and 'answer' in item:
@@ -251,7 +292,7 @@ class KnowledgeBase:
                     }
                     
                     self.db['solutions'].append(new_solution)
-                    added_count += 1
+                    added.append(new_solution)
             
             elif item['type'] == 'documentation':
                 if 'title' in item and 'content' in item:
@@ -272,13 +313,14 @@ class KnowledgeBase:
                         }
                         
                         self.db['solutions'].append(new_solution)
-                        added_count += 1
+                        added.append(new_solution)
         
-        if added_count > 0:
-            self._save_db()
-            self._update_vectors()
+        if added:
+            self.solutions_version += 1
+            self._index_solutions(added)
+            self._save_db(added=added)
         
-        return added_count
+        return len(added)
     
     def add_solution(self, error_type, context, solution):
         """
@@ -308,22 +350,30 @@ class KnowledgeBase:
         
         # Add to solutions list
         self.db['solutions'].append(solution)
+        self.solutions_version += 1
+        self._index_solutions([solution])
         
         # Update error type statistics
         if error_type in self.db['error_types']:
             self.db['error_types'][error_type] += 1
         else:
             self.db['error_types'][error_type] = 1
+        self.pending.count('error_types', error_type)
             
         # Save the updated database
-        self._save_db()
-        
-        # Update vector representations if we have enough data
-        if len(self.db['solutions']) > 5:
-            self._update_vectors()
+        self._save_db(added=[solution])
             
         return True
     
+    def pattern_stats(self):
+        """
+        Report how often the knowledge base regexes matched and how much time they cost.
+        
+        Returns:
+            list: Counters of every regex, most expensive first
+        """
+        return self.regex_stats.summary()
+    
     def _guess_error_type(self, text):
         """Guess the error type from text."""
         error_patterns = {
@@ -346,20 +396,10 @@ class KnowledgeBase:
         """Guess the technology from text."""
         combined_text = ' '.join(texts).lower()
         
-        tech_indicators = {
-            'java': ['java', 'springframework', 'jakarta', 'javax'],
-            'python': ['python', 'traceback', 'importerror', 'modulenotfounderror'],
-            'javascript': ['javascript', 'typescript', 'node.js', 'npm', 'yarn'],
-            'docker': ['docker', 'container', 'image', 'dockerfile'],
-            'kubernetes': ['kubernetes', 'k8s', 'pod', 'deployment', 'kubectl'],
-            'database': ['sql', 'database', 'mysql', 'postgres', 'mongodb'],
-            'requests': ['requests', 'connectionerror', 'connecttimeout', 'readtimeout', 'response', 'requestexception'],
-            'web': ['http', 'https', 'status code', 'request', 'response']
-        }
-        
-        for tech, indicators in tech_indicators.items():
-            if any(indicator in combined_text for indicator in indicators):
-                return tech
+        # Entries are in table order, so the lowest hit belongs to the first technology
+        hits = self.tech_keywords.find(combined_text)
+        if hits:
+            return self.tech_entries[min(hits)][0]
         
         return 'unknown'
 
@@ -367,7 +407,11 @@ class KnowledgeBase:
         """Train the knowledge base with additional data sources."""
         # Placeholder for more sophisticated training
         # In a real implementation, this would involve more complex learning
-        self._update_vectors()
+        if self.index is None:
+            self._update_vectors()
+        else:
+            # Weigh every solution with the current document frequencies
+            self.index.reweight()
         return True
         
     def export_data(self):
@@ -408,13 +452,10 @@ class KnowledgeBase:
                 
             # Track existing solution IDs to avoid duplicates
             existing_ids = {solution.get("id") for solution in self.db["solutions"] if "id" in solution}
-            existing_signatures = {
-                f"{solution.get('error_type', '')}-{solution.get('error_message', '')}"
-                for solution in self.db["solutions"]
-            }
+            existing_signatures = {solution_signature(solution) for solution in self.db["solutions"]}
             
-            # Count imported solutions
-            imported_count = 0
+            # Imported solutions
+            imported = []
             
             # Add new solutions
             for solution in data["solutions"]:
@@ -423,7 +464,7 @@ class KnowledgeBase:
                     continue
                     
                 # Generate a signature for duplicate detection
-                signature = f"{solution.get('error_type', '')}-{solution.get('error_message', '')}"
+                signature = solution_signature(solution)
                 
                 # Skip duplicates
                 if ("id" in solution and solution["id"] in existing_ids) or signature in existing_signatures:
@@ -431,22 +472,21 @@ class KnowledgeBase:
                     
                 # Add the solution
                 self.db["solutions"].append(solution)
+                imported.append(solution)
                 
                 # Update tracking sets
                 if "id" in solution:
                     existing_ids.add(solution["id"])
                 existing_signatures.add(signature)
-                
-                imported_count += 1
             
-            # Save the updated database
-            self._save_db()
+            if imported:
+                self.solutions_version += 1
+                self._index_solutions(imported)
             
-            # Update vectors if we imported solutions
-            if imported_count > 0:
-                self._update_vectors()
+            # Save the updated database
+            self._save_db(added=imported)
                 
-            return imported_count
+            return len(imported)
         except Exception as e:
             print(f"Error importing knowledge base: {str(e)}")
             raise
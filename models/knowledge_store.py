@@ -0,0 +1,246 @@
+import os
+import json
+import time
+import sqlite3
+import weakref
+import threading
+from contextlib import contextmanager
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS solutions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    error_type TEXT,
+    technology TEXT,
+    signature TEXT,
+    source TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS solutions_error_type ON solutions (error_type);
+CREATE INDEX IF NOT EXISTS solutions_technology ON solutions (technology);
+CREATE INDEX IF NOT EXISTS solutions_signature ON solutions (signature);
+
+CREATE TABLE IF NOT EXISTS stats (
+    kind TEXT NOT NULL,
+    name TEXT NOT NULL,
+    count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (kind, name)
+);
+
+CREATE TABLE IF NOT EXISTS sources (
+    source TEXT PRIMARY KEY,
+    solutions INTEGER NOT NULL DEFAULT 0,
+    first_added REAL,
+    last_added REAL
+);
+
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+# Statistics kept per kind, as the keys of the in-memory database
+STAT_KINDS = ('error_types', 'technologies')
+
+# Every open store, so forked children can reopen their databases
+_stores = weakref.WeakSet()
+
+
+def _reopen_after_fork():
+    """Give every store a connection and lock of its own in a forked child."""
+    # SQLite connections must not be shared across processes, such as
+    # gunicorn workers forked from a preloaded app
+    for store in list(_stores):
+        store._lock = threading.Lock()
+        store._connection = store._connect()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reopen_after_fork)
+
+
+def solution_signature(solution):
+    """Error type and message of a solution, which identify duplicates."""
+    return f"{solution.get('error_type', '')}-{solution.get('error_message', '')}"
+
+
+class KnowledgeStore:
+    """
+    SQLite storage of the knowledge base.
+
+    Solutions are rows holding their JSON, with the error type, technology,
+    signature and source pulled out into indexed columns; statistics and the
+    sources of scraped knowledge have tables of their own. The database runs
+    in WAL mode and every write is one transaction, so a write costs what it
+    changes rather than the size of the knowledge base, and a crash leaves
+    the last committed state intact.
+
+    A knowledge_db.json file written by earlier versions is imported once,
+    when the database is created, and then renamed with a .migrated suffix.
+    """
+
+    def __init__(self, path, legacy_file=None):
+        """
+        Open the store, creating and migrating the database if needed.
+
+        Args:
+            path (str): Path of the SQLite database
+            legacy_file (str, optional): JSON knowledge base to import into a
+                new database
+        """
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # Requests are served by several threads; the lock serializes them
+        self._connection = self._connect()
+        self._lock = threading.Lock()
+        # Row id of every loaded or added solution, by the identity of its dict
+        self._row_ids = {}
+        _stores.add(self)
+
+        with self._lock:
+            self._connection.executescript(_SCHEMA)
+
+        if legacy_file and os.path.exists(legacy_file) and self._meta('migrated_from') is None:
+            self._migrate(legacy_file)
+
+    def load(self):
+        """
+        Read the whole knowledge base.
+
+        Returns:
+            dict: solutions (in the order they were added), error_types and
+                technologies counters, and last_updated, as the JSON file had them
+        """
+        db = {'solutions': [], 'last_updated': float(self._meta('last_updated') or time.time())}
+        for kind in STAT_KINDS:
+            db[kind] = {}
+
+        with self._lock:
+            for row_id, data in self._connection.execute('SELECT id, data FROM solutions ORDER BY id'):
+                solution = json.loads(data)
+                self._row_ids[id(solution)] = row_id
+                db['solutions'].append(solution)
+            for kind, name, count in self._connection.execute('SELECT kind, name, count FROM stats'):
+                db.setdefault(kind, {})[name] = count
+        return db
+
+    def save(self, added=(), updated=(), counts=()):
+        """
+        Write changes to the knowledge base in one transaction.
+
+        Args:
+            added (list): New solutions, in the order they were appended
+            updated (list): Solutions, previously added or loaded, that changed
+            counts (list): (kind, name, increment) statistics to add to
+
+        Returns:
+            float: Time of the update, as stored in last_updated
+        """
+        now = time.time()
+        with self._lock:
+            with self._transaction() as cursor:
+                for solution in added:
+                    self._insert(cursor, solution, now)
+                for solution in updated:
+                    row_id = self._row_ids.get(id(solution))
+                    if row_id is None:
+                        self._insert(cursor, solution, now)
+                    else:
+                        cursor.execute('UPDATE solutions SET error_type = ?, technology = ?, signature = ?, '
+                                       'source = ?, data = ? WHERE id = ?',
+                                       self._columns(solution) + (row_id,))
+                cursor.executemany('INSERT INTO stats (kind, name, count) VALUES (?, ?, ?) '
+                                   'ON CONFLICT (kind, name) DO UPDATE SET count = count + excluded.count',
+                                   [(kind, str(name), increment) for kind, name, increment in counts])
+                cursor.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('last_updated', ?)", (repr(now),))
+        return now
+
+    def close(self):
+        """Close the database."""
+        with self._lock:
+            self._connection.close()
+        _stores.discard(self)
+
+    def _connect(self):
+        """Open the database in WAL mode."""
+        connection = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        connection.execute('PRAGMA journal_mode=WAL')
+        # In WAL mode a crash can lose the last commits at worst, never corrupt the file
+        connection.execute('PRAGMA synchronous=NORMAL')
+        return connection
+
+    def _insert(self, cursor, solution, now):
+        """Insert a solution and count it for its source."""
+        columns = self._columns(solution)
+        cursor.execute('INSERT INTO solutions (error_type, technology, signature, source, data) '
+                       'VALUES (?, ?, ?, ?, ?)', columns)
+        self._row_ids[id(solution)] = cursor.lastrowid
+        source = columns[3]
+        if source:
+            cursor.execute('INSERT INTO sources (source, solutions, first_added, last_added) VALUES (?, 1, ?, ?) '
+                           'ON CONFLICT (source) DO UPDATE SET solutions = solutions + 1, '
+                           'last_added = excluded.last_added', (source, now, now))
+
+    def _columns(self, solution):
+        """Indexed columns and JSON of a solution."""
+        return (solution.get('error_type'), solution.get('technology'), solution_signature(solution),
+                solution.get('source') or None, json.dumps(solution))
+
+    @contextmanager
+    def _transaction(self):
+        """Cursor in a transaction that commits on success and rolls back on error."""
+        cursor = self._connection.cursor()
+        cursor.execute('BEGIN IMMEDIATE')
+        try:
+            yield cursor
+        except BaseException:
+            cursor.execute('ROLLBACK')
+            raise
+        else:
+            cursor.execute('COMMIT')
+        finally:
+            cursor.close()
+
+    def _meta(self, key):
+        """Value of a meta key, or None."""
+        with self._lock:
+            row = self._connection.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def _migrate(self, legacy_file):
+        """Import a JSON knowledge base into an empty database, once."""
+        try:
+            with open(legacy_file, 'r') as f:
+                legacy = json.load(f)
+            solutions = legacy.get('solutions', [])
+        except (OSError, ValueError, AttributeError) as e:
+            # The file is left as it is, so it can still be repaired by hand
+            print(f"Warning: Could not migrate knowledge DB from {legacy_file}: {e}")
+            return
+
+        with self._lock:
+            with self._transaction() as cursor:
+                (existing,) = cursor.execute('SELECT COUNT(*) FROM solutions').fetchone()
+                if existing == 0:
+                    now = float(legacy.get('last_updated') or time.time())
+                    for solution in solutions:
+                        if isinstance(solution, dict):
+                            self._insert(cursor, solution, now)
+                    cursor.executemany('INSERT INTO stats (kind, name, count) VALUES (?, ?, ?) '
+                                       'ON CONFLICT (kind, name) DO UPDATE SET count = count + excluded.count',
+                                       [(kind, str(name), count)
+                                        for kind in STAT_KINDS
+                                        for name, count in (legacy.get(kind) or {}).items()])
+                    cursor.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('last_updated', ?)",
+                                   (repr(now),))
+                cursor.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('migrated_from', ?)",
+                               (legacy_file,))
+        # Loaded solutions get their row ids again from load()
+        self._row_ids.clear()
+
+        try:
+            os.replace(legacy_file, legacy_file + '.migrated')
+        except OSError as e:
+            print(f"Warning: Could not rename migrated knowledge DB {legacy_file}: {e}")
+        print(f"Migrated {len(solutions)} solutions from {legacy_file} to {self.path}")
+
@@ -0,0 +1,112 @@
+import os
+import time
+import weakref
+import threading
+
+# Every stand-in, so their locks can be reset in forked children
+_components = weakref.WeakSet()
+
+
+def _reset_after_fork():
+    """Give every stand-in a fresh lock in a forked child."""
+    # A lock held by a build in the parent would never be released in the
+    # child; a build that had not finished simply runs again on first use
+    for component in list(_components):
+        component._lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+class LazyComponent:
+    """
+    Stands in for a component that is built the first time it is used.
+
+    Attribute access builds the component, once, and forwards to it, so code
+    can use the stand-in exactly like the component. Building is guarded by a
+    lock: concurrent first uses wait for a single build. A process forked
+    while a build runs, such as a gunicorn worker of a preloaded app, builds
+    the component again on its first use.
+    """
+
+    def __init__(self, factory, name=None):
+        """
+        Create a stand-in.
+
+        Args:
+            factory (callable): Builds the component, called without arguments
+            name (str, optional): Name used in reports, defaults to the factory's
+        """
+        self._factory = factory
+        self._name = name or getattr(factory, '__name__', 'component')
+        self._instance = None
+        self._lock = threading.Lock()
+        self._build_seconds = None
+        _components.add(self)
+
+    def resolve(self):
+        """
+        Build the component if needed.
+
+        Returns:
+            The component
+        """
+        instance = self._instance
+        if instance is None:
+            with self._lock:
+                if self._instance is None:
+                    started = time.perf_counter()
+                    self._instance = self._factory()
+                    self._build_seconds = time.perf_counter() - started
+                instance = self._instance
+        return instance
+
+    def status(self):
+        """
+        Report whether the component was built and how long that took.
+
+        Returns:
+            dict: name, initialized and build_seconds (None until built)
+        """
+        return {
+            'name': self._name,
+            'initialized': self._instance is not None,
+            'build_seconds': round(self._build_seconds, 4) if self._build_seconds is not None else None
+        }
+
+    def __getattr__(self, name):
+        return getattr(self.resolve(), name)
+
+    def __repr__(self):
+        state = 'built' if self._instance is not None else 'not built yet'
+        return f'<LazyComponent {self._name} ({state})>'
+
+
+def warm_up(components, background=True):
+    """
+    Build lazy components ahead of their first use.
+
+    Args:
+        components (list): LazyComponent instances
+        background (bool): Build them in a daemon thread and return at once
+
+    Returns:
+        threading.Thread: The warm-up thread, or None when built in the foreground
+    """
+    def build():
+        for component in components:
+            try:
+                component.resolve()
+            except Exception as e:
+                # The first real use will build it again and report the error
+                print(f"Warning: Could not initialize {component.status()['name']}: {e}")
+
+    if not background:
+        build()
+        return None
+
+    thread = threading.Thread(target=build, name='component-warm-up')
+    thread.daemon = True
+    thread.start()
+    return thread
@@ -1,35 +1,156 @@
 import re
-import nltk
-from nltk.tokenize import word_tokenize
-from nltk.corpus import stopwords
 import os
+import io
 import json
+import itertools
 from collections import Counter
 import time
+import hashlib
+from .log_scanner import LogScanner, CODE_BLOCK_REGEX, FILE_REFERENCE_REGEX, DEFAULT_CONTEXT_LIMIT
+from .finding_store import DEFAULT_SAMPLE_LIMIT, DEFAULT_EDGE_LIMIT
+from .parallel_scan import scan_file_parallel, DEFAULT_CHUNK_BYTES
+from .mmap_scan import MappedLogScanner
+from .checkpoint import AnalyzerCheckpoint, fingerprint, FINGERPRINT_BYTES
+from .chunk_scan import ChunkedLogScanner
+from .pattern_engine import GuardedRegex, MatchTimeout, check_patterns
+from .log_source import open_log, open_rotated, file_compression
+from .log_formats import detect_format, DETECT_SAMPLE_LINES, LOG_FORMATS
+from .analysis_timings import timed_stage
+
+# Bytes read from the start of a file to recognize its format
+FORMAT_SAMPLE_BYTES = 64 * 1024
 
 class LogAnalyzer:
     """
     Analyzes log files to identify errors, their context, and potential solutions.
-    Uses NLP and pattern matching to extract meaningful information from logs.
+    Uses pattern matching to extract meaningful information from logs. Building
+    an analyzer only reads local files; it never touches the network.
     """
     
-    def __init__(self):
-        """Initialize the log analyzer with necessary resources."""
-        # Download NLTK resources if not already present
-        try:
-            nltk.data.find('tokenizers/punkt')
-            nltk.data.find('corpora/stopwords')
-        except LookupError:
-            nltk.download('punkt')
-            nltk.download('stopwords')
+    def __init__(self, context_limit=DEFAULT_CONTEXT_LIMIT, chunk_cache=None,
+                 sample_limit=DEFAULT_SAMPLE_LIMIT, edge_limit=DEFAULT_EDGE_LIMIT):
+        """
+        Initialize the log analyzer with necessary resources.
         
+        Args:
+            context_limit (int, optional): Number of errors, highest severity
+                first, that carry a context window in all_errors; None keeps
+                a window for every error
+            chunk_cache (ResultCache, optional): Cache of the scans of log
+                chunks, so analyze() only scans the chunks of a log it has not
+                seen before; without it every log is scanned in full
+            sample_limit (int, optional): Output budget of all_errors and
+                performance_issues: distinct lines sampled by severity, besides
+                the first and last findings of each type; None returns every
+                finding and every stack trace
+            edge_limit (int): Findings of each type, and stack traces, returned
+                from the start and from the end of the log
+        """
         # Load error patterns
-        self.error_patterns = self._load_error_patterns()
-        self.stop_words = set(stopwords.words('english'))
+        self.patterns_file = os.path.join(os.path.dirname(__file__), 'error_patterns.json')
+        self.error_patterns = self._checked_patterns(self._load_error_patterns())
+        self.patterns_stamp = self._patterns_stamp()
+        self.chunk_cache = chunk_cache
+        
+        self._compile_patterns(context_limit, sample_limit, edge_limit)
+        
+    def _compile_patterns(self, context_limit, sample_limit, edge_limit):
+        """Compile the scanners for the current error patterns."""
+        # Compile the single-pass scanner once for all analyses
+        self.scanner = LogScanner(self.error_patterns, context_limit, sample_limit, edge_limit)
+        
+        # Byte-level twin of the scanner for memory-mapped files, when the
+        # patterns can be matched against bytes
+        try:
+            self.mapped_scanner = MappedLogScanner(self.scanner)
+        except ValueError as e:
+            print(f"Memory-mapped analysis disabled: {e}")
+            self.mapped_scanner = None
+        
+        # Regexes matched against every line (error and performance patterns,
+        # and the timestamp), as counted in analysis timings
+        self.line_pattern_count = (len(self.scanner.error_matcher.patterns) +
+                                   len(self.scanner.performance_matcher.patterns) + 1)
+        
+        # Identifies the pattern set, for caches of analysis results
+        self.patterns_version = self._settings_digest()
+        
+        # Whole-content matches run in a killable worker with a time budget
+        self.guarded_patterns = {name: GuardedRegex(pattern, re.IGNORECASE, stats=self.scanner.pattern_stats, index=i)
+                                 for i, (name, pattern) in enumerate(self.error_patterns.items())}
+        
+        # Reuses the scans of log chunks seen before, when a cache was given
+        if self.chunk_cache is not None:
+            self.chunked_scanner = ChunkedLogScanner(self.scanner, self.chunk_cache, self.patterns_version)
+        else:
+            self.chunked_scanner = None
+    
+    def reload_patterns(self):
+        """
+        Reload error_patterns.json if it changed on disk since it was loaded.
+        
+        A file that cannot be parsed or compiled is reported and the current
+        patterns are kept.
+        
+        Returns:
+            bool: True if new patterns were loaded
+        """
+        stamp = self._patterns_stamp()
+        if stamp == self.patterns_stamp:
+            return False
+        
+        try:
+            error_patterns = self._checked_patterns(self._load_error_patterns())
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"Warning: Could not reload error patterns from {self.patterns_file}: {e}")
+            return False
+        
+        self.patterns_stamp = self._patterns_stamp()
+        if error_patterns == self.error_patterns:
+            return False
+        
+        previous = self.error_patterns
+        self.error_patterns = error_patterns
+        try:
+            self._compile_patterns(self.scanner.context_limit, self.scanner.sample_limit, self.scanner.edge_limit)
+        except re.error as e:
+            print(f"Warning: Invalid error patterns in {self.patterns_file}, keeping the previous ones: {e}")
+            self.error_patterns = previous
+            return False
+        return True
+    
+    def _checked_patterns(self, error_patterns):
+        """Drop error patterns that are invalid or risk catastrophic backtracking, with a warning."""
+        accepted, self.rejected_patterns = check_patterns(error_patterns)
+        for name, reasons in self.rejected_patterns.items():
+            print(f"Warning: Skipping error pattern '{name}': {'; '.join(reasons)}")
+        return accepted
+    
+    def pattern_stats(self):
+        """
+        Report how often each error pattern matched and how much time it cost.
         
+        Returns:
+            dict: 'patterns', the counters of every pattern in use, most
+                expensive first, and 'rejected', the reasons each rejected
+                pattern was skipped
+        """
+        return {
+            'patterns': self.scanner.pattern_stats.summary(),
+            'rejected': self.rejected_patterns
+        }
+    
+    def _patterns_stamp(self):
+        """Modification time and size of the patterns file, None if it is missing."""
+        try:
+            stat = os.stat(self.patterns_file)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+    
     def _load_error_patterns(self):
         """Load known error patterns from a JSON file."""
-        patterns_file = os.path.join(os.path.dirname(__file__), 'error_patterns.json')
+        patterns_file = self.patterns_file
         
         # Create default patterns if file doesn't exist
         if not os.path.exists(patterns_file):
@@ -52,64 +173,354 @@ class LogAnalyzer:
         with open(patterns_file, 'r') as f:
             return json.load(f)
     
-    def analyze(self, log_content):
+    def analyze(self, log_content, timings=None):
         """
         Analyze the log content to identify errors and their context.
         Performs deep analysis on the entire log to extract multiple errors and metrics.
+        Structured logs (JSON lines, logfmt, log4j, syslog, nginx) are recognized
+        from their first lines, and their fields are read directly. Each
+        multiline stack trace is reported once, in 'exceptions'. Every finding
+        is counted, but all_errors, performance_issues and exceptions only list
+        the ones within the output budget; 'sampling' tells how many were dropped.
+        Durations and sizes named in the lines are summarized as percentiles in
+        'latency' and 'sizes', overall and per endpoint or logger.
         
         Args:
             log_content (str): The content of the log to analyze
+            timings (AnalysisTimings, optional): Records the time and work of
+                each stage of the analysis
             
         Returns:
             dict: Comprehensive analysis results with multiple errors and metrics
         """
         if not log_content:
-            return {
-                'error_type': 'unknown',
-                'error_message': 'No log content provided',
-                'severity': 'low',
-                'context': [],
-                'metrics': {
-                    'total_lines': 0,
-                    'error_count': 0,
-                    'warning_count': 0,
-                    'info_count': 0
-                },
-                'all_errors': []
-            }
+            return self._empty_result()
             
-        # Tokenize the log
-        lines = log_content.split('\n')
-        
-        # Calculate basic metrics
-        metrics = self._calculate_metrics(lines)
-        
-        # Identify the technology/framework
-        technology = self._identify_technology(log_content)
+        content_bytes = _utf8_length(log_content) if timings is not None else None
+        
+        # Tokenize the log once and collect every per-line section in a single pass
+        with timed_stage(timings, 'split', bytes_scanned=content_bytes) as stage:
+            lines = log_content.split('\n')
+            stage['lines'] = len(lines)
+        
+        with timed_stage(timings, 'detect_format') as stage:
+            sample = lines[:DETECT_SAMPLE_LINES]
+            log_format = detect_format(sample)
+            stage['lines'] = len(sample)
+            stage['regex_calls'] = len(sample) * len(LOG_FORMATS)
+        
+        # Technology detection, error and performance extraction, timestamps
+        # and stack traces all come from this one pass
+        with timed_stage(timings, 'scan') as stage:
+            if self.chunked_scanner is not None:
+                scan = self.chunked_scanner.scan(log_content, lines, log_format, stats=stage)
+            else:
+                scan = self.scanner.scan(lines, log_format=log_format)
+                stage.update(lines=len(lines), bytes=content_bytes)
+            stage['regex_calls'] = stage['lines'] * self.line_pattern_count
         
-        # Extract all errors from the log (not just the primary one)
-        all_errors = self._extract_all_errors(lines)
+        with timed_stage(timings, 'summarize'):
+            scan = self.scanner.summarize(scan)
         
         # Extract error information for primary error
-        error_type, error_message = self._extract_error(log_content)
+        if scan['primary_line'] >= 0:
+            error_type = scan['primary_error_type']
+            error_message = lines[scan['primary_line']].strip()
+        else:
+            error_type, error_message = 'unknown', 'No specific error pattern detected'
         
         # Get context around the error
-        context = self._extract_context(log_content, error_message)
-        
-        # Determine severity
-        severity = self._determine_severity(error_type, error_message, context)
+        with timed_stage(timings, 'context'):
+            context = self._extract_context(log_content, error_message, lines)
         
         # Extract relevant code snippets if present
-        code_snippets = self._extract_code_snippets(log_content)
+        with timed_stage(timings, 'code_snippets', bytes_scanned=content_bytes, regex_calls=2):
+            code_snippets = self._extract_code_snippets(log_content)
         
-        # Identify performance issues
-        performance_issues = self._identify_performance_issues(lines)
+        return self._build_result(scan, error_type, error_message, context, code_snippets, timings)
+    
+    def analyze_stream(self, source, timings=None, max_bytes=None):
+        """
+        Analyze a log one line at a time without holding it in memory.
         
-        # Generate markdown summary
-        summary = self._generate_summary(error_type, error_message, metrics, all_errors, technology)
+        Accepts anything that yields lines: a list, a generator, a file opened in
+        text or binary mode, or an HTTP response line iterator. Bytes are decoded
+        as UTF-8. Binary files and bytes compressed with gzip, bzip2, xz or zstd
+        are decompressed as they are read. Memory use depends on the number of
+        findings, not on the size of the log. Code blocks and file references are
+        matched line by line, and the primary error context is the window around
+        the primary error line.
+        
+        Args:
+            source (iterable): Log lines, or a str/bytes holding the whole log
+            timings (AnalysisTimings, optional): Records the time and work of
+                each stage of the analysis
+            max_bytes (int, optional): Most bytes of decompressed log read from
+                bytes or a binary file
+            
+        Returns:
+            dict: Analysis results with the same schema as analyze()
+        
+        Raises:
+            ValueError: If compressed data is truncated or corrupt (CorruptLog),
+                or zstd-compressed while the zstandard package is not installed,
+                or if the log is longer than max_bytes (LogTooLarge)
+        """
+        if isinstance(source, str):
+            source = io.StringIO(source)
+        elif isinstance(source, (bytes, bytearray)):
+            source = open_log(io.BytesIO(source), max_bytes=max_bytes)
+        elif hasattr(source, 'read') and not isinstance(source, io.TextIOBase):
+            source = open_log(source, max_bytes=max_bytes)
+        
+        lines = self._iter_stream_lines(source)
+        with timed_stage(timings, 'detect_format') as stage:
+            sample = list(itertools.islice(lines, DETECT_SAMPLE_LINES))
+            if not sample:
+                return self._empty_result()
+            log_format = detect_format(sample)
+            stage.update(lines=len(sample), regex_calls=len(sample) * len(LOG_FORMATS))
+        
+        # Reading and decoding the stream happen as the scan consumes it
+        with timed_stage(timings, 'scan') as stage:
+            scan = self.scanner.scan(itertools.chain(sample, lines), collect_snippets=True, log_format=log_format)
+            total_lines = scan['counts']['total_lines']
+            stage.update(lines=total_lines, regex_calls=total_lines * self.line_pattern_count)
+        
+        # An empty log is a single empty line, same as analyze('')
+        if total_lines == 1 and not sample[0]:
+            return self._empty_result()
+        
+        with timed_stage(timings, 'summarize'):
+            scan = self.scanner.summarize(scan)
+        return self._build_stream_result(scan, timings)
+    
+    def analyze_parallel(self, path, workers=None, chunk_bytes=DEFAULT_CHUNK_BYTES):
+        """
+        Analyze a large log file using several processes.
+        
+        The file is split into line-aligned byte ranges that are scanned in a
+        process pool, and the partial scans are merged back in file order.
+        Small files that fit in a single range, and compressed files, which
+        cannot be split, are analyzed in-process. Code blocks that straddle two
+        ranges are not reported.
+        
+        Args:
+            path (str): Path to the log file
+            workers (int, optional): Number of worker processes, defaults to the CPU count
+            chunk_bytes (int): Approximate size of each byte range
+            
+        Returns:
+            dict: Analysis results with the same schema as analyze_stream()
+        """
+        if workers == 1 or os.path.getsize(path) <= chunk_bytes or file_compression(path):
+            with open_log(path) as f:
+                return self.analyze_stream(f)
+        
+        partials = scan_file_parallel(path, self.error_patterns, self.scanner.context_limit,
+                                      workers, chunk_bytes, self._file_format(path),
+                                      self.scanner.sample_limit, self.scanner.edge_limit)
+        scan = self.scanner.merge(partials)
+        
+        return self._build_stream_result(self.scanner.summarize(scan))
+    
+    def analyze_file(self, path):
+        """
+        Analyze a log file on disk through a memory map.
+        
+        The file is never read into a Python string: byte-level regexes run over
+        the mapping and only the lines that end up in the result are decoded.
+        Falls back to analyze_stream() when the error patterns cannot be matched
+        against bytes, for compressed files, which are decompressed as they are
+        read, and for structured logs, whose fields are parsed line by line.
+        
+        Args:
+            path (str): Path to the log file
+            
+        Returns:
+            dict: Analysis results with the same schema as analyze()
+        """
+        if self.mapped_scanner is None or file_compression(path) or self._file_format(path):
+            with open_log(path) as f:
+                return self.analyze_stream(f)
+        
+        scan = self.mapped_scanner.scan(path)
+        if scan is None:
+            return self._empty_result()
+        
+        return self._build_stream_result(self.scanner.summarize(scan))
+    
+    def analyze_rotated(self, path):
+        """
+        Analyze a log together with its rotated files, as one log.
+        
+        The rotated files (``app.log.2.gz``, ``app.log.1``, ...) are read oldest
+        first, each decompressed as it is read, followed by the current log, so
+        the result covers the whole history still on disk with line numbers
+        counted across it.
+        
+        Args:
+            path (str): Path to the current log
+            
+        Returns:
+            dict: Analysis results with the same schema as analyze_stream()
+            
+        Raises:
+            FileNotFoundError: If neither the log nor any rotated file of it exists
+        """
+        with open_rotated(path) as f:
+            return self.analyze_stream(f)
+    
+    def analyze_incremental(self, path, checkpoint=None):
+        """
+        Analyze only what was appended to a log since the last call.
+        
+        The checkpoint returned by one call is passed to the next, which reads
+        from the saved byte offset and folds the new lines into the saved scan,
+        so the cost of a poll follows the size of the new data. Only complete
+        lines are analyzed; a last line still being written is picked up once
+        its newline arrives. Code blocks that straddle two calls are not
+        reported. If the log was truncated or replaced (rotation), or the
+        analyzer settings changed, the analysis starts over from byte zero.
+        Compressed logs are not appended to and cannot be tailed.
+        
+        Args:
+            path (str): Path to the log file
+            checkpoint (AnalyzerCheckpoint or bytes, optional): Checkpoint from the
+                previous call, or its to_bytes() serialization
+            
+        Returns:
+            tuple: (analysis results with the same schema as analyze_stream(),
+                AnalyzerCheckpoint to pass to the next call)
+            
+        Raises:
+            ValueError: If the log is compressed
+        """
+        if file_compression(path):
+            raise ValueError(f"Cannot tail compressed log {path}; use analyze_file() or analyze_rotated()")
+        if isinstance(checkpoint, (bytes, bytearray)):
+            checkpoint = AnalyzerCheckpoint.from_bytes(bytes(checkpoint))
+        config = self._settings_digest()
+        
+        with open(path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if checkpoint is None or not checkpoint.matches(f, size, config):
+                checkpoint = AnalyzerCheckpoint(config)
+            
+            f.seek(checkpoint.offset)
+            consumed = [0]
+            lines = self._iter_complete_lines(f, consumed)
+            sample = list(itertools.islice(lines, DETECT_SAMPLE_LINES))
+            if sample:
+                # The format is recognized from the first lines of the log, once
+                if checkpoint.scan is None:
+                    log_format = detect_format(sample)
+                else:
+                    log_format = checkpoint.scan['log_format']
+                if checkpoint.scan is None:
+                    checkpoint.scan = self.scanner.empty_scan()
+                # A stack trace still being written at the last call goes on
+                partial = self.scanner.scan(itertools.chain(sample, lines), collect_snippets=True,
+                                            log_format=log_format,
+                                            trace_state=self.scanner.next_trace_state(checkpoint.scan))
+                self.scanner.append(checkpoint.scan, partial)
+                
+                if checkpoint.offset < FINGERPRINT_BYTES:
+                    checkpoint.head_digest = fingerprint(f, min(checkpoint.offset + consumed[0], FINGERPRINT_BYTES))
+                checkpoint.offset += consumed[0]
+        
+        if checkpoint.scan is None:
+            return self._empty_result(), checkpoint
+        
+        return self._build_stream_result(self.scanner.summarize(dict(checkpoint.scan))), checkpoint
+    
+    def _file_format(self, path):
+        """Recognize the format of a log file from its first lines."""
+        with open(path, 'rb') as f:
+            lines = f.read(FORMAT_SAMPLE_BYTES).decode('utf-8', errors='replace').split('\n')
+        # The last line may be cut short, unless it is the only one
+        return detect_format(lines[:-1] or lines)
+    
+    def _settings_digest(self):
+        """Digest of the settings a checkpoint's scan depends on."""
+        settings = json.dumps([self.error_patterns, self.scanner.context_limit,
+                               self.scanner.sample_limit, self.scanner.edge_limit], sort_keys=True)
+        return hashlib.blake2b(settings.encode('utf-8'), digest_size=16).hexdigest()
+    
+    def _iter_complete_lines(self, f, consumed):
+        """Yield the newline-terminated lines of a binary file, adding their size to consumed[0]."""
+        for raw in f:
+            if not raw.endswith(b'\n'):
+                return
+            consumed[0] += len(raw)
+            yield raw[:-1].decode('utf-8', errors='replace')
+    
+    def _build_stream_result(self, scan, timings=None):
+        """Build the result for a scan that never had the whole content at hand."""
+        if scan['primary_line'] >= 0:
+            error_type = scan['primary_error_type']
+            error_message = scan['primary_text'].strip()
+            context = scan['primary_context']
+        else:
+            error_type, error_message = 'unknown', 'No specific error pattern detected'
+            context = scan['head']
+        
+        return self._build_result(scan, error_type, error_message, context, scan['code_snippets'], timings)
+    
+    def _iter_stream_lines(self, source):
+        """Yield lines from a stream the way str.split('\\n') would split the whole log."""
+        ends_with_newline = False
+        for line in source:
+            if isinstance(line, (bytes, bytearray)):
+                line = line.decode('utf-8', errors='replace')
+            ends_with_newline = line.endswith('\n')
+            yield line[:-1] if ends_with_newline else line
+        
+        # A trailing newline leaves one empty line after it
+        if ends_with_newline:
+            yield ''
+    
+    def _empty_result(self):
+        """Result returned when there is no log content to analyze."""
+        return {
+            'error_type': 'unknown',
+            'error_message': 'No log content provided',
+            'severity': 'low',
+            'context': [],
+            'metrics': {
+                'total_lines': 0,
+                'error_count': 0,
+                'warning_count': 0,
+                'info_count': 0
+            },
+            'all_errors': []
+        }
+    
+    def _build_result(self, scan, error_type, error_message, context, code_snippets, timings=None):
+        """Combine the scan sections and the primary error into the analysis result."""
+        metrics = scan['metrics']
+        technology = scan['technology']
+        with timed_stage(timings, 'entries'):
+            all_errors = self.scanner.error_entries(scan['all_errors'])
+            exceptions = self.scanner.exception_entries(scan)
+            primary_exception = self._primary_exception(exceptions, scan['primary_line'] + 1)
+            performance_issues = self.scanner.performance_entries(scan['performance_issues'])
+            error_clusters = scan['error_clusters'].summary()
+            sampling = self.scanner.sampling(scan, code_snippets)
+            latency = scan['durations'].summary('ms')
+            sizes = scan['sizes'].summary('bytes')
+        
+        with timed_stage(timings, 'summary'):
+            # Determine severity
+            severity = self._determine_severity(error_type, error_message, context)
+            
+            # Generate markdown summary
+            summary = self._generate_summary(error_type, error_message, metrics, all_errors, technology, exceptions,
+                                             sampling['exceptions']['total'], latency)
         
         # Identify potential root causes
-        root_causes = self._identify_root_causes(error_type, error_message, context, technology)
+        with timed_stage(timings, 'root_causes'):
+            root_causes = self._identify_root_causes(error_type, error_message, context, technology)
         
         return {
             'technology': technology,
@@ -117,57 +528,38 @@ class LogAnalyzer:
             'error_message': error_message,
             'context': context,
             'severity': severity,
-            'code_snippets': code_snippets,
+            'code_snippets': {
+                'blocks': code_snippets['blocks'],
+                'file_references': code_snippets['file_references']
+            },
             'root_causes': root_causes,
             'metrics': metrics,
             'all_errors': all_errors,
+            'error_clusters': error_clusters,
+            'exceptions': exceptions,
+            'primary_exception': primary_exception,
             'performance_issues': performance_issues,
+            'latency': latency,
+            'sizes': sizes,
+            'sampling': sampling,
             'summary': summary
         }
     
-    def _identify_technology(self, log_content):
-        """Identify the technology or framework from the log content."""
-        tech_indicators = {
-            'java': ['java.', 'springframework', 'jakarta', 'javax.'],
-            'python': ['traceback', 'File "', 'ImportError', 'ModuleNotFoundError'],
-            'javascript': ['TypeError', 'ReferenceError', 'node_modules', 'npm', 'yarn'],
-            'docker': ['docker', 'container', 'image', 'Dockerfile'],
-            'kubernetes': ['kubectl', 'pod', 'deployment', 'k8s', 'namespace'],
-            'database': ['SQL', 'query', 'database', 'mysql', 'postgres', 'mongodb'],
-            'web': ['http', 'https', 'status code', 'request', 'response']
-        }
-        
-        tech_counts = {tech: 0 for tech in tech_indicators}
-        
-        for tech, indicators in tech_indicators.items():
-            for indicator in indicators:
-                if re.search(r'\b' + re.escape(indicator) + r'\b', log_content, re.IGNORECASE):
-                    tech_counts[tech] += 1
-        
-        # Get the technology with the highest count
-        if any(tech_counts.values()):
-            return max(tech_counts.items(), key=lambda x: x[1])[0]
-        
-        return 'unknown'
-    
-    def _extract_error(self, log_content):
-        """Extract the error type and message from the log content."""
-        for error_type, pattern in self.error_patterns.items():
-            match = re.search(pattern, log_content)
-            if match:
-                # Try to extract the full error message
-                line_with_error = next((line for line in log_content.split('\n') 
-                                       if re.search(pattern, line)), '')
-                
-                return error_type, line_with_error.strip()
-        
-        return 'unknown', 'No specific error pattern detected'
+    def _primary_exception(self, exceptions, line_number):
+        """The stack trace the primary error line belongs to, else the first one, or None."""
+        for exception in exceptions:
+            if exception['line_number'] <= line_number <= exception['end_line']:
+                return exception
+        return exceptions[0] if exceptions else None
     
-    def _extract_context(self, log_content, error_message):
+    def _extract_context(self, log_content, error_message, lines=None):
         """Extract the context around the error message."""
         if not error_message or not log_content:
             return []
             
+        if lines is None:
+            lines = log_content.split('\n')
+            
         if error_message not in log_content:
             # Try to find a partial match
             error_words = error_message.split()
@@ -178,22 +570,18 @@ class LogAnalyzer:
                     error_message = partial_error
                 else:
                     # Return the first few lines as context if no match
-                    lines = log_content.split('\n')
                     return lines[:min(10, len(lines))]
         
-        lines = log_content.split('\n')
-        
-        # Find the line with the error message
-        error_line_idx = -1
-        for i, line in enumerate(lines):
-            if error_message in line:
-                error_line_idx = i
-                break
+        # Find the line with the error message; the first occurrence in the
+        # content is always on the first line that contains it
+        position = log_content.find(error_message) if '\n' not in error_message else -1
         
-        if error_line_idx == -1:
+        if position == -1:
             # Return the first few lines as context if no match
             return lines[:min(10, len(lines))]
         
+        error_line_idx = log_content.count('\n', 0, position)
+        
         # Get context (5 lines before and after the error)
         start_idx = max(0, error_line_idx - 5)
         end_idx = min(len(lines), error_line_idx + 6)
@@ -224,173 +612,14 @@ class LogAnalyzer:
     
     def _extract_code_snippets(self, log_content):
         """Extract code snippets from the log content."""
-        # Look for code blocks that might be in the log
-        code_blocks = re.findall(r'```(?:\w+)?\n(.*?)\n```', log_content, re.DOTALL)
-        
-        # Look for file paths with line numbers (common in stack traces)
-        file_lines = re.findall(r'(?:at |File ")([^"]+):(\d+)', log_content)
-        
-        return {
-            'blocks': code_blocks,
-            'file_references': file_lines
-        }
+        # Look for code blocks that might be in the log, and for file paths with
+        # line numbers (common in stack traces), within the output budget
+        return self.scanner.code_snippets(
+            (match.group(1) for match in CODE_BLOCK_REGEX.finditer(log_content)),
+            (match.groups() for match in FILE_REFERENCE_REGEX.finditer(log_content)))
     
-    def _calculate_metrics(self, lines):
-        """Calculate metrics from log lines for KPI reporting."""
-        total_lines = len(lines)
-        error_count = 0
-        warning_count = 0
-        info_count = 0
-        debug_count = 0
-        exception_count = 0
-        
-        # Count by log level
-        for line in lines:
-            line_lower = line.lower()
-            if 'error' in line_lower or 'exception' in line_lower or 'fail' in line_lower:
-                error_count += 1
-            elif 'warn' in line_lower:
-                warning_count += 1
-            elif 'info' in line_lower:
-                info_count += 1
-            elif 'debug' in line_lower:
-                debug_count += 1
-                
-            # Count exceptions specifically
-            if 'exception' in line_lower or 'traceback' in line_lower:
-                exception_count += 1
-        
-        # Calculate time metrics if timestamps are present
-        time_metrics = self._extract_time_metrics(lines)
-        
-        return {
-            'total_lines': total_lines,
-            'error_count': error_count,
-            'warning_count': warning_count,
-            'info_count': info_count,
-            'debug_count': debug_count,
-            'exception_count': exception_count,
-            'error_ratio': error_count / total_lines if total_lines > 0 else 0,
-            'time_metrics': time_metrics
-        }
-        
-    def _extract_time_metrics(self, lines):
-        """Extract time-related metrics from the log if timestamps are present."""
-        # Try to find timestamps in common formats
-        timestamp_pattern = r'(\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}:\d{2}(?:\.\d+)?(?:[-+]\d{2}:?\d{2})?)'
-        timestamps = []
-        
-        for line in lines:
-            match = re.search(timestamp_pattern, line)
-            if match:
-                try:
-                    # Try to parse the timestamp
-                    ts = match.group(1)
-                    timestamps.append(ts)
-                except:
-                    pass
-        
-        if len(timestamps) >= 2:
-            # Convert to datetime objects with various formats
-            try:
-                # Try ISO format first
-                start_time = timestamps[0]
-                end_time = timestamps[-1]
-                
-                # Return timestamp strings since full parsing is complex
-                return {
-                    'first_timestamp': start_time,
-                    'last_timestamp': end_time,
-                    'timestamp_count': len(timestamps)
-                }
-            except:
-                pass
-                
-        return {
-            'timestamp_count': len(timestamps)
-        }
-        
-    def _extract_all_errors(self, lines):
-        """Extract all errors from the log, not just the primary one."""
-        errors = []
-        
-        # Process each line
-        for i, line in enumerate(lines):
-            # Skip if line is too short
-            if len(line.strip()) < 5:
-                continue
-                
-            # Check for error indicators
-            for error_type, pattern in self.error_patterns.items():
-                if re.search(pattern, line):
-                    # Extract context lines (up to 5 before and after)
-                    context_start = max(0, i - 5)
-                    context_end = min(len(lines), i + 6)
-                    context = lines[context_start:context_end]
-                    
-                    errors.append({
-                        'error_type': error_type,
-                        'error_message': line,
-                        'line_number': i + 1,
-                        'context': context,
-                        'severity': self._quick_severity_check(line)
-                    })
-                    break  # Found an error pattern, move to next line
-        
-        return errors
-        
-    def _quick_severity_check(self, line):
-        """Quickly determine severity based on keywords in the line."""
-        line_lower = line.lower()
-        
-        if 'critical' in line_lower or 'fatal' in line_lower:
-            return 'critical'
-        elif 'error' in line_lower or 'exception' in line_lower or 'fail' in line_lower:
-            return 'high'
-        elif 'warn' in line_lower:
-            return 'medium'
-        else:
-            return 'low'
-            
-    def _identify_performance_issues(self, lines):
-        """Identify performance-related issues in the log."""
-        issues = []
-        
-        # Look for timeout indications
-        timeout_pattern = r'(?i)timeout|timed? out|too (?:much|long)|(?:high|excessive) (?:cpu|memory|load)'
-        
-        # Look for memory issues
-        memory_pattern = r'(?i)memory|heap|out of|allocation|garbage collection'
-        
-        # Look for slow execution
-        slow_pattern = r'(?i)slow|delay|latency|performance|bottleneck'
-        
-        for i, line in enumerate(lines):
-            if re.search(timeout_pattern, line):
-                issues.append({
-                    'type': 'timeout',
-                    'description': 'Possible timeout detected',
-                    'line': line,
-                    'line_number': i + 1
-                })
-            elif re.search(memory_pattern, line):
-                issues.append({
-                    'type': 'memory',
-                    'description': 'Possible memory issue detected',
-                    'line': line,
-                    'line_number': i + 1
-                })
-            elif re.search(slow_pattern, line):
-                issues.append({
-                    'type': 'performance',
-                    'description': 'Possible performance issue detected',
-                    'line': line,
-                    'line_number': i + 1
-                })
-                
-        return issues
-        
-    def _generate_summary(self, error_type, error_message, metrics, all_errors, technology):
+    def _generate_summary(self, error_type, error_message, metrics, all_errors, technology, exceptions=(),
+                          exception_total=None, latency=None):
         """Generate a markdown summary of the analysis."""
         summary_lines = []
         
@@ -407,9 +636,18 @@ class LogAnalyzer:
             summary_lines.append("No errors detected in the log.")
             
         # Add time span if available
-        if 'time_metrics' in metrics and 'first_timestamp' in metrics['time_metrics']:
-            summary_lines.append(f"\nLog spans from **{metrics['time_metrics']['first_timestamp']}** to **{metrics['time_metrics']['last_timestamp']}**")
-            
+        time_metrics = metrics.get('time_metrics', {})
+        if 'start' in time_metrics:
+            summary_lines.append(f"\nLog spans from **{time_metrics['start']}** to **{time_metrics['end']}**")
+        elif 'first_timestamp' in time_metrics:
+            summary_lines.append(f"\nLog spans from **{time_metrics['first_timestamp']}** to **{time_metrics['last_timestamp']}**")
+
+        # Add error bursts if any
+        bursts = time_metrics.get('bursts')
+        if bursts:
+            largest = max(bursts, key=lambda burst: burst['errors'])
+            summary_lines.append(f"\nFound **{len(bursts)}** error burst{'s' if len(bursts) > 1 else ''}; the largest has **{largest['errors']}** errors between {largest['start']} and {largest['end']}")
+
         # Add technology
         if technology:
             summary_lines.append(f"\nDetected technology: **{technology}**")
@@ -419,6 +657,30 @@ class LogAnalyzer:
             summary_lines.append("\n### Primary Error")
             summary_lines.append(f"- **Type:** {error_type}")
             summary_lines.append(f"- **Message:** {error_message}")
+        
+        # Add stack traces, each counted once however many lines it spans
+        if exceptions:
+            if exception_total is None:
+                exception_total = len(exceptions)
+            summary_lines.append(f"\nFound **{exception_total}** stack trace{'s' if exception_total > 1 else ''}")
+            for exception in exceptions[:3]:
+                name = exception['exception'] or 'Unknown exception'
+                line = f"- Line {exception['line_number']}: **{name}**"
+                if exception['message']:
+                    line += f": {exception['message']}"
+                if exception['root_cause'] and exception['root_cause']['exception']:
+                    line += f" (root cause: **{exception['root_cause']['exception']}**)"
+                summary_lines.append(line)
+            
+        # Add latency percentiles and the slowest endpoint or logger
+        if latency and latency['overall']['count']:
+            overall = latency['overall']
+            summary_lines.append(f"\nLatency over **{overall['count']}** timed lines: p50 **{overall['p50']}ms**, "
+                                 f"p95 **{overall['p95']}ms**, p99 **{overall['p99']}ms**, max **{overall['max']}ms**")
+            if latency['by_key']:
+                slowest = latency['by_key'][0]
+                summary_lines.append(f"- Slowest: **{slowest['key']}** with p99 **{slowest['p99']}ms** "
+                                     f"over {slowest['count']} lines")
             
         # Add metrics summary
         summary_lines.append("\n### Log Metrics")
@@ -490,61 +752,43 @@ class LogAnalyzer:
         return root_causes[:5]  # Limit to top 5 most likely causes
     
     def _match_patterns(self, log_content):
-        """Match error patterns in the log content."""
-        # Add a timeout for regex matching to prevent catastrophic backtracking
-        import time
+        """
+        Match every error pattern against the whole log content.
         
+        Each search runs in the pattern engine's worker process, so a pattern
+        that backtracks for longer than its time budget is cut off and skipped
+        instead of hanging the analysis.
+        """
         results = []
-        for pattern in self.error_patterns:
-            pattern_regex = pattern
-            if not pattern_regex:
-                continue
-                
-            # Add a timeout for regex matching
-            start_time = time.time()
+        for name, regex in self.guarded_patterns.items():
             try:
-                # Add a simple timeout mechanism
-                match = None
-                
-                # Use a simplified matching to prevent regex catastrophic backtracking
-                # First try a simple contains check before regex
-                simple_check = ''
-                if simple_check and simple_check in log_content:
-                    match = re.search(pattern_regex, log_content, re.IGNORECASE)
-                elif not simple_check:  # If no simple check defined, use regex directly
-                    match = re.search(pattern_regex, log_content, re.IGNORECASE)
-                    
-                # If taking too long, skip this pattern
-                if time.time() - start_time > 1.0:  # More than 1 second is too long
-                    print(f"Pattern matching timeout for: {pattern}")
-                    continue
-                    
-                if match:
-                    result = {
-                        'error_type': pattern,
-                        'error_message': match.group(0) if match.groups() else match.group(0),
-                        'severity': 'medium',
-                        'tech_stack': ['unknown'],
-                        'potential_causes': []
-                    }
-                    
-                    # Extract named groups
-                    if hasattr(match, 'groupdict') and match.groupdict():
-                        for key, value in match.groupdict().items():
-                            if value:
-                                result[key] = value
-                                
-                    results.append(result)
-            except re.error as e:
-                print(f"Regex error in pattern {pattern}: {e}")
+                match = regex.search(log_content)
+            except MatchTimeout as e:
+                print(f"Pattern matching timeout for '{name}': {e}")
                 continue
-            except Exception as e:
-                print(f"Error matching pattern {pattern}: {e}")
+            except RuntimeError as e:
+                print(f"Error matching pattern '{name}': {e}")
                 continue
+            
+            if match:
+                result = {
+                    'error_type': name,
+                    'error_message': match.group(0),
+                    'severity': 'medium',
+                    'tech_stack': ['unknown'],
+                    'potential_causes': []
+                }
                 
-            # If we've spent more than 3 seconds on pattern matching, abort to prevent timeouts
-            if time.time() - start_time > 3.0:
-                print("Pattern matching is taking too long, aborting further matches")
-                break
+                # Extract named groups
+                for key, value in match.groupdict().items():
+                    if value:
+                        result[key] = value
+                        
+                results.append(result)
         
         return results
+
+
+def _utf8_length(text):
+    """Length of a str encoded as UTF-8, without encoding ASCII text."""
+    return len(text) if text.isascii() else len(text.encode('utf-8', errors='surrogatepass'))
@@ -0,0 +1,242 @@
+import re
+import json
+
+# Levels read from structured lines, ordered by rank; 0 means the line has none
+LEVEL_DEBUG, LEVEL_INFO, LEVEL_WARNING, LEVEL_ERROR, LEVEL_CRITICAL = 1, 2, 3, 4, 5
+
+# Level names found in the wild, lowercased
+LEVEL_NAMES = {
+    'trace': LEVEL_DEBUG, 'debug': LEVEL_DEBUG, 'dbug': LEVEL_DEBUG, 'verbose': LEVEL_DEBUG,
+    'fine': LEVEL_DEBUG, 'finer': LEVEL_DEBUG, 'finest': LEVEL_DEBUG,
+    'info': LEVEL_INFO, 'information': LEVEL_INFO, 'informational': LEVEL_INFO, 'notice': LEVEL_INFO,
+    'warn': LEVEL_WARNING, 'warning': LEVEL_WARNING,
+    'error': LEVEL_ERROR, 'err': LEVEL_ERROR, 'eror': LEVEL_ERROR, 'severe': LEVEL_ERROR,
+    'critical': LEVEL_CRITICAL, 'crit': LEVEL_CRITICAL, 'fatal': LEVEL_CRITICAL, 'panic': LEVEL_CRITICAL,
+    'alert': LEVEL_CRITICAL, 'emerg': LEVEL_CRITICAL, 'emergency': LEVEL_CRITICAL
+}
+
+# Syslog severities 0 (emergency) to 7 (debug)
+SYSLOG_LEVELS = [LEVEL_CRITICAL, LEVEL_CRITICAL, LEVEL_CRITICAL, LEVEL_ERROR,
+                 LEVEL_WARNING, LEVEL_INFO, LEVEL_INFO, LEVEL_DEBUG]
+
+# Keys of JSON and logfmt records, most common first
+LEVEL_KEYS = ('level', 'lvl', 'severity', 'levelname', 'log.level', 'loglevel', 'level_name')
+TIME_KEYS = ('time', 'timestamp', 'ts', '@timestamp', 'datetime', 'date', 't')
+LOGGER_KEYS = ('logger', 'logger_name', 'loggerName', 'name', 'caller', 'component')
+MESSAGE_KEYS = ('msg', 'message', 'log', 'event', 'text')
+
+# Keys whose values are added to the message, as error patterns should see them
+ERROR_KEYS = ('error', 'err', 'exception', 'exc_info', 'stack_trace', 'stacktrace', 'stack')
+
+# Lines sampled from the start of a log to recognize its format, and the share
+# of the non-blank ones a format must parse to be picked
+DETECT_SAMPLE_LINES = 100
+DETECT_MIN_SHARE = 0.6
+
+_MONTHS = {name: number for number, name in enumerate(
+    ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec'], 1)}
+
+_LOGFMT_PAIR = re.compile(r'([\w.@/-]+)=("(?:[^"\\]|\\.)*"|[^\s"]*)')
+
+# log4j and logback layouts: stamp, optional [thread], level, optional
+# [thread], optional "logger - ", message
+_LOG4J = re.compile(
+    r'(?P<time>\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}:\d{2}(?:[.,]\d+)?(?:Z|[-+]\d{2}:?\d{2})?)\s+'
+    r'(?:\[[^\]]*\]\s+)?'
+    r'(?P<level>TRACE|DEBUG|INFO|WARN(?:ING)?|ERROR|SEVERE|FATAL|CRITICAL)\s+'
+    r'(?:\[[^\]]*\]\s+)?'
+    r'(?:(?P<logger>[\w.$]+)\s+-\s+)?'
+    r'(?P<message>.*)', re.ASCII)
+
+_SYSLOG_RFC3164 = re.compile(
+    r'(?:<(?P<pri>\d{1,3})>)?'
+    r'(?P<time>(?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec) [ \d]\d \d{2}:\d{2}:\d{2}) '
+    r'(?P<host>\S+) (?P<tag>[^:\[\s]+)(?:\[\d+\])?: ?(?P<message>.*)')
+_SYSLOG_RFC5424 = re.compile(
+    r'<(?P<pri>\d{1,3})>1 (?P<time>\S+) (?P<host>\S+) (?P<tag>\S+) \S+ \S+ '
+    r'(?:-|(?:\[(?:[^\]"\\]|\\.|"(?:[^"\\]|\\.)*")*\])+) ?(?P<message>.*)')
+
+_NGINX_ACCESS = re.compile(
+    r'\S+ \S+ \S+ \[(?P<time>[^\]]+)\] "(?P<request>[^"]*)" (?P<status>\d{3}) (?:\d+|-)')
+_NGINX_ERROR = re.compile(
+    r'(?P<time>\d{4}/\d{2}/\d{2} \d{2}:\d{2}:\d{2}) \[(?P<level>[a-z]+)\] \d+#\d+: (?:\*\d+ )?(?P<message>.*)')
+
+
+def _level(value):
+    """Normalize a level field: a name, or a bunyan/pino number."""
+    if isinstance(value, str):
+        return LEVEL_NAMES.get(value.strip().lower(), 0)
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        if value >= 60:
+            return LEVEL_CRITICAL
+        if value >= 50:
+            return LEVEL_ERROR
+        if value >= 40:
+            return LEVEL_WARNING
+        if value >= 30:
+            return LEVEL_INFO
+        return LEVEL_DEBUG
+    return 0
+
+
+def _timestamp(value):
+    """Turn a time field into text the timestamp regex recognizes; numbers are epoch times."""
+    if isinstance(value, str):
+        return value
+    if isinstance(value, (int, float)) and not isinstance(value, bool) and value > 0:
+        # Seconds, milliseconds, microseconds or nanoseconds since the epoch
+        while value >= 1e13:
+            value /= 1000
+        if value < 1e11:
+            value *= 1000
+        return str(int(value))
+    return None
+
+
+def _first(record, keys):
+    """Value of the first of the keys present in a record, or None."""
+    for key in keys:
+        value = record.get(key)
+        if value is not None:
+            return value
+    return None
+
+
+def _record_fields(record, line):
+    """Read the fields of a JSON or logfmt record, None if it has none of the known keys."""
+    level = _first(record, LEVEL_KEYS)
+    if level is None and isinstance(record.get('log'), dict):
+        level = record['log'].get('level')  # Elastic common schema
+    stamp = _first(record, TIME_KEYS)
+    logger = _first(record, LOGGER_KEYS)
+    message = _first(record, MESSAGE_KEYS)
+    if level is None and stamp is None and message is None:
+        return None
+
+    if not isinstance(message, str):
+        message = line if message is None else str(message)
+    details = [value if isinstance(value, str) else str(value)
+               for value in (record.get(key) for key in ERROR_KEYS) if value]
+    if details:
+        message = ' '.join([message] + details)
+    if logger is not None and not isinstance(logger, str):
+        logger = str(logger)
+    return _level(level), _timestamp(stamp), logger, message
+
+
+def parse_json(line):
+    """
+    Parse a JSON-lines record.
+
+    Container runtimes wrap each line an application writes in a record of
+    their own, {"log": ..., "stream": ..., "time": ...}; when the wrapped line
+    is a JSON record itself, its fields are used.
+    """
+    line = line.strip()
+    if not line.startswith('{'):
+        return None
+    try:
+        record = json.loads(line)
+    except ValueError:
+        return None
+    if not isinstance(record, dict):
+        return None
+
+    fields = _record_fields(record, line)
+    if fields is not None and not fields[0] and fields[3].lstrip().startswith('{'):
+        inner = parse_json(fields[3])
+        if inner is not None:
+            return inner[0], inner[1] or fields[1], inner[2] or fields[2], inner[3]
+    return fields
+
+
+def parse_logfmt(line):
+    """Parse a logfmt record: key=value pairs, values quoted when they hold spaces."""
+    if '=' not in line:
+        return None
+    pairs = _LOGFMT_PAIR.findall(line)
+    if len(pairs) < 2 or not line.lstrip().startswith(pairs[0][0] + '='):
+        return None
+    record = {key: value[1:-1].replace('\\"', '"') if value.startswith('"') else value
+              for key, value in pairs}
+    return _record_fields(record, line)
+
+
+def parse_log4j(line):
+    """Parse a log4j or logback line such as ``2024-03-01 10:00:00,123 ERROR [main] com.app.Db - failed``."""
+    match = _LOG4J.match(line)
+    if not match:
+        return None
+    return LEVEL_NAMES[match.group('level').lower()], match.group('time'), match.group('logger'), match.group('message')
+
+
+def parse_syslog(line):
+    """Parse an RFC 3164 or RFC 5424 syslog line; the level comes from the priority when present."""
+    match = _SYSLOG_RFC5424.match(line) or _SYSLOG_RFC3164.match(line)
+    if not match:
+        return None
+    pri = match.group('pri')
+    level = SYSLOG_LEVELS[int(pri) & 7] if pri is not None else 0
+    return level, match.group('time'), match.group('tag'), match.group('message')
+
+
+def parse_nginx(line):
+    """
+    Parse an nginx access or error log line.
+
+    Access lines have no level; it follows from the status code: 5xx is an
+    error and 4xx a warning.
+    """
+    match = _NGINX_ACCESS.match(line)
+    if match:
+        status = match.group('status')
+        level = LEVEL_ERROR if status[0] == '5' else LEVEL_WARNING if status[0] == '4' else LEVEL_INFO
+        return level, _clf_to_iso(match.group('time')), None, f"{match.group('request')} {status}"
+
+    match = _NGINX_ERROR.match(line)
+    if match:
+        return (LEVEL_NAMES.get(match.group('level'), 0), match.group('time').replace('/', '-'),
+                None, match.group('message'))
+    return None
+
+
+def _clf_to_iso(text):
+    """Rewrite a common log format stamp (``10/Oct/2000:13:55:36 -0700``) as ISO-8601."""
+    month = _MONTHS.get(text[3:6])
+    if month is None or len(text) < 20:
+        return None
+    return f"{text[7:11]}-{month:02d}-{text[0:2]}T{text[12:20]}{text[21:26]}"
+
+
+# Parser of every format, in the order they are tried when detecting one
+LOG_FORMATS = {
+    'json': parse_json,
+    'logfmt': parse_logfmt,
+    'log4j': parse_log4j,
+    'syslog': parse_syslog,
+    'nginx': parse_nginx
+}
+
+
+def detect_format(lines, min_share=DETECT_MIN_SHARE):
+    """
+    Recognize the format of a log from a sample of its first lines.
+
+    Args:
+        lines (list): Lines from the start of the log, DETECT_SAMPLE_LINES are enough
+        min_share (float): Share of the non-blank lines a format must parse
+
+    Returns:
+        str: Name of the format in LOG_FORMATS that parses the most lines, or
+            None for free-form text
+    """
+    sample = [line for line in lines[:DETECT_SAMPLE_LINES] if line.strip()]
+    if not sample:
+        return None
+
+    best, best_count = None, 0
+    for name, parse in LOG_FORMATS.items():
+        count = sum(1 for line in sample if parse(line) is not None)
+        if count > best_count:
+            best, best_count = name, count
+    return best if best_count >= min_share * len(sample) else None
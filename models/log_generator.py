@@ -0,0 +1,260 @@
+"""
+Deterministic synthetic logs for benchmarks.
+
+The same kind, size and seed always give the same lines, so timings taken
+on different commits, or different machines, are of the same work.
+"""
+import os
+import re
+import gzip
+import json
+import random
+import datetime
+from .measurements import SIZE_UNITS
+
+# Bumped whenever the generated content changes, so cached files are remade
+GENERATOR_VERSION = 1
+
+# Time of the first line; each line is a few milliseconds after the previous one
+_START = datetime.datetime(2024, 3, 1, 8, 0, 0)
+
+_SERVICES = ['api', 'billing', 'auth', 'search', 'worker', 'gateway', 'inventory', 'mailer']
+_LOGGERS = ['com.acme.api.UserController', 'com.acme.billing.InvoiceService', 'com.acme.auth.TokenFilter',
+            'com.acme.search.QueryPlanner', 'com.acme.worker.JobRunner', 'org.hibernate.SQL']
+_PATHS = ['/api/users/{id}', '/api/orders/{id}/items', '/api/search', '/api/login', '/health',
+          '/api/invoices/{id}', '/static/app.js', '/api/carts/{id}/checkout']
+_METHODS = ['GET', 'GET', 'GET', 'POST', 'PUT', 'DELETE']
+
+_INFO_MESSAGES = [
+    'Request {method} {path} completed status={status} took {ms}ms bytes_sent={bytes}',
+    'Processed batch {id} with {n} records',
+    'Cache refreshed for tenant {id} in {ms}ms',
+    'User {id} signed in from 10.0.{n}.{m}',
+    'Scheduled job {id} started on worker-{n}',
+    'Connected to database replica db-{n} pool size {m}',
+    'Served {path} size={bytes} status=200',
+]
+_WARNING_MESSAGES = [
+    'Slow query on orders took {slow}ms',
+    'Retrying request {id} to upstream payments ({n}/5)',
+    'High memory usage on worker-{n}: {m}%',
+    'Deprecated API {path} called by client {id}',
+]
+_ERROR_MESSAGES = [
+    'Connection refused by upstream payments-{n}:8443',
+    'Request {method} {path} timed out after {slow}ms',
+    'Permission denied writing /var/lib/app/cache/{id}.bin',
+    'Out of memory: kill process {id} (java) score {n}',
+    'Failed to parse payload for order {id}: syntax error at position {n}',
+    'Module not found: acme_plugins.exporter_{n}',
+    'Network unreachable while contacting search-{n}.internal',
+    'Unhandled exception in job {id}: database deadlock detected',
+]
+
+_JAVA_EXCEPTIONS = [
+    ('java.lang.NullPointerException', 'Cannot invoke "Order.total()" because "order" is null'),
+    ('java.sql.SQLTransientConnectionException', 'HikariPool-1 - Connection is not available, request timed out'),
+    ('java.lang.IllegalStateException', 'Invoice {id} already settled'),
+    ('java.io.IOException', 'Broken pipe'),
+]
+_JAVA_FRAMES = ['com.acme.billing.InvoiceService.settle(InvoiceService.java:{n})',
+                'com.acme.api.UserController.get(UserController.java:{n})',
+                'org.springframework.web.servlet.FrameworkServlet.service(FrameworkServlet.java:{n})',
+                'org.apache.catalina.core.ApplicationFilterChain.doFilter(ApplicationFilterChain.java:{n})',
+                'com.zaxxer.hikari.pool.HikariPool.getConnection(HikariPool.java:{n})',
+                'java.base/java.lang.Thread.run(Thread.java:{n})']
+
+_PYTHON_EXCEPTIONS = [
+    ('KeyError', "'customer_id'"),
+    ('ValueError', 'invalid literal for int() with base 10: \'{id}\''),
+    ('ConnectionError', 'HTTPSConnectionPool(host=\'api.acme.io\', port=443): Max retries exceeded'),
+    ('TimeoutError', 'operation timed out after {slow}ms'),
+]
+_PYTHON_FRAMES = [('/app/worker/tasks.py', 'run_task'), ('/app/worker/handlers.py', 'handle'),
+                  ('/usr/lib/python3.11/site-packages/requests/adapters.py', 'send'),
+                  ('/app/billing/models.py', 'settle')]
+
+# Share of the events of each kind that are warnings, errors and stack traces
+_KINDS = {
+    'plain': dict(warning=0.03, error=0.01, trace=0.0),
+    'jsonl': dict(warning=0.03, error=0.01, trace=0.0),
+    'java': dict(warning=0.02, error=0.01, trace=0.01),
+    'python': dict(warning=0.02, error=0.01, trace=0.01),
+    'errors': dict(warning=0.2, error=0.5, trace=0.05),
+    'clean': dict(warning=0.0, error=0.0, trace=0.0),
+}
+
+# Kinds of log this module can write
+LOG_KINDS = tuple(_KINDS)
+
+_SIZE = re.compile(r'(?i)\s*(\d+(?:\.\d+)?)\s*([kmgt]i?b|b|bytes?)?\s*$')
+
+
+def parse_size(text):
+    """
+    Read a size such as ``1KB``, ``64MB`` or ``1GiB``.
+
+    Args:
+        text (str): The size; a plain number is in bytes
+
+    Returns:
+        int: The size in bytes
+
+    Raises:
+        ValueError: If the text is not a size
+    """
+    match = _SIZE.match(text)
+    if match is None:
+        raise ValueError(f"Not a size: {text!r}")
+    return int(float(match.group(1)) * SIZE_UNITS[(match.group(2) or 'b').lower()])
+
+
+def format_size(size):
+    """Render a size in bytes with the largest unit that keeps it whole, e.g. 64MB."""
+    for unit, factor in (('GB', 10 ** 9), ('MB', 10 ** 6), ('KB', 10 ** 3)):
+        if size >= factor and size % factor == 0:
+            return f"{size // factor}{unit}"
+    return f"{size}B"
+
+
+def generate_lines(kind, seed=0):
+    """
+    Yield the lines of a synthetic log, forever.
+
+    Args:
+        kind (str): One of LOG_KINDS: 'plain' text, 'jsonl' records, 'java'
+            or 'python' logs with stack traces, 'errors' for a log that is
+            mostly errors, or 'clean' for a log without any
+        seed (int): Seed of the log's random choices
+
+    Yields:
+        str: Lines, without their newline
+
+    Raises:
+        ValueError: If the kind is unknown
+    """
+    if kind not in _KINDS:
+        raise ValueError(f"Unknown log kind {kind!r}; expected one of {', '.join(LOG_KINDS)}")
+    rates = _KINDS[kind]
+    rnd = random.Random(f"{kind}:{seed}")
+    stamp = _START
+    step = datetime.timedelta(milliseconds=7)
+
+    while True:
+        stamp += step
+        roll = rnd.random()
+        if roll < rates['trace']:
+            level, message = 'ERROR', None
+        elif roll < rates['trace'] + rates['error']:
+            level, message = 'ERROR', _fill(rnd.choice(_ERROR_MESSAGES), rnd)
+        elif roll < rates['trace'] + rates['error'] + rates['warning']:
+            level, message = 'WARN', _fill(rnd.choice(_WARNING_MESSAGES), rnd)
+        else:
+            level, message = rnd.choice(('INFO', 'INFO', 'INFO', 'DEBUG')), _fill(rnd.choice(_INFO_MESSAGES), rnd)
+
+        time_text = stamp.strftime('%Y-%m-%d %H:%M:%S.') + f"{stamp.microsecond // 1000:03d}"
+        service = rnd.choice(_SERVICES)
+
+        if message is None:
+            yield from _trace(kind, rnd, time_text, service)
+        elif kind == 'jsonl':
+            yield json.dumps({'time': time_text, 'level': level.lower(), 'logger': service, 'msg': message})
+        elif kind == 'java':
+            yield f"{time_text} [{service}-exec-{rnd.randint(1, 16)}] {level} {rnd.choice(_LOGGERS)} - {message}"
+        else:
+            yield f"{time_text} {level} [{service}] {message}"
+
+
+def write_log(path, kind, size, seed=0):
+    """
+    Write a synthetic log of about the given size.
+
+    The log is made of whole lines and ends with a newline; it stops at the
+    first line that reaches the size. A path ending in ``.gz`` is compressed.
+
+    Args:
+        path (str): File to write
+        kind (str): One of LOG_KINDS
+        size (int): Size in bytes of the uncompressed log
+        seed (int): Seed of the log's random choices
+
+    Returns:
+        dict: bytes and lines written, uncompressed
+    """
+    written = lines = 0
+    batch = []
+    if path.endswith('.gz'):
+        # No timestamp in the header, so the compressed bytes are the same too
+        f = gzip.GzipFile(path, 'wb', mtime=0)
+    else:
+        f = open(path, 'wb')
+    with f:
+        for line in generate_lines(kind, seed):
+            data = line.encode('utf-8') + b'\n'
+            batch.append(data)
+            written += len(data)
+            lines += 1
+            if written >= size:
+                break
+            if len(batch) >= 4096:
+                f.write(b''.join(batch))
+                batch = []
+        f.write(b''.join(batch))
+    return {'bytes': written, 'lines': lines}
+
+
+def cached_log(directory, kind, size, seed=0, compressed=False):
+    """
+    Path of a synthetic log in a directory, writing it on first use.
+
+    Args:
+        directory (str): Directory holding generated logs
+        kind (str): One of LOG_KINDS
+        size (int): Size in bytes of the uncompressed log
+        seed (int): Seed of the log's random choices
+        compressed (bool): Write it gzip-compressed
+
+    Returns:
+        str: Path of the log
+    """
+    os.makedirs(directory, exist_ok=True)
+    name = f"{kind}-{format_size(size)}-s{seed}-v{GENERATOR_VERSION}.log" + ('.gz' if compressed else '')
+    path = os.path.join(directory, name)
+    if not os.path.exists(path):
+        # Written under a temporary name, so an interrupted run leaves no partial log
+        partial = path + '.part' + ('.gz' if compressed else '')
+        write_log(partial, kind, size, seed)
+        os.replace(partial, path)
+    return path
+
+
+def _fill(template, rnd):
+    """Fill the placeholders of a message template with random values."""
+    path = rnd.choice(_PATHS).replace('{id}', str(rnd.randint(1, 99999)))
+    return template.format(method=rnd.choice(_METHODS), path=path, status=rnd.choice((200, 200, 200, 201, 204, 304)),
+                           ms=rnd.randint(1, 250), slow=rnd.randint(1000, 30000), bytes=rnd.randint(200, 2000000),
+                           id=rnd.randint(1, 99999), n=rnd.randint(1, 64), m=rnd.randint(1, 99))
+
+
+def _trace(kind, rnd, time_text, service):
+    """Lines of a logged exception with its stack trace, in the style of the log kind."""
+    if kind == 'python' or (kind != 'java' and rnd.random() < 0.5):
+        exception, message = rnd.choice(_PYTHON_EXCEPTIONS)
+        yield f"{time_text} ERROR [{service}] Task failed"
+        yield 'Traceback (most recent call last):'
+        for path, function in rnd.sample(_PYTHON_FRAMES, rnd.randint(2, len(_PYTHON_FRAMES))):
+            yield f'  File "{path}", line {rnd.randint(10, 900)}, in {function}'
+            yield f'    result = {function}(payload)'
+        yield f"{exception}: {_fill(message, rnd)}"
+        return
+
+    exception, message = rnd.choice(_JAVA_EXCEPTIONS)
+    yield f"{time_text} [{service}-exec-{rnd.randint(1, 16)}] ERROR {rnd.choice(_LOGGERS)} - Request failed"
+    yield f"{exception}: {_fill(message, rnd)}"
+    for frame in rnd.sample(_JAVA_FRAMES, rnd.randint(3, len(_JAVA_FRAMES))):
+        yield f"\tat {_fill(frame, rnd)}"
+    if rnd.random() < 0.3:
+        cause, cause_message = rnd.choice(_JAVA_EXCEPTIONS)
+        yield f"Caused by: {cause}: {_fill(cause_message, rnd)}"
+        yield f"\tat {_fill(rnd.choice(_JAVA_FRAMES), rnd)}"
+        yield f"\t... {rnd.randint(5, 40)} more"
@@ -0,0 +1,805 @@
+import re
+from time import perf_counter
+from collections import deque, Counter
+from .finding_store import FindingStore, SEVERITY_CODES, DEFAULT_SAMPLE_LIMIT, DEFAULT_EDGE_LIMIT
+from .template_miner import TemplateMiner
+from .keyword_automaton import KeywordAutomaton
+from .pattern_engine import PatternStats, PATTERN_SAMPLE_EVERY
+from .time_series import TimeSeries, TIMESTAMP_PATTERN, TIMESTAMP_KIND_CODES, OTHER, WARNING, ERROR
+from .log_formats import LOG_FORMATS, LEVEL_DEBUG, LEVEL_INFO, LEVEL_WARNING, LEVEL_ERROR, LEVEL_CRITICAL
+from .stack_traces import StackTraceAssembler, shift_trace, trace_entry, join_traces
+from .measurements import measure, parse_duration, endpoint_key
+from .quantile_sketch import KeyedSketches
+
+# Indicators used to guess the technology behind a log, checked on word boundaries.
+# Dict order doubles as the tie-break order when two technologies score the same.
+TECH_INDICATORS = {
+    'java': ['java.', 'springframework', 'jakarta', 'javax.'],
+    'python': ['traceback', 'File "', 'ImportError', 'ModuleNotFoundError'],
+    'javascript': ['TypeError', 'ReferenceError', 'node_modules', 'npm', 'yarn'],
+    'docker': ['docker', 'container', 'image', 'Dockerfile'],
+    'kubernetes': ['kubectl', 'pod', 'deployment', 'k8s', 'namespace'],
+    'database': ['SQL', 'query', 'database', 'mysql', 'postgres', 'mongodb'],
+    'web': ['http', 'https', 'status code', 'request', 'response']
+}
+
+# Substrings that put a line in a level bucket; error, warning, info and debug
+# are ranked in that order and a line only counts towards the first that matches
+LEVEL_KEYWORDS = {
+    'error': ['error', 'exception', 'fail'],
+    'warning': ['warn'],
+    'info': ['info'],
+    'debug': ['debug'],
+    'exception': ['exception', 'traceback'],
+    'critical': ['critical', 'fatal']
+}
+
+# Performance issue categories, checked in order; the first one that matches wins
+PERFORMANCE_PATTERNS = [
+    ('timeout', 'Possible timeout detected',
+     r'(?i)timeout|timed? out|too (?:much|long)|(?:high|excessive) (?:cpu|memory|load)'),
+    ('memory', 'Possible memory issue detected',
+     r'(?i)memory|heap|out of|allocation|garbage collection'),
+    ('performance', 'Possible performance issue detected',
+     r'(?i)slow|delay|latency|performance|bottleneck')
+]
+
+PERFORMANCE_KINDS = [issue_type for issue_type, _, _ in PERFORMANCE_PATTERNS]
+PERFORMANCE_DESCRIPTIONS = {issue_type: description for issue_type, description, _ in PERFORMANCE_PATTERNS}
+
+# Number of lines kept on each side of an error
+CONTEXT_RADIUS = 5
+
+# Number of errors, highest severity first, that carry a context window
+DEFAULT_CONTEXT_LIMIT = 50
+
+LOW, MEDIUM, HIGH, CRITICAL = (SEVERITY_CODES[name] for name in ('low', 'medium', 'high', 'critical'))
+
+# Severity of a finding on a structured line, by the line's level
+LEVEL_SEVERITIES = {LEVEL_DEBUG: LOW, LEVEL_INFO: LOW, LEVEL_WARNING: MEDIUM,
+                    LEVEL_ERROR: HIGH, LEVEL_CRITICAL: CRITICAL}
+
+# Loggers listed in the metrics, by number of error lines
+TOP_ERROR_LOGGERS = 10
+
+CODE_BLOCK_REGEX = re.compile(r'```(?:\w+)?\n(.*?)\n```', re.DOTALL)
+CODE_FENCE_REGEX = re.compile(r'```\w*$')
+FILE_REFERENCE_REGEX = re.compile(r'(?:at |File ")([^"]+):(\d+)')
+
+_GLOBAL_FLAGS = re.compile(r'^\(\?([aiLmsux]+)\)')
+_BACKREFERENCE = re.compile(r'\\[1-9]|\(\?P=')
+
+
+def _scoped(pattern):
+    """Rewrite leading global inline flags such as ``(?i)`` as a scoped group."""
+    match = _GLOBAL_FLAGS.match(pattern)
+    if not match:
+        return '(?:' + pattern + ')'
+    return '(?' + match.group(1) + ':' + pattern[match.end():] + ')'
+
+
+def _dropped(total, returned):
+    """Counts of a list cut to an output budget."""
+    return {'total': total, 'returned': returned, 'dropped': total - returned}
+
+
+class OrderedMatcher:
+    """
+    Finds the first pattern, in list order, that matches anywhere in a line.
+
+    All patterns are folded into one alternation with a named group per pattern,
+    so a line that matches none of them costs a single regex scan. When the
+    alternation does hit, only the patterns ahead of the hit are re-checked to
+    keep the "first pattern in order wins" semantics of sequential re.search calls.
+    """
+
+    def __init__(self, patterns, binary=False):
+        """
+        Compile the patterns and their combined alternation.
+
+        Args:
+            patterns (list): Regex strings, in priority order
+            binary (bool): Compile for matching UTF-8 bytes instead of str
+        """
+        encode = (lambda pattern: pattern.encode('utf-8')) if binary else (lambda pattern: pattern)
+        self.patterns = [re.compile(encode(pattern)) for pattern in patterns]
+        self.combined = None
+
+        # Patterns with backreferences would be renumbered by the alternation
+        if patterns and not any(_BACKREFERENCE.search(pattern) for pattern in patterns):
+            try:
+                self.combined = re.compile(encode('|'.join(
+                    '(?P<p%d>%s)' % (i, _scoped(pattern)) for i, pattern in enumerate(patterns))))
+            except re.error:
+                self.combined = None
+
+    def first_match(self, line):
+        """Return the index of the first matching pattern, or -1."""
+        if self.combined is None:
+            for i, pattern in enumerate(self.patterns):
+                if pattern.search(line):
+                    return i
+            return -1
+
+        match = self.combined.search(line)
+        if not match:
+            return -1
+
+        index = int(match.lastgroup[1:])
+        for i in range(index):
+            if self.patterns[i].search(line):
+                return i
+        return index
+
+
+class LogScanner:
+    """
+    Fused single-pass scanner behind LogAnalyzer.analyze.
+
+    Each line is visited exactly once and feeds the metrics, technology, error,
+    performance and timestamp sections at the same time, using patterns that are
+    compiled once when the scanner is built.
+    """
+
+    def __init__(self, error_patterns, context_limit=DEFAULT_CONTEXT_LIMIT,
+                 sample_limit=DEFAULT_SAMPLE_LIMIT, edge_limit=DEFAULT_EDGE_LIMIT):
+        """
+        Compile the matchers for a set of error patterns.
+
+        Args:
+            error_patterns (dict): Error type to regex, as loaded from error_patterns.json
+            context_limit (int, optional): Number of errors that keep a context
+                window; None keeps one for every error
+            sample_limit (int, optional): Distinct lines sampled, by severity, into
+                all_errors and performance_issues besides their first and last
+                findings; None keeps every finding and every stack trace
+            edge_limit (int): Findings of each type, and stack traces, kept from
+                the start and from the end of the log
+        """
+        self.context_limit = context_limit
+        self.sample_limit = sample_limit
+        self.edge_limit = edge_limit
+        self.error_patterns = error_patterns
+        self.error_types = list(error_patterns.keys())
+        self.error_matcher = OrderedMatcher(list(error_patterns.values()))
+        self.pattern_stats = PatternStats(self.error_types)
+        self.performance_matcher = OrderedMatcher([pattern for _, _, pattern in PERFORMANCE_PATTERNS])
+        self.timestamp_regex = re.compile(TIMESTAMP_PATTERN, re.ASCII)
+
+        # One automaton finds level keywords as substrings and technology
+        # indicators on word boundaries; tech entries follow the level entries
+        self.level_entries = [(level, keyword)
+                              for level, keywords in LEVEL_KEYWORDS.items()
+                              for keyword in keywords]
+        self.tech_entries = [(tech, indicator)
+                             for tech, indicators in TECH_INDICATORS.items()
+                             for indicator in indicators]
+        self.tech_offset = len(self.level_entries)
+        self.keywords = KeywordAutomaton([(keyword, False) for _, keyword in self.level_entries] +
+                                         [(indicator, True) for _, indicator in self.tech_entries])
+        self.level_ids = {level: frozenset(i for i, (name, _) in enumerate(self.level_entries) if name == level)
+                          for level in LEVEL_KEYWORDS}
+
+    def scan(self, lines, collect_snippets=False, log_format=None, trace_state=None):
+        """
+        Scan log lines once and collect every per-line section of an analysis.
+
+        Lines are consumed one at a time, so ``lines`` may be a list or any
+        iterator. Context windows come from a ring buffer of the previous lines
+        plus the lines that follow, so memory grows with the number of findings
+        and never with the length of the log.
+
+        For a structured format, the level, timestamp and logger are read from
+        each line's own fields, and keywords, technology indicators and error and
+        performance patterns are only looked for in the logger and message, so
+        field names and other fields do not count. An error-level line whose
+        message matches no error pattern is matched as a whole. Lines that do not
+        parse, and parsed lines without a level, fall back to the keyword
+        heuristics.
+
+        The lines of a multiline stack trace are grouped into one exception
+        event. Only the line a trace starts on can be an entry of all_errors;
+        the frames, causes and exception lines after it are not.
+
+        Durations ("took 8423ms", "duration=1.5s") and sizes ("512KB",
+        "bytes_sent=1024") are read from each line into quantile sketches, per
+        HTTP endpoint named in the line or else per logger.
+
+        With a sample limit, findings and stack traces are counted exactly but
+        only the ones within the output budget are kept, so memory and the size
+        of the result do not grow with the number of findings.
+
+        Args:
+            lines (iterable): The log lines, without trailing newlines
+            collect_snippets (bool): Also collect code blocks and file references
+                line by line, for callers that never hold the whole content
+            log_format (str, optional): Name of the log's format in LOG_FORMATS,
+                None for free-form text
+            trace_state (tuple, optional): From next_trace_state(), to continue
+                a stack trace left open at the end of the lines before these
+
+        Returns:
+            dict: metrics, technology, all_errors, performance_issues,
+                error_clusters, durations and sizes sketches, exceptions, the
+                primary error (type, line index, text and context) and the head
+                of the log
+        """
+        parse = LOG_FORMATS[log_format] if log_format is not None else None
+        error_types = self.error_types
+        first_error = self.error_matcher.first_match
+        pattern_searches = [pattern.search for pattern in self.error_matcher.patterns]
+        pattern_hits = [0] * len(error_types)
+        pattern_seconds = [0.0] * len(error_types)
+        sampled_lines = 0
+        sample_mask = PATTERN_SAMPLE_EVERY - 1
+        first_performance = self.performance_matcher.first_match
+        timestamp_search = self.timestamp_regex.search
+        find_keywords = self.keywords.find
+        tech_offset = self.tech_offset
+        error_ids = self.level_ids['error']
+        warning_ids = self.level_ids['warning']
+        info_ids = self.level_ids['info']
+        debug_ids = self.level_ids['debug']
+        exception_ids = self.level_ids['exception']
+        critical_ids = self.level_ids['critical']
+
+        total_lines = 0
+        error_count = warning_count = info_count = debug_count = exception_count = 0
+        first_timestamp = last_timestamp = None
+        timestamp_count = 0
+        time_series = TimeSeries()
+        add_stamp = time_series.add
+        count_line = time_series.count
+        found_tech = set()
+        logger_errors = Counter()
+        all_errors = self.error_store()
+        performance_issues = self.performance_store()
+        error_clusters = TemplateMiner()
+        traces = self.trace_assembler(trace_state)
+        feed_trace = traces.feed
+        durations = KeyedSketches()
+        sizes = KeyedSketches()
+
+        # Lines before the current one, and context windows still waiting for
+        # the lines after their error as [window, lines still needed]
+        previous = deque(maxlen=CONTEXT_RADIUS)
+        pending = []
+        head = []
+
+        # The primary error is the earliest line matching the lowest-ranked error type
+        primary_index = len(error_types)
+        primary_line = -1
+        primary_text = None
+        primary_context = []
+
+        code_blocks = []
+        file_references = []
+        block_count = reference_count = 0
+        block_limit, reference_limit = self._snippet_limits()
+        open_block = None
+
+        for i, line in enumerate(lines):
+            total_lines += 1
+            if pending:
+                for window in pending:
+                    window[0].append(line)
+                    window[1] -= 1
+                if pending[0][1] == 0:
+                    pending = [window for window in pending if window[1] > 0]
+            if i < 10:
+                head.append(line)
+
+            # Lines that continue a stack trace belong to the error it started with
+            in_trace = feed_trace(i + 1, line)
+
+            # Fields of a structured line
+            fields = parse(line) if parse is not None else None
+            if fields is None:
+                line_level = 0
+                stamp_text = line
+                text = line
+            else:
+                line_level, stamp_text, logger, text = fields
+                if stamp_text is None:
+                    stamp_text = line
+                if logger is not None:
+                    text = logger + ' ' + text
+
+            # Level keywords and technology indicators in one pass over the text
+            hits = find_keywords(text.lower())
+
+            # Level counters, from the level field when the line has one
+            if line_level:
+                is_error = line_level >= LEVEL_ERROR
+                is_warning = line_level == LEVEL_WARNING
+                if is_error:
+                    error_count += 1
+                elif is_warning:
+                    warning_count += 1
+                elif line_level == LEVEL_INFO:
+                    info_count += 1
+                else:
+                    debug_count += 1
+            else:
+                is_error = not error_ids.isdisjoint(hits)
+                is_warning = not warning_ids.isdisjoint(hits)
+                if is_error:
+                    error_count += 1
+                elif is_warning:
+                    warning_count += 1
+                elif not info_ids.isdisjoint(hits):
+                    info_count += 1
+                elif not debug_ids.isdisjoint(hits):
+                    debug_count += 1
+
+            if not exception_ids.isdisjoint(hits):
+                exception_count += 1
+            if is_error and fields is not None and logger is not None:
+                logger_errors[logger] += 1
+
+            # Timestamps
+            level = ERROR if is_error else WARNING if is_warning else OTHER
+            match = timestamp_search(stamp_text)
+            if match:
+                stamp = match.group()
+                if first_timestamp is None:
+                    first_timestamp = stamp
+                last_timestamp = stamp
+                timestamp_count += 1
+                add_stamp(stamp, TIMESTAMP_KIND_CODES[match.lastgroup], level)
+            else:
+                count_line(level)
+
+            # Technology indicators
+            for hit in hits:
+                if hit >= tech_offset:
+                    found_tech.add(hit - tech_offset)
+
+            # Error patterns, timing each one on a sample of the lines
+            if not i & sample_mask:
+                sampled_lines += 1
+                for j, search in enumerate(pattern_searches):
+                    started = perf_counter()
+                    search(text)
+                    pattern_seconds[j] += perf_counter() - started
+
+            error_index = first_error(text)
+            if error_index < 0 and line_level >= LEVEL_ERROR:
+                error_index = first_error(line)
+            if error_index >= 0:
+                pattern_hits[error_index] += 1
+                if error_index < primary_index:
+                    primary_index = error_index
+                    primary_line = i
+                    primary_text = line
+                    primary_context = list(previous)
+                    primary_context.append(line)
+                    pending.append([primary_context, CONTEXT_RADIUS])
+
+                if not in_trace and len(line.strip()) >= 5:
+                    if line_level:
+                        severity = LEVEL_SEVERITIES[line_level]
+                    elif not critical_ids.isdisjoint(hits):
+                        severity = CRITICAL
+                    elif is_error:
+                        severity = HIGH
+                    elif is_warning:
+                        severity = MEDIUM
+                    else:
+                        severity = LOW
+
+                    index = all_errors.add(i + 1, error_index, line, severity)
+                    error_clusters.add(line, i + 1, error_types[error_index])
+                    if all_errors.offer_context(index):
+                        context = list(previous)
+                        context.append(line)
+                        pending.append([context, CONTEXT_RADIUS])
+                        all_errors.set_context(index, context)
+
+            # Performance issues
+            performance_index = first_performance(text)
+            if performance_index >= 0:
+                performance_issues.add(i + 1, performance_index, line)
+
+            # Durations and sizes, per endpoint or logger; read from the whole
+            # line, so the fields of a structured line count too
+            duration, size = measure(line)
+            if duration is not None or size is not None:
+                key = endpoint_key(line)
+                if key is None and fields is not None:
+                    key = logger
+                if duration is not None:
+                    durations.add(key, duration)
+                if size is not None:
+                    sizes.add(key, size)
+
+            # Code snippets, for callers without the whole content at hand
+            if collect_snippets:
+                if open_block is not None:
+                    if line.startswith('```'):
+                        block_count += 1
+                        if block_limit is None or len(code_blocks) < block_limit:
+                            code_blocks.append('\n'.join(open_block))
+                        open_block = None
+                    else:
+                        open_block.append(line)
+                elif '```' in line and CODE_FENCE_REGEX.search(line):
+                    open_block = []
+                if ':' in line:
+                    references = FILE_REFERENCE_REGEX.findall(line)
+                    if references:
+                        reference_count += len(references)
+                        if reference_limit is None or len(file_references) < reference_limit:
+                            file_references.extend(references)
+
+            previous.append(line)
+
+        self.pattern_stats.record_scan(pattern_hits, pattern_seconds, sampled_lines, total_lines)
+
+        return {
+            'counts': {
+                'total_lines': total_lines,
+                'error_count': error_count,
+                'warning_count': warning_count,
+                'info_count': info_count,
+                'debug_count': debug_count,
+                'exception_count': exception_count,
+                'timestamp_count': timestamp_count
+            },
+            'first_timestamp': first_timestamp,
+            'last_timestamp': last_timestamp,
+            'time_series': time_series,
+            'found_tech': found_tech,
+            'log_format': log_format,
+            'logger_errors': logger_errors,
+            'all_errors': all_errors,
+            'performance_issues': performance_issues,
+            'error_clusters': error_clusters,
+            'durations': durations,
+            'sizes': sizes,
+            'exceptions': traces.traces,
+            'exception_total': traces.count,
+            'trace_state': traces.state(),
+            'resumed_trace': trace_state is not None,
+            'primary_index': primary_index if primary_line >= 0 else None,
+            'primary_line': primary_line,
+            'primary_text': primary_text,
+            'primary_context': primary_context,
+            'head': head,
+            'tail': list(previous),
+            'code_snippets': {
+                'blocks': code_blocks,
+                'file_references': file_references[:reference_limit],
+                'block_count': block_count,
+                'reference_count': reference_count
+            } if collect_snippets else None
+        }
+
+    def empty_scan(self):
+        """
+        Create a scan of no lines, to grow with append().
+
+        Returns:
+            dict: A scan result covering nothing yet
+        """
+        return {
+            'counts': {
+                'total_lines': 0,
+                'error_count': 0,
+                'warning_count': 0,
+                'info_count': 0,
+                'debug_count': 0,
+                'exception_count': 0,
+                'timestamp_count': 0
+            },
+            'first_timestamp': None,
+            'last_timestamp': None,
+            'time_series': TimeSeries(),
+            'found_tech': set(),
+            'log_format': None,
+            'logger_errors': Counter(),
+            'all_errors': self.error_store(),
+            'performance_issues': self.performance_store(),
+            'error_clusters': TemplateMiner(),
+            'durations': KeyedSketches(),
+            'sizes': KeyedSketches(),
+            'exceptions': [],
+            'exception_total': 0,
+            'trace_state': (None, None),
+            'resumed_trace': False,
+            'primary_index': None,
+            'primary_line': -1,
+            'primary_text': None,
+            'primary_context': [],
+            'head': [],
+            'tail': [],
+            'incomplete': [],
+            'code_snippets': {'blocks': [], 'file_references': [], 'block_count': 0, 'reference_count': 0}
+        }
+
+    def error_store(self):
+        """Create an empty store for errors, with this scanner's budgets."""
+        return FindingStore(self.error_types, self.context_limit, self.sample_limit, self.edge_limit)
+
+    def performance_store(self):
+        """Create an empty store for performance issues, with this scanner's budgets."""
+        return FindingStore(PERFORMANCE_KINDS, 0, self.sample_limit, self.edge_limit)
+
+    def trace_assembler(self, state=None):
+        """Create a stack trace assembler that keeps this scanner's budget of traces."""
+        return StackTraceAssembler(state, self._trace_limit())
+
+    def merge(self, partials):
+        """
+        Merge scans of consecutive pieces of one log into a single scan.
+
+        Args:
+            partials (list): Results of scan() for consecutive pieces, in log order
+
+        Returns:
+            dict: A scan result covering all pieces
+        """
+        merged = self.empty_scan()
+        for partial in partials:
+            self.append(merged, partial)
+        return merged
+
+    def append(self, merged, partial):
+        """
+        Fold the scan of the next piece of a log into a merged scan, in place.
+
+        Counters are summed, line numbers are shifted to their position in the
+        whole log, and context windows cut short by a piece boundary are completed
+        with the tail of the pieces before them and the head of the pieces after.
+        Windows still short of lines at the end of the merged scan are kept in it,
+        so a scan can keep growing as more of the log arrives.
+
+        Args:
+            merged (dict): Result of empty_scan() or merge(), updated in place
+            partial (dict): Result of scan() for the piece right after ``merged``
+        """
+        line_offset = merged['counts']['total_lines']
+        tail = merged['tail']
+        incomplete = merged['incomplete']
+
+        # Windows from earlier pieces take the first lines of this one
+        if incomplete:
+            for window in incomplete:
+                lines = partial['head'][:window[1]]
+                window[0].extend(lines)
+                window[1] -= len(lines)
+            incomplete[:] = [window for window in incomplete if window[1] > 0]
+
+        merged['all_errors'].extend(
+            partial['all_errors'], line_offset,
+            lambda local_line, window: self._stitch(window, local_line, line_offset, tail, incomplete))
+        merged['performance_issues'].extend(partial['performance_issues'], line_offset)
+        merged['error_clusters'].merge(partial['error_clusters'], line_offset)
+        merged['durations'].merge(partial['durations'])
+        merged['sizes'].merge(partial['sizes'])
+
+        # A piece scanned on its own starts on a line that ends any trace left
+        # open; a piece that continued the open trace holds all of it
+        trace_limit = self._trace_limit()
+        open_trace = merged['trace_state'][0]
+        if open_trace is not None and not partial['resumed_trace']:
+            merged['exceptions'] = join_traces(merged['exceptions'], merged['exception_total'],
+                                               [open_trace], 1, trace_limit)
+            merged['exception_total'] += 1
+        merged['exceptions'] = join_traces(merged['exceptions'], merged['exception_total'],
+                                           [shift_trace(trace, line_offset) for trace in partial['exceptions']],
+                                           partial['exception_total'], trace_limit)
+        merged['exception_total'] += partial['exception_total']
+        open_trace, last_line = partial['trace_state']
+        merged['trace_state'] = (shift_trace(open_trace, line_offset) if open_trace is not None else None,
+                                 last_line)
+
+        if partial['primary_index'] is not None and (
+                merged['primary_index'] is None or partial['primary_index'] < merged['primary_index']):
+            merged['primary_index'] = partial['primary_index']
+            merged['primary_line'] = partial['primary_line'] + line_offset
+            merged['primary_text'] = partial['primary_text']
+            merged['primary_context'] = self._stitch(partial['primary_context'], partial['primary_line'],
+                                                     line_offset, tail, incomplete)
+
+        for key, value in partial['counts'].items():
+            merged['counts'][key] += value
+        if partial['first_timestamp'] is not None:
+            if merged['first_timestamp'] is None:
+                merged['first_timestamp'] = partial['first_timestamp']
+            merged['last_timestamp'] = partial['last_timestamp']
+        merged['time_series'].merge(partial['time_series'])
+        merged['found_tech'].update(partial['found_tech'])
+        merged['log_format'] = merged['log_format'] or partial['log_format']
+        merged['logger_errors'].update(partial['logger_errors'])
+
+        if len(merged['head']) < 10:
+            merged['head'].extend(partial['head'][:10 - len(merged['head'])])
+        merged['tail'] = (tail + partial['tail'])[-CONTEXT_RADIUS:]
+
+        if partial['code_snippets']:
+            block_limit, reference_limit = self._snippet_limits()
+            snippets = merged['code_snippets']
+            snippets['blocks'] = (snippets['blocks'] + partial['code_snippets']['blocks'])[:block_limit]
+            snippets['file_references'] = (snippets['file_references'] +
+                                           partial['code_snippets']['file_references'])[:reference_limit]
+            snippets['block_count'] += partial['code_snippets']['block_count']
+            snippets['reference_count'] += partial['code_snippets']['reference_count']
+
+    def next_trace_state(self, merged):
+        """
+        Get the state to scan the lines that follow a merged scan with, so a
+        stack trace still open at its end can continue.
+
+        Args:
+            merged (dict): Result of empty_scan() or merge()
+
+        Returns:
+            tuple: trace_state for scan()
+        """
+        open_trace, last_line = merged['trace_state']
+        if open_trace is not None:
+            open_trace = shift_trace(open_trace, -merged['counts']['total_lines'])
+        return open_trace, last_line
+
+    def _stitch(self, context, local_line, line_offset, tail, incomplete):
+        """Complete a context window that was cut short by a piece boundary."""
+        before = min(local_line, CONTEXT_RADIUS)
+        after = len(context) - before - 1
+
+        missing_before = min(local_line + line_offset, CONTEXT_RADIUS) - before
+        if missing_before > 0:
+            context = tail[-missing_before:] + context
+        else:
+            context = list(context)
+
+        # Fewer lines after than the radius means the piece ended first
+        if after < CONTEXT_RADIUS:
+            incomplete.append([context, CONTEXT_RADIUS - after])
+
+        return context
+
+    def summarize(self, scan):
+        """
+        Derive the metrics and technology sections from a scan result.
+
+        Args:
+            scan (dict): Result of scan() or merge()
+
+        Returns:
+            dict: The same scan with metrics, technology and primary_error_type added
+        """
+        counts = scan['counts']
+        total_lines = counts['total_lines']
+
+        if counts['timestamp_count'] >= 2:
+            time_metrics = {
+                'first_timestamp': scan['first_timestamp'],
+                'last_timestamp': scan['last_timestamp'],
+                'timestamp_count': counts['timestamp_count']
+            }
+            time_metrics.update(scan['time_series'].summary())
+        else:
+            time_metrics = {'timestamp_count': counts['timestamp_count']}
+
+        scan['metrics'] = {
+            'total_lines': total_lines,
+            'error_count': counts['error_count'],
+            'warning_count': counts['warning_count'],
+            'info_count': counts['info_count'],
+            'debug_count': counts['debug_count'],
+            'exception_count': counts['exception_count'],
+            'error_ratio': counts['error_count'] / total_lines if total_lines > 0 else 0,
+            'time_metrics': time_metrics,
+            'log_format': scan['log_format'] or 'text',
+            'top_error_loggers': [{'logger': logger, 'errors': errors}
+                                  for logger, errors in scan['logger_errors'].most_common(TOP_ERROR_LOGGERS)]
+        }
+        scan['technology'] = self._pick_technology(scan['found_tech'])
+        scan['primary_error_type'] = (self.error_types[scan['primary_index']]
+                                      if scan['primary_index'] is not None else None)
+        return scan
+
+    def error_entries(self, store):
+        """Materialize an error store as the all_errors list of an analysis."""
+        return [{
+            'error_type': error_type,
+            'error_message': line,
+            'line_number': line_number,
+            'context': context if context is not None else [],
+            'severity': severity
+        } for line_number, error_type, line, severity, context in store.rows()]
+
+    def exception_entries(self, scan):
+        """Describe the stack traces of a scan, including one still open at its end, as the exceptions list of an analysis."""
+        return [trace_entry(trace) for trace in self._kept_traces(scan)]
+
+    def _kept_traces(self, scan):
+        """The stack traces of a scan within its budget, including one still open at its end."""
+        traces = scan['exceptions']
+        if scan['trace_state'][0] is not None:
+            traces = join_traces(traces, scan['exception_total'], [scan['trace_state'][0]], 1, self._trace_limit())
+        return traces
+
+    def _trace_limit(self):
+        """Stack traces kept from each end of a log, None to keep all of them."""
+        return self.edge_limit if self.sample_limit is not None else None
+
+    def _snippet_limits(self):
+        """Code blocks and file references kept from the start of a log, None to keep all of them."""
+        if self.sample_limit is None:
+            return None, None
+        return self.edge_limit, self.sample_limit
+
+    def code_snippets(self, blocks, references):
+        """
+        Collect the code snippets of a log within the output budget.
+
+        Args:
+            blocks (iterable): Code blocks, in log order
+            references (iterable): (file, line number) references, in log order
+
+        Returns:
+            dict: The first blocks and file_references, and block_count and
+                reference_count over all of them
+        """
+        block_limit, reference_limit = self._snippet_limits()
+        snippets = {'blocks': [], 'file_references': [], 'block_count': 0, 'reference_count': 0}
+        for key, count_key, items, limit in (('blocks', 'block_count', blocks, block_limit),
+                                             ('file_references', 'reference_count', references, reference_limit)):
+            kept = snippets[key]
+            for item in items:
+                snippets[count_key] += 1
+                if limit is None or len(kept) < limit:
+                    kept.append(item)
+        return snippets
+
+    def sampling(self, scan, code_snippets=None):
+        """
+        Describe how much of each list of an analysis its output budget dropped.
+
+        Args:
+            scan (dict): Result of scan() or merge()
+            code_snippets (dict, optional): Result of code_snippets(), for a scan
+                that did not collect its own
+
+        Returns:
+            dict: The budget, and the exact and returned counts of all_errors,
+                performance_issues, exceptions and code snippets, plus how
+                many error lines were clustered only approximately
+        """
+        if code_snippets is None:
+            code_snippets = scan['code_snippets']
+        exception_total = scan['exception_total'] + (scan['trace_state'][0] is not None)
+        exceptions = len(self._kept_traces(scan))
+        return {
+            'sample_limit': self.sample_limit,
+            'edge_limit': self._trace_limit(),
+            'all_errors': scan['all_errors'].sampling(),
+            'performance_issues': scan['performance_issues'].sampling(),
+            'error_clusters': scan['error_clusters'].sampling(),
+            'exceptions': _dropped(exception_total, exceptions),
+            'code_blocks': _dropped(code_snippets['block_count'], len(code_snippets['blocks'])),
+            'file_references': _dropped(code_snippets['reference_count'], len(code_snippets['file_references']))
+        }
+
+    def performance_entries(self, store):
+        """Materialize a performance store as the performance_issues list of an analysis."""
+        return [{
+            'type': issue_type,
+            'description': PERFORMANCE_DESCRIPTIONS[issue_type],
+            'line': line,
+            'line_number': line_number,
+            'duration_ms': parse_duration(line)
+        } for line_number, issue_type, line, _, _ in store.rows()]
+
+    def _pick_technology(self, found):
+        """Pick the technology with the most distinct indicators found."""
+        tech_counts = {tech: 0 for tech in TECH_INDICATORS}
+        for index in found:
+            tech_counts[self.tech_entries[index][0]] += 1
+
+        if any(tech_counts.values()):
+            return max(tech_counts.items(), key=lambda x: x[1])[0]
+
+        return 'unknown'
@@ -0,0 +1,321 @@
+import io
+import os
+import re
+import bz2
+import gzip
+import zlib
+import lzma
+import functools
+
+# Leading bytes of each compressed format, longest first
+COMPRESSION_MAGIC = [
+    (b'\xfd7zXZ\x00', 'xz'),
+    (b'\x28\xb5\x2f\xfd', 'zstd'),
+    (b'\x1f\x8b', 'gzip'),
+    (b'BZh', 'bz2')
+]
+MAGIC_BYTES = max(len(magic) for magic, _ in COMPRESSION_MAGIC)
+
+# Read buffer of the streams handed to the analyzer
+DEFAULT_BUFFER_BYTES = 1024 * 1024
+
+# Decompressed size of a log uploaded to the app; logs full of errors
+# stream through the analyzer at about 1 MB per second
+DEFAULT_MAX_UPLOAD_BYTES = 32 * 1024 * 1024
+
+# Suffixes of rotated logs: app.log.1, app.log.2.gz, app.log-20240101.xz, ...
+_ROTATED_SUFFIX = re.compile(r'^(?:\.(?P<number>\d+)|-(?P<date>\d{8}(?:\d{2})?(?:-\d+)?))'
+                             r'(?:\.(?:gz|bz2|xz|zst))?$')
+
+
+class CorruptLog(ValueError):
+    """Raised when a compressed log is truncated or corrupt."""
+
+
+class LogTooLarge(ValueError):
+    """Raised when a log is read past the size it was opened with."""
+
+
+def detect_compression(head):
+    """
+    Identify the compression of some data from its first bytes.
+
+    Args:
+        head (bytes): At least the first MAGIC_BYTES bytes of the data, or all of it
+
+    Returns:
+        str: 'gzip', 'bz2', 'xz' or 'zstd', or None for uncompressed data
+    """
+    for magic, kind in COMPRESSION_MAGIC:
+        if head.startswith(magic):
+            return kind
+    return None
+
+
+def file_compression(path):
+    """
+    Identify the compression of a file from its first bytes.
+
+    Args:
+        path (str): Path to the file
+
+    Returns:
+        str: The compression as detect_compression() names it, or None
+    """
+    with open(path, 'rb') as f:
+        return detect_compression(f.read(MAGIC_BYTES))
+
+
+def open_log(source, close_source=False, buffer_size=DEFAULT_BUFFER_BYTES, max_bytes=None):
+    """
+    Open a log for reading, decompressing it on the fly if needed.
+
+    The compression is recognized by its magic bytes, whatever the file is
+    called. Compressed data is decompressed as it is read, so the whole
+    decompressed log is never held in memory. Files of concatenated
+    compressed members, as written by ``cat a.gz b.gz``, read as one.
+
+    Args:
+        source (str or file): Path to the log, or a file object opened in
+            binary mode, such as an upload or an HTTP response body
+        close_source (bool): Close the file object along with the returned
+            stream; a file opened from a path is always closed
+        buffer_size (int): Size of the read buffer
+        max_bytes (int, optional): Most bytes of decompressed log to read
+
+    Returns:
+        io.BufferedReader: The decompressed log, iterable by lines
+
+    Raises:
+        OSError: If the file cannot be opened
+        ValueError: If the log is zstd-compressed and the zstandard package
+            is not installed
+
+    Reading the returned stream raises CorruptLog if the compressed data
+    turns out to be truncated or corrupt, and LogTooLarge once it goes past
+    max_bytes, so a small compressed file cannot unpack to an endless log.
+    """
+    if isinstance(source, (str, os.PathLike)):
+        source = open(source, 'rb')
+        close_source = True
+
+    # Put the bytes read to identify the format back in front of the rest
+    head = _read_head(source)
+    kind = detect_compression(head)
+    raw = _ChainReader([lambda: io.BytesIO(head), lambda: source], close_streams=close_source,
+                       max_bytes=max_bytes if kind is None else None)
+    stream = io.BufferedReader(raw, buffer_size)
+    if kind is None:
+        return stream
+
+    try:
+        decompressed, errors = _decompressor(kind, stream)
+    except ValueError:
+        stream.close()
+        raise
+    return io.BufferedReader(_ChainReader([lambda: decompressed], resources=[stream], corrupt_errors=errors,
+                                          max_bytes=max_bytes), buffer_size)
+
+
+def open_logs(sources, buffer_size=DEFAULT_BUFFER_BYTES):
+    """
+    Open several logs as one stream, read in the given order.
+
+    Each log is opened, and decompressed if needed, only once the previous
+    one was read to the end. A log that does not end with a newline is
+    followed by one, so its last line never runs into the next log's first.
+
+    Args:
+        sources (list): Paths to the logs, or binary file objects
+        buffer_size (int): Size of the read buffer
+
+    Returns:
+        io.BufferedReader: The logs one after the other, iterable by lines
+    """
+    openers = [functools.partial(open_log, source, close_source=True, buffer_size=buffer_size)
+               for source in sources]
+    return io.BufferedReader(_ChainReader(openers, separate_lines=True), buffer_size)
+
+
+def rotated_files(path):
+    """
+    Find the files of a rotated log, oldest first.
+
+    Recognizes the numbered scheme of logrotate and logging's
+    RotatingFileHandler (``app.log.2.gz``, ``app.log.1``, ``app.log``, where
+    a higher number is older) and the date-stamped one of logrotate's
+    dateext (``app.log-20240101.gz``), compressed or not.
+
+    Args:
+        path (str): Path to the current log, e.g. ``/var/log/app.log``
+
+    Returns:
+        list: Paths of the rotated files that exist, oldest first, ending with
+            ``path`` itself if it exists
+    """
+    directory, name = os.path.split(path)
+    try:
+        entries = os.listdir(directory or '.')
+    except OSError:
+        entries = []
+
+    dated = []
+    numbered = []
+    for entry in entries:
+        if not entry.startswith(name) or entry == name:
+            continue
+        match = _ROTATED_SUFFIX.match(entry[len(name):])
+        if match is None:
+            continue
+        if match.group('number') is not None:
+            numbered.append((int(match.group('number')), entry))
+        else:
+            dated.append((match.group('date'), entry))
+
+    # Date-stamped files sort oldest first; numbered ones count back in time
+    ordered = [entry for _, entry in sorted(dated)]
+    ordered += [entry for _, entry in sorted(numbered, reverse=True)]
+    files = [os.path.join(directory, entry) for entry in ordered]
+    if os.path.exists(path):
+        files.append(path)
+    return files
+
+
+def open_rotated(path, buffer_size=DEFAULT_BUFFER_BYTES):
+    """
+    Open every file of a rotated log as one stream, oldest first.
+
+    Args:
+        path (str): Path to the current log
+        buffer_size (int): Size of the read buffer
+
+    Returns:
+        io.BufferedReader: The whole history of the log, iterable by lines
+
+    Raises:
+        FileNotFoundError: If neither the log nor any rotated file of it exists
+    """
+    files = rotated_files(path)
+    if not files:
+        raise FileNotFoundError(f"No log or rotated log files found for {path}")
+    return open_logs(files, buffer_size)
+
+
+def _read_head(f):
+    """Read the first MAGIC_BYTES bytes of a stream, fewer only at its end."""
+    head = b''
+    while len(head) < MAGIC_BYTES:
+        data = f.read(MAGIC_BYTES - len(head))
+        if not data:
+            break
+        head += data
+    return head
+
+
+def _decompressor(kind, f):
+    """Wrap a binary stream in a decompressing reader, and return it with the errors it raises on bad data."""
+    # Truncated data raises EOFError; corrupt data raises the decompressor's own error
+    errors = (EOFError, OSError, zlib.error, lzma.LZMAError)
+    if kind == 'gzip':
+        return gzip.GzipFile(fileobj=f, mode='rb'), errors
+    if kind == 'bz2':
+        return bz2.BZ2File(f), errors
+    if kind == 'xz':
+        return lzma.LZMAFile(f), errors
+
+    try:
+        import zstandard
+    except ImportError:
+        raise ValueError("Reading zstd-compressed logs requires the zstandard package")
+    return (zstandard.ZstdDecompressor().stream_reader(f, read_across_frames=True, closefd=False),
+            errors + (zstandard.ZstdError,))
+
+
+class _ChainReader(io.RawIOBase):
+    """
+    Reads a sequence of binary streams as a single one.
+
+    Streams are produced by openers called one at a time, each once the
+    previous stream is exhausted, so only one of them is open at once.
+    """
+
+    def __init__(self, openers, separate_lines=False, close_streams=True, resources=(), corrupt_errors=(),
+                 max_bytes=None):
+        """
+        Create a reader.
+
+        Args:
+            openers (iterable): Callables returning the streams, in order
+            separate_lines (bool): Insert a newline between streams when the
+                previous one did not end with one
+            close_streams (bool): Close each stream once it is exhausted
+            resources (list): Further objects to close along with the reader
+            corrupt_errors (tuple): Errors of the streams that mean their data
+                is corrupt, raised as CorruptLog
+            max_bytes (int, optional): Bytes that may be read before LogTooLarge
+                is raised
+        """
+        self._openers = iter(openers)
+        self._separate_lines = separate_lines
+        self._close_streams = close_streams
+        self._resources = list(resources)
+        self._corrupt_errors = corrupt_errors
+        self._max_bytes = max_bytes
+        self._total = 0
+        self._current = None
+        self._read = None
+        self._pending = b''
+        self._ended_line = True
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        view = memoryview(buffer).cast('B')
+        while True:
+            if self._pending:
+                size = min(len(view), len(self._pending))
+                view[:size] = self._pending[:size]
+                self._pending = self._pending[size:]
+                return size
+
+            if self._current is None:
+                opener = next(self._openers, None)
+                if opener is None:
+                    return 0
+                self._current = opener()
+                self._read = getattr(self._current, 'read1', self._current.read)
+                if self._separate_lines and not self._ended_line:
+                    self._pending = b'\n'
+                    self._ended_line = True
+                continue
+
+            try:
+                data = self._read(len(view))
+            except self._corrupt_errors as e:
+                raise CorruptLog(str(e)) from e
+            if not data:
+                self._finish_current()
+                continue
+
+            size = len(data)
+            self._total += size
+            if self._max_bytes is not None and self._total > self._max_bytes:
+                raise LogTooLarge(f"The log is larger than {self._max_bytes} bytes")
+            view[:size] = data
+            self._ended_line = data.endswith(b'\n')
+            return size
+
+    def close(self):
+        if not self.closed:
+            self._finish_current()
+            for resource in self._resources:
+                resource.close()
+        super().close()
+
+    def _finish_current(self):
+        """Close the current stream, if any, and move on."""
+        if self._current is not None and self._close_streams:
+            self._current.close()
+        self._current = None
+        self._read = None
@@ -0,0 +1,155 @@
+import re
+
+# Duration units, in milliseconds
+DURATION_UNITS = {
+    'ns': 1e-6, 'nanosecond': 1e-6, 'nanoseconds': 1e-6,
+    'us': 1e-3, 'µs': 1e-3, 'μs': 1e-3, 'microsecond': 1e-3, 'microseconds': 1e-3,
+    'ms': 1.0, 'millisecond': 1.0, 'milliseconds': 1.0,
+    's': 1000.0, 'sec': 1000.0, 'secs': 1000.0, 'second': 1000.0, 'seconds': 1000.0,
+    'm': 60000.0, 'min': 60000.0, 'mins': 60000.0, 'minute': 60000.0, 'minutes': 60000.0
+}
+
+# Size units, in bytes
+SIZE_UNITS = {
+    'b': 1, 'byte': 1, 'bytes': 1,
+    'kb': 1e3, 'mb': 1e6, 'gb': 1e9, 'tb': 1e12,
+    'kib': 1024, 'mib': 1024 ** 2, 'gib': 1024 ** 3, 'tib': 1024 ** 4
+}
+
+# A number, possibly with thousands separators ("1,234.5"); digits right after
+# "<digit>," belong to a number that cannot be read, such as "3,14" or "1,2345"
+_NUMBER = r'(?<!\d,)(\d{1,3}(?:,\d{3})+(?!\d)(?:\.\d+)?|\d+(?:\.\d+)?)'
+_DURATION_UNIT = r'(nanoseconds?|microseconds?|milliseconds?|seconds?|minutes?|ns|us|µs|μs|ms|secs?|mins?|s|m)'
+_SIZE_UNIT = r'([kmgt]i?b|bytes?)'
+
+# A duration after a keyword ("took 8423ms", "duration=1.5s", "duration_ms": 12,
+# "elapsed: 300 us"), a number with a unit only durations have ("3.2ms"), or
+# "in 2s". Keyword values without a unit count as milliseconds, but only
+# after "=" or ":", so "took 3 attempts" is not one.
+DURATION_REGEX = re.compile(
+    r'(?i)\b(?:took|duration|elapsed|latency|response[_ ]?time|request[_ ]?time|time[_ ]?taken|exec(?:ution)?[_ ]?time)'
+    r'(?:[_ ](ns|us|ms|s|sec|secs|seconds))?\b["\']?[ \t]*([:=]?)[ \t]*(?:in[ \t]+|of[ \t]+)?"?' +
+    _NUMBER + r'(?:[ \t]?' + _DURATION_UNIT + r')?\b' +
+    r'|\b' + _NUMBER + r'[ \t]?(ns|us|µs|μs|ms)\b' +
+    r'|\bin[ \t]+' + _NUMBER + r'[ \t]?(s|secs?|seconds?)\b', re.ASCII)
+
+# A size after a keyword ("size=512", "bytes_sent: 1024", "length=2MB") or a
+# number with a size unit ("1.5 MB", "512KiB")
+SIZE_REGEX = re.compile(
+    r'(?i)\b(?:size|bytes|length|content[_-]length|body[_ ]bytes[_ ]sent|bytes[_ ](?:sent|received|read|written))'
+    r'\b["\']?[ \t]*[:=][ \t]*"?' + _NUMBER + r'(?:[ \t]?' + _SIZE_UNIT + r')?\b' +
+    r'|\b' + _NUMBER + r'[ \t]?([kmgt]i?b|bytes)\b', re.ASCII)
+
+# Every duration or size has a number with a unit or one of the keywords of
+# the patterns above; the memory-mapped scan looks for these in the whole
+# file to find the lines worth measuring
+UNIT_GATE_PATTERN = r'\d[ \t]?(?:[nuµμmNUMS]?[sS]|[kKmMgGtT]i?[bB]|[bB]yte|[mM]in)'
+MEASURE_KEYWORDS = ('time', 'took', 'duration', 'elapsed', 'latency', 'size', 'bytes', 'length')
+
+# The patterns above for lowercased lines, which they match faster without
+# IGNORECASE
+_DURATION_LOWER = re.compile(DURATION_REGEX.pattern[len('(?i)'):], re.ASCII)
+_SIZE_LOWER = re.compile(SIZE_REGEX.pattern[len('(?i)'):], re.ASCII)
+
+# An HTTP request line inside a log line; path segments that are ids are masked
+ENDPOINT_REGEX = re.compile(r'\b(GET|POST|PUT|PATCH|DELETE|HEAD|OPTIONS)[ \t]+(/[^\s?#"]*)', re.ASCII)
+_ID_SEGMENT = re.compile(r'/(?:\d+|[0-9a-fA-F]{8,}|[0-9a-fA-F]{8}(?:-[0-9a-fA-F]{4}){3}-[0-9a-fA-F]{12})(?=/|$)')
+
+
+def measure(line):
+    """
+    Find the first duration and the first size in a line.
+
+    Args:
+        line (str): A log line
+
+    Returns:
+        tuple: Duration in milliseconds and size in bytes, each None if the
+            line has none
+    """
+    # Each pattern only runs on lines holding text every one of its matches
+    # holds: a keyword or a unit, lowercased. The tests are spelled out as
+    # they are much faster than a loop.
+    lowered = line.lower()
+    duration = size = None
+    if ('ms' in lowered or 'time' in lowered or 'took' in lowered or 'in ' in lowered or 'in\t' in lowered or
+            'duration' in lowered or 'elapsed' in lowered or 'latency' in lowered or 'ns' in lowered or
+            'us' in lowered or 'µs' in lowered or 'μs' in lowered):
+        duration = _duration(_DURATION_LOWER, lowered)
+    if ('size' in lowered or 'bytes' in lowered or 'length' in lowered or 'kb' in lowered or 'mb' in lowered or
+            'gb' in lowered or 'tb' in lowered or 'ib' in lowered):
+        size = _size(_SIZE_LOWER, lowered)
+    return duration, size
+
+
+def parse_duration(line):
+    """
+    Find the first duration in a line.
+
+    Args:
+        line (str): A log line
+
+    Returns:
+        float: The duration in milliseconds, or None
+    """
+    return _duration(DURATION_REGEX, line)
+
+
+def parse_size(line):
+    """
+    Find the first size in a line.
+
+    Args:
+        line (str): A log line
+
+    Returns:
+        float: The size in bytes, or None
+    """
+    return _size(SIZE_REGEX, line)
+
+
+def endpoint_key(line):
+    """
+    Name the HTTP endpoint a line is about, with ids in its path masked.
+
+    Args:
+        line (str): A log line
+
+    Returns:
+        str: Method and path, such as ``GET /users/<*>``, or None
+    """
+    match = ENDPOINT_REGEX.search(line)
+    if match is None:
+        return None
+    return match.group(1) + ' ' + _ID_SEGMENT.sub('/<*>', match.group(2))
+
+
+def _number(text):
+    """Value of a matched number, without its thousands separators."""
+    return float(text.replace(',', '')) if ',' in text else float(text)
+
+
+def _duration(regex, line):
+    """First duration in a line matched by a duration pattern, in milliseconds."""
+    for match in regex.finditer(line):
+        suffix, separator, value, unit, bare_value, bare_unit, in_value, in_unit = match.groups()
+        if value is not None:
+            unit = unit or suffix
+            if unit is None and not separator:
+                continue
+            return _number(value) * (DURATION_UNITS[unit.lower()] if unit else 1.0)
+        if bare_value is not None:
+            return _number(bare_value) * DURATION_UNITS[bare_unit.lower()]
+        return _number(in_value) * DURATION_UNITS[in_unit.lower()]
+    return None
+
+
+def _size(regex, line):
+    """First size in a line matched by a size pattern, in bytes."""
+    match = regex.search(line)
+    if match is None:
+        return None
+    value, unit, bare_value, bare_unit = match.groups()
+    if value is not None:
+        return _number(value) * (SIZE_UNITS[unit.lower()] if unit else 1)
+    return _number(bare_value) * SIZE_UNITS[bare_unit.lower()]
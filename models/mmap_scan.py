@@ -0,0 +1,383 @@
+import os
+import re
+import mmap
+import itertools
+from collections import Counter
+import numpy as np
+from .template_miner import TemplateMiner
+from .time_series import TimeSeries, TIMESTAMP_KIND_CODES, DEFAULT_BATCH_SIZE
+from .stack_traces import CONTINUATION_PREFIXES
+from .measurements import measure, endpoint_key, UNIT_GATE_PATTERN, MEASURE_KEYWORDS
+from .quantile_sketch import KeyedSketches
+from .log_scanner import (OrderedMatcher, CONTEXT_RADIUS, TIMESTAMP_PATTERN,
+                          PERFORMANCE_PATTERNS, CODE_BLOCK_REGEX, FILE_REFERENCE_REGEX,
+                          LOW, MEDIUM, HIGH, CRITICAL)
+
+# Bytes examined per step while building the line-offset index
+INDEX_BLOCK_BYTES = 16 * 1024 * 1024
+
+# Lines that may continue a stack trace: blank, indented or a continuation
+# marker; traces are assembled from these and the lines next to them
+TRACE_LINE_REGEX = re.compile(rb'(?m)^(?:[ \t\r\n]|$|' +
+                              b'|'.join(re.escape(prefix.encode('ascii')) for prefix in CONTINUATION_PREFIXES) +
+                              rb')')
+
+
+# Lines that may hold a duration or a size
+MEASURE_LINE_REGEX = re.compile(UNIT_GATE_PATTERN.encode('utf-8') + b'|' +
+                                b'|'.join(keyword.encode('ascii') for keyword in MEASURE_KEYWORDS),
+                                re.IGNORECASE)
+
+
+def _binary(regex):
+    """Compile the bytes counterpart of a str regex."""
+    return re.compile(regex.pattern.encode('utf-8'), regex.flags & ~re.UNICODE)
+
+
+class MappedLogScanner:
+    """
+    Scans a log file through a read-only memory map with byte-level regexes.
+
+    The regexes run over the whole mapping, so lines without a finding are
+    skipped inside the regex engine and never copied or decoded. A line-offset
+    index is built on the fly to turn match positions into line numbers, and
+    only lines that end up in the result (errors, performance issues and their
+    context windows) are decoded. Pages come from the OS page cache, so every
+    process analyzing the same file shares them. Levels are classified by
+    keyword, as in free-form text; logs in a structured format are scanned
+    line by line instead. Stack traces are assembled from the lines that may
+    continue one and their neighbours only.
+    """
+
+    def __init__(self, scanner):
+        """
+        Compile bytes versions of a LogScanner's patterns.
+
+        Args:
+            scanner (LogScanner): The scanner whose patterns and tables to mirror
+
+        Raises:
+            ValueError: If a pattern cannot be matched against bytes
+        """
+        self.scanner = scanner
+        try:
+            self.error_matcher = OrderedMatcher(list(scanner.error_patterns.values()), binary=True)
+            self.performance_matcher = OrderedMatcher([pattern for _, _, pattern in PERFORMANCE_PATTERNS],
+                                                      binary=True)
+            # Level keywords are counted over the whole mapping, case-insensitively
+            self.level_regexes = {level: scanner.keywords.compile(ids, binary=True, flags=re.IGNORECASE)
+                                  for level, ids in scanner.level_ids.items()}
+        except (re.error, UnicodeEncodeError) as e:
+            raise ValueError(f"Patterns cannot be compiled for byte-level matching: {e}")
+
+        if self.error_matcher.combined is None or self.performance_matcher.combined is None:
+            raise ValueError("Patterns cannot be combined for byte-level matching")
+
+        self.timestamp_regex = re.compile(TIMESTAMP_PATTERN.encode('utf-8'))
+        self.code_block_regex = _binary(CODE_BLOCK_REGEX)
+        self.file_reference_regex = _binary(FILE_REFERENCE_REGEX)
+
+    def tech_gate(self, found_tech):
+        """Compile a bytes regex for the technology indicators not found yet."""
+        scanner = self.scanner
+        return scanner.keywords.compile([i + scanner.tech_offset for i in range(len(scanner.tech_entries))
+                                         if i not in found_tech],
+                                        binary=True, flags=re.IGNORECASE, word_bounded=True)
+
+    def scan(self, path):
+        """
+        Scan a log file without reading it into memory.
+
+        Args:
+            path (str): Path to the log file
+
+        Returns:
+            dict: A scan result in the LogScanner.scan format, with code snippets
+                matched over the whole file, or None for an empty file
+        """
+        with open(path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return None
+
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapping:
+                if hasattr(mapping, 'madvise') and hasattr(mmap, 'MADV_SEQUENTIAL'):
+                    mapping.madvise(mmap.MADV_SEQUENTIAL)
+                return _MappedScan(self, mapping).run()
+
+
+class _MappedScan:
+    """State of one scan over a mapped file."""
+
+    def __init__(self, owner, mapping):
+        self.owner = owner
+        self.mapping = mapping
+        self.size = len(mapping)
+        self.newlines = self._index_lines()
+        self.total_lines = len(self.newlines) + 1
+
+    def _index_lines(self):
+        """Find the offset of every newline, one block of the mapping at a time."""
+        view = np.frombuffer(self.mapping, dtype=np.uint8)
+        try:
+            offsets = [np.flatnonzero(view[start:start + INDEX_BLOCK_BYTES] == 10) + start
+                       for start in range(0, self.size, INDEX_BLOCK_BYTES)]
+        finally:
+            # The mapping cannot be closed while numpy still exports it
+            del view
+        return np.concatenate(offsets) if offsets else np.empty(0, dtype=np.int64)
+
+    def line_of(self, position):
+        """Line index holding the byte at ``position``."""
+        return int(np.searchsorted(self.newlines, position))
+
+    def bounds(self, line):
+        """Byte range of a line, without its newline."""
+        start = int(self.newlines[line - 1]) + 1 if line > 0 else 0
+        end = int(self.newlines[line]) if line < len(self.newlines) else self.size
+        return start, end
+
+    def decode(self, first, last):
+        """Decode lines ``first`` to ``last`` inclusive."""
+        start = self.bounds(first)[0]
+        end = self.bounds(last)[1]
+        return self.mapping[start:end].decode('utf-8', errors='replace').split('\n')
+
+    def window(self, line):
+        """Context lines around a line."""
+        return self.decode(max(0, line - CONTEXT_RADIUS), min(self.total_lines - 1, line + CONTEXT_RADIUS))
+
+    def matching_lines(self, regex):
+        """Sorted indices of the lines that contain a match."""
+        positions = np.fromiter((match.start() for match in regex.finditer(self.mapping)), dtype=np.int64)
+        return np.unique(np.searchsorted(self.newlines, positions))
+
+    def each_line(self, matcher):
+        """Yield (line index, raw line, pattern index) for lines matching an OrderedMatcher."""
+        search = matcher.combined.search
+        position = 0
+        while position <= self.size:
+            match = search(self.mapping, position)
+            if not match:
+                return
+            line = self.line_of(match.start())
+            start, end = self.bounds(line)
+            raw = self.mapping[start:end]
+            index = matcher.first_match(raw)
+            if index >= 0:
+                yield line, raw, index
+            position = end + 1
+
+    def stack_traces(self):
+        """
+        Assemble the stack traces from the lines that may belong to one.
+
+        Returns:
+            tuple: The StackTraceAssembler, and the first and end line indices
+                of each run of lines absorbed into a trace started before them
+        """
+        assembler = self.owner.scanner.trace_assembler()
+        run_starts = []
+        run_ends = []
+        trace_lines = self.matching_lines(TRACE_LINE_REGEX)
+        if len(trace_lines):
+            # A trace starts on the line before its first frame and a Python
+            # trace ends on the line after its last one
+            lines = np.union1d(np.union1d(trace_lines - 1, trace_lines), trace_lines + 1)
+            for line in lines[(lines >= 0) & (lines < self.total_lines)].tolist():
+                start, end = self.bounds(line)
+                if assembler.feed(line + 1, self.mapping[start:end].decode('utf-8', errors='replace')):
+                    if run_ends and run_ends[-1] == line:
+                        run_ends[-1] = line + 1
+                    else:
+                        run_starts.append(line)
+                        run_ends.append(line + 1)
+        return assembler, np.array(run_starts, dtype=np.int64), np.array(run_ends, dtype=np.int64)
+
+    def measurements(self):
+        """Sketch the durations and sizes of the lines that may hold one."""
+        durations = KeyedSketches()
+        sizes = KeyedSketches()
+        for line in self.matching_lines(MEASURE_LINE_REGEX).tolist():
+            start, end = self.bounds(line)
+            text = self.mapping[start:end].decode('utf-8', errors='replace')
+            duration, size = measure(text)
+            if duration is not None or size is not None:
+                key = endpoint_key(text)
+                if duration is not None:
+                    durations.add(key, duration)
+                if size is not None:
+                    sizes.add(key, size)
+        return durations, sizes
+
+    def timestamps(self, error_lines, warning_lines):
+        """
+        Parse the first timestamp of every stamped line, a batch of matches at a time.
+
+        Returns:
+            tuple: Indices of the stamped lines, the first and last stamps (None
+                without any), and a TimeSeries with the line counts of each event
+        """
+        time_series = TimeSeries()
+        stamped = []
+        first = last = None
+        previous = -1
+        matches = self.owner.timestamp_regex.finditer(self.mapping)
+
+        while True:
+            batch = [(match.start(), match.group().decode('ascii'), TIMESTAMP_KIND_CODES[match.lastgroup])
+                     for match in itertools.islice(matches, DEFAULT_BATCH_SIZE)]
+            if not batch:
+                break
+
+            # Keep only the first match of each line, including a line that the previous batch started
+            lines = np.searchsorted(self.newlines, np.fromiter((start for start, _, _ in batch), dtype=np.int64))
+            keep = np.flatnonzero(lines != np.concatenate(([previous], lines[:-1])))
+            previous = int(lines[-1])
+            if not len(keep):
+                continue
+
+            texts = [batch[i][1] for i in keep]
+            time_series.add_many(texts, [batch[i][2] for i in keep])
+            stamped.append(lines[keep])
+            if first is None:
+                first = texts[0]
+            last = texts[-1]
+
+        stamped_lines = np.concatenate(stamped) if stamped else np.empty(0, dtype=np.int64)
+
+        # Every line counts towards the last stamped line at or before it
+        line_counts = np.diff(np.append(stamped_lines, self.total_lines))
+        error_events = np.searchsorted(stamped_lines, error_lines, side='right') - 1
+        warning_events = np.searchsorted(stamped_lines, warning_lines, side='right') - 1
+        lead = [int(stamped_lines[0]) if len(stamped_lines) else self.total_lines,
+                int(np.count_nonzero(error_events < 0)),
+                int(np.count_nonzero(warning_events < 0))]
+        time_series.set_counts(line_counts, error_events[error_events >= 0], warning_events[warning_events >= 0], lead)
+
+        return stamped_lines, first, last, time_series
+
+    def run(self):
+        owner = self.owner
+        scanner = owner.scanner
+        error_types = scanner.error_types
+
+        # Level counters, each line counted once under its highest-ranked level
+        level_regexes = owner.level_regexes
+        error_lines = self.matching_lines(level_regexes['error'])
+        warning_lines = np.setdiff1d(self.matching_lines(level_regexes['warning']), error_lines)
+        ranked = np.union1d(error_lines, warning_lines)
+        info_lines = np.setdiff1d(self.matching_lines(level_regexes['info']), ranked)
+        ranked = np.union1d(ranked, info_lines)
+        debug_lines = np.setdiff1d(self.matching_lines(level_regexes['debug']), ranked)
+        exception_lines = self.matching_lines(level_regexes['exception'])
+
+        # Timestamps: the first match on each stamped line
+        stamped_lines, first_timestamp, last_timestamp, time_series = self.timestamps(error_lines, warning_lines)
+
+        # Technology indicators, looking only for ones not seen yet
+        found_tech = set()
+        gate = owner.tech_gate(found_tech)
+        position = 0
+        while gate is not None:
+            match = gate.search(self.mapping, position)
+            if not match:
+                break
+            start, end = self.bounds(self.line_of(match.start()))
+            hits = scanner.keywords.find(self.mapping[start:end].decode('utf-8', errors='replace').lower())
+            found = {hit - scanner.tech_offset for hit in hits if hit >= scanner.tech_offset}
+            if not found <= found_tech:
+                found_tech.update(found)
+                gate = owner.tech_gate(found_tech)
+            position = end + 1
+
+        # Stack traces; the lines after the first of a trace are not errors of their own
+        traces, run_starts, run_ends = self.stack_traces()
+
+        # Error patterns
+        all_errors = scanner.error_store()
+        error_clusters = TemplateMiner()
+        primary_index = len(error_types)
+        primary_line = -1
+        primary_text = None
+        primary_context = []
+        pattern_hits = [0] * len(error_types)
+        for line, raw, index in self.each_line(owner.error_matcher):
+            text = raw.decode('utf-8', errors='replace')
+            pattern_hits[index] += 1
+            if index < primary_index:
+                primary_index = index
+                primary_line = line
+                primary_text = text
+                primary_context = self.window(line)
+
+            run = int(np.searchsorted(run_starts, line, side='right')) - 1
+            in_trace = run >= 0 and line < run_ends[run]
+
+            if not in_trace and len(text.strip()) >= 5:
+                hits = scanner.keywords.find(text.lower())
+                if not scanner.level_ids['critical'].isdisjoint(hits):
+                    severity = CRITICAL
+                elif not scanner.level_ids['error'].isdisjoint(hits):
+                    severity = HIGH
+                elif not scanner.level_ids['warning'].isdisjoint(hits):
+                    severity = MEDIUM
+                else:
+                    severity = LOW
+
+                all_errors.add(line + 1, index, text, severity)
+                error_clusters.add(text, line + 1, error_types[index])
+
+        # Patterns are not timed here: they run as one regex over the whole mapping
+        scanner.pattern_stats.record_scan(pattern_hits, [0.0] * len(error_types), 0, self.total_lines)
+
+        # Only the windows of the top-ranked errors are decoded
+        for index in all_errors.top_indices():
+            all_errors.set_context(index, self.window(all_errors.line_numbers[index] - 1))
+
+        # Performance issues
+        performance_issues = scanner.performance_store()
+        for line, raw, index in self.each_line(owner.performance_matcher):
+            performance_issues.add(line + 1, index, raw.decode('utf-8', errors='replace'))
+
+        durations, sizes = self.measurements()
+
+        # Code snippets are matched over the whole file, like analyze() does
+        code_snippets = scanner.code_snippets(
+            (match.group(1).decode('utf-8', errors='replace')
+             for match in owner.code_block_regex.finditer(self.mapping)),
+            (tuple(group.decode('utf-8', errors='replace') for group in match.groups())
+             for match in owner.file_reference_regex.finditer(self.mapping)))
+
+        return {
+            'counts': {
+                'total_lines': self.total_lines,
+                'error_count': len(error_lines),
+                'warning_count': len(warning_lines),
+                'info_count': len(info_lines),
+                'debug_count': len(debug_lines),
+                'exception_count': len(exception_lines),
+                'timestamp_count': len(stamped_lines)
+            },
+            'first_timestamp': first_timestamp,
+            'last_timestamp': last_timestamp,
+            'time_series': time_series,
+            'found_tech': found_tech,
+            'log_format': None,
+            'logger_errors': Counter(),
+            'all_errors': all_errors,
+            'performance_issues': performance_issues,
+            'error_clusters': error_clusters,
+            'durations': durations,
+            'sizes': sizes,
+            'exceptions': traces.traces,
+            'exception_total': traces.count,
+            'trace_state': (traces.trace, None),
+            'resumed_trace': False,
+            'primary_index': primary_index if primary_line >= 0 else None,
+            'primary_line': primary_line,
+            'primary_text': primary_text,
+            'primary_context': primary_context,
+            'head': self.decode(0, min(10, self.total_lines) - 1),
+            'tail': self.decode(max(0, self.total_lines - CONTEXT_RADIUS), self.total_lines - 1),
+            'code_snippets': code_snippets
+        }
@@ -0,0 +1,103 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from .log_scanner import LogScanner
+from .finding_store import DEFAULT_SAMPLE_LIMIT, DEFAULT_EDGE_LIMIT
+from .stack_traces import can_split
+
+# Size of the byte range each worker scans at a time
+DEFAULT_CHUNK_BYTES = 32 * 1024 * 1024
+
+# Scanner compiled once per worker process by _init_worker
+_worker_scanner = None
+
+
+def _init_worker(error_patterns, context_limit, sample_limit, edge_limit):
+    """Compile the scanner once in each worker process."""
+    global _worker_scanner
+    _worker_scanner = LogScanner(error_patterns, context_limit, sample_limit, edge_limit)
+
+
+def _scan_range(path, start, end, is_last, log_format):
+    """Scan one line-aligned byte range of a log file in a worker process."""
+    with open(path, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start)
+
+    lines = data.decode('utf-8', errors='replace').split('\n')
+
+    # Every range but the last ends on a newline, which does not start a new line
+    if not is_last:
+        lines.pop()
+
+    return _worker_scanner.scan(lines, collect_snippets=True, log_format=log_format)
+
+
+def plan_chunks(path, chunk_bytes=DEFAULT_CHUNK_BYTES):
+    """
+    Split a file into byte ranges that each end on a line boundary.
+
+    A boundary is moved past any stack trace it would cut, so each trace is
+    scanned in one range.
+
+    Args:
+        path (str): Path to the log file
+        chunk_bytes (int): Approximate size of each range
+
+    Returns:
+        list: (start, end) byte offsets covering the whole file
+    """
+    size = os.path.getsize(path)
+    bounds = [0]
+
+    with open(path, 'rb') as f:
+        position = chunk_bytes
+        while position < size:
+            # Move the boundary to the start of a line that does not continue
+            # a stack trace from the line before it
+            f.seek(position - 1)
+            f.readline()
+            last_line = f.readline()
+            position = f.tell()
+            next_line = f.readline()
+            while next_line and not can_split(last_line, next_line):
+                last_line = next_line
+                position = f.tell()
+                next_line = f.readline()
+            if position >= size:
+                break
+            bounds.append(position)
+            position += chunk_bytes
+
+    bounds.append(size)
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def scan_file_parallel(path, error_patterns, context_limit, workers=None, chunk_bytes=DEFAULT_CHUNK_BYTES,
+                       log_format=None, sample_limit=DEFAULT_SAMPLE_LIMIT, edge_limit=DEFAULT_EDGE_LIMIT):
+    """
+    Scan a log file in parallel, one line-aligned byte range per task.
+
+    Args:
+        path (str): Path to the log file
+        error_patterns (dict): Error patterns used to build each worker's scanner
+        context_limit (int): Number of errors per range that keep a context window
+        workers (int, optional): Number of worker processes, defaults to the CPU count
+        chunk_bytes (int): Approximate size of each range
+        log_format (str, optional): Name of the log's format in LOG_FORMATS
+        sample_limit (int, optional): Output budget of each worker's scanner, see LogScanner
+        edge_limit (int): Findings of each type kept from each end of a range
+
+    Returns:
+        list: Partial scan results in file order, ready for LogScanner.merge
+    """
+    ranges = plan_chunks(path, chunk_bytes)
+    last = len(ranges) - 1
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(error_patterns, context_limit, sample_limit, edge_limit)) as pool:
+        return list(pool.map(_scan_range,
+                             [path] * len(ranges),
+                             [start for start, _ in ranges],
+                             [end for _, end in ranges],
+                             [i == last for i in range(len(ranges))],
+                             [log_format] * len(ranges)))
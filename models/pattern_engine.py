@@ -0,0 +1,392 @@
+import os
+import re
+import sys
+import time
+import queue
+import pickle
+import threading
+import subprocess
+
+try:
+    from re import _parser as sre_parse
+    from re import _constants as sre_constants
+except ImportError:  # Python < 3.11
+    import sre_parse
+    import sre_constants
+
+# Seconds a guarded match may run before its worker is killed
+DEFAULT_MATCH_TIMEOUT = 1.0
+
+# One line in PATTERN_SAMPLE_EVERY (a power of two) is timed against every
+# pattern to estimate what each pattern costs
+PATTERN_SAMPLE_EVERY = 64
+
+_WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'regex_worker.py')
+
+_REPEATS = {sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT}
+if hasattr(sre_constants, 'POSSESSIVE_REPEAT'):
+    _REPEATS.add(sre_constants.POSSESSIVE_REPEAT)
+
+
+class MatchTimeout(TimeoutError):
+    """A guarded match ran past its time budget and was killed."""
+
+
+def find_hazards(pattern, flags=0):
+    """
+    Look for constructs that can make a regex backtrack catastrophically.
+
+    The check flags nested quantifiers: an unbounded repeat inside another
+    unbounded repeat, such as ``(a+)+`` or ``(\\w+\\s?)*``. On a line that
+    almost matches, these try exponentially many ways to split the input
+    between the two repeats before they give up.
+
+    Args:
+        pattern (str): The regex
+        flags (int): Regex flags it is compiled with
+
+    Returns:
+        list: Descriptions of the hazards found, empty for a safe pattern
+
+    Raises:
+        re.error: If the pattern is not a valid regex
+    """
+    hazards = []
+    _walk(sre_parse.parse(pattern, flags), None, hazards)
+    return hazards
+
+
+def _walk(items, outer, hazards):
+    """Report unbounded repeats nested in ``outer``, the enclosing unbounded repeat if any."""
+    for op, av in items:
+        if op in _REPEATS:
+            low, high, body = av
+            if high == sre_constants.MAXREPEAT:
+                if outer is not None:
+                    hazard = f"nested quantifier: {_quantifier(low, high)} repeat inside {outer} repeat"
+                    if hazard not in hazards:
+                        hazards.append(hazard)
+                _walk(body, outer or _quantifier(low, high), hazards)
+            else:
+                _walk(body, outer, hazards)
+        elif op == sre_constants.SUBPATTERN:
+            _walk(av[-1], outer, hazards)
+        elif op == sre_constants.BRANCH:
+            for branch in av[1]:
+                _walk(branch, outer, hazards)
+        elif op in (sre_constants.ASSERT, sre_constants.ASSERT_NOT):
+            _walk(av[1], outer, hazards)
+        elif op == sre_constants.GROUPREF_EXISTS:
+            for branch in av[1:]:
+                if branch:
+                    _walk(branch, outer, hazards)
+        elif op == getattr(sre_constants, 'ATOMIC_GROUP', None):
+            _walk(av, outer, hazards)
+
+
+def _quantifier(low, high):
+    """Spell a repeat the way it is usually written."""
+    if high == sre_constants.MAXREPEAT:
+        return {0: "'*'", 1: "'+'"}.get(low, "'{%d,}'" % low)
+    return "'{%d,%d}'" % (low, high)
+
+
+def check_patterns(patterns, flags=0):
+    """
+    Split named patterns into usable ones and rejected ones.
+
+    Args:
+        patterns (dict): Name to regex
+        flags (int): Regex flags the patterns are compiled with
+
+    Returns:
+        tuple: (name to regex of the safe patterns, name to list of reasons
+            for the rejected ones), both in the original order
+    """
+    accepted = {}
+    rejected = {}
+    for name, pattern in patterns.items():
+        try:
+            if not isinstance(pattern, str):
+                raise TypeError(f"expected a regex string, got {type(pattern).__name__}")
+            hazards = find_hazards(pattern, flags)
+        except (re.error, TypeError) as e:
+            hazards = [f"invalid regex: {e}"]
+        if hazards:
+            rejected[name] = hazards
+        else:
+            accepted[name] = pattern
+    return accepted, rejected
+
+
+class PatternStats:
+    """
+    Per-pattern hit counts and match time for a set of named patterns.
+
+    Scans report the lines attributed to each pattern and the time spent
+    matching each pattern on a sample of the lines, which is scaled up to an
+    estimate for all lines. Guarded matches report their exact wall time.
+    Counters are shared by every analysis of the process.
+    """
+
+    def __init__(self, names):
+        """
+        Create zeroed counters.
+
+        Args:
+            names (list): Pattern names, in the order of their indices
+        """
+        self.names = list(names)
+        self.hits = [0] * len(self.names)
+        self.calls = [0] * len(self.names)
+        self.seconds = [0.0] * len(self.names)
+        self.timeouts = [0] * len(self.names)
+        self.lock = threading.Lock()
+
+    def record_scan(self, hits, sampled_seconds, sampled_lines, total_lines):
+        """
+        Add the counters of one scan.
+
+        Args:
+            hits (list): Lines attributed to each pattern
+            sampled_seconds (list): Time spent matching each pattern on the sampled lines
+            sampled_lines (int): Number of sampled lines
+            total_lines (int): Number of lines scanned
+        """
+        scale = total_lines / sampled_lines if sampled_lines else 0.0
+        with self.lock:
+            for index in range(len(self.names)):
+                self.hits[index] += hits[index]
+                self.calls[index] += total_lines
+                self.seconds[index] += sampled_seconds[index] * scale
+
+    def record_call(self, index, seconds, hit, timed_out=False):
+        """Add one guarded match of a pattern."""
+        with self.lock:
+            self.calls[index] += 1
+            self.seconds[index] += seconds
+            if hit:
+                self.hits[index] += 1
+            if timed_out:
+                self.timeouts[index] += 1
+
+    def summary(self):
+        """
+        Report the counters, most expensive pattern first.
+
+        Returns:
+            list: name, hits, matches attempted, match_seconds, share of the
+                total match time and timeouts for every pattern
+        """
+        with self.lock:
+            total = sum(self.seconds)
+            rows = [{
+                'name': name,
+                'hits': self.hits[index],
+                'matches': self.calls[index],
+                'match_seconds': round(self.seconds[index], 6),
+                'share': round(self.seconds[index] / total, 4) if total else 0.0,
+                'timeouts': self.timeouts[index]
+            } for index, name in enumerate(self.names)]
+        return sorted(rows, key=lambda row: row['match_seconds'], reverse=True)
+
+
+class RegexWorker:
+    """
+    A child process that runs regex operations on behalf of this one.
+
+    A regex cannot be interrupted once it starts backtracking, but a process
+    can be killed. Each operation waits for its reply with a timeout; when the
+    timeout passes the child is killed, and the next operation starts a fresh
+    one.
+    """
+
+    def __init__(self):
+        """Create a worker; its process is started on first use."""
+        self.process = None
+        self.replies = None
+        self.lock = threading.Lock()
+
+    def run(self, op, pattern, flags, text, timeout):
+        """
+        Run one regex operation in the child process.
+
+        Args:
+            op (str): 'search' or 'findall'
+            pattern (str): The regex
+            flags (int): Regex flags
+            text (str): Text to match
+            timeout (float): Seconds to wait for the result
+
+        Returns:
+            The operation's result; a search returns (span, group 0, groups,
+            groupdict) or None
+
+        Raises:
+            MatchTimeout: If the operation ran past the timeout
+            RuntimeError: If the child failed or could not be started
+        """
+        with self.lock:
+            if self.process is None or self.process.poll() is not None:
+                self._start()
+
+            try:
+                pickle.dump((op, pattern, flags, text), self.process.stdin, protocol=pickle.HIGHEST_PROTOCOL)
+                self.process.stdin.flush()
+                ok, result = self.replies.get(timeout=timeout)
+            except queue.Empty:
+                self._stop()
+                raise MatchTimeout(f"match did not finish within {timeout} seconds")
+            except OSError as e:
+                self._stop()
+                raise RuntimeError(f"Regex worker failed: {e}")
+
+        if not ok:
+            raise RuntimeError(result)
+        return result
+
+    def close(self):
+        """Stop the child process."""
+        with self.lock:
+            self._stop()
+
+    def _start(self):
+        """Start a child process and the thread that collects its replies."""
+        try:
+            self.process = subprocess.Popen([sys.executable, '-I', _WORKER_SCRIPT],
+                                            stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        except OSError as e:
+            self.process = None
+            raise RuntimeError(f"Could not start the regex worker: {e}")
+
+        self.replies = queue.Queue()
+        reader = threading.Thread(target=_read_replies, args=(self.process.stdout, self.replies))
+        reader.daemon = True
+        reader.start()
+
+    def _stop(self):
+        """Kill the child process, if any."""
+        if self.process is not None:
+            self.process.kill()
+            self.process.wait()
+            try:
+                self.process.stdin.close()
+            except OSError:
+                pass
+            self.process = None
+
+
+def _read_replies(stream, replies):
+    """Queue every reply of a child process until it exits."""
+    while True:
+        try:
+            replies.put(pickle.load(stream))
+        except (EOFError, OSError, pickle.UnpicklingError, ValueError):
+            replies.put((False, "Regex worker exited"))
+            return
+
+
+# Worker shared by every guarded regex of the process
+_default_worker = RegexWorker()
+
+
+class GuardedMatch:
+    """The parts of a match that a guarded search returns."""
+
+    def __init__(self, span, group, groups, groupdict):
+        self._span = span
+        self._group = group
+        self._groups = groups
+        self._groupdict = groupdict
+
+    def span(self):
+        """(start, end) of the match."""
+        return self._span
+
+    def group(self, index=0):
+        """The whole match, or one group by number or name."""
+        if index == 0:
+            return self._group
+        if isinstance(index, str):
+            return self._groupdict[index]
+        return self._groups[index - 1]
+
+    def groups(self):
+        """Every numbered group."""
+        return self._groups
+
+    def groupdict(self):
+        """Every named group."""
+        return self._groupdict
+
+
+class GuardedRegex:
+    """
+    A regex for user-extensible patterns applied to whole documents.
+
+    Matches run in a killable worker process with a time budget, so even a
+    pattern that slips past find_hazards() cannot hang the caller. Each match
+    is counted in a PatternStats.
+    """
+
+    def __init__(self, pattern, flags=0, timeout=DEFAULT_MATCH_TIMEOUT, stats=None, index=0, worker=None):
+        """
+        Compile and check a pattern.
+
+        Args:
+            pattern (str): The regex
+            flags (int): Regex flags
+            timeout (float): Seconds each match may take
+            stats (PatternStats, optional): Counters to record matches in
+            index (int): Index of the pattern in ``stats``
+            worker (RegexWorker, optional): Worker to run matches in, defaults
+                to one shared by the process
+
+        Raises:
+            re.error: If the pattern is not a valid regex
+        """
+        re.compile(pattern, flags)
+        self.pattern = pattern
+        self.flags = flags
+        self.timeout = timeout
+        self.hazards = find_hazards(pattern, flags)
+        self.stats = stats
+        self.index = index
+        self.worker = worker or _default_worker
+
+    def search(self, text):
+        """
+        Search a text.
+
+        Returns:
+            GuardedMatch: The first match, or None
+
+        Raises:
+            MatchTimeout: If the search ran past the time budget
+            RuntimeError: If the worker failed
+        """
+        result = self._run('search', text)
+        return GuardedMatch(*result) if result is not None else None
+
+    def findall(self, text):
+        """
+        Find every match in a text, like re.findall().
+
+        Raises:
+            MatchTimeout: If the search ran past the time budget
+            RuntimeError: If the worker failed
+        """
+        return self._run('findall', text)
+
+    def _run(self, op, text):
+        """Run an operation in the worker and record it."""
+        started = time.perf_counter()
+        try:
+            result = self.worker.run(op, self.pattern, self.flags, text, self.timeout)
+        except MatchTimeout:
+            if self.stats is not None:
+                self.stats.record_call(self.index, time.perf_counter() - started, False, timed_out=True)
+            raise
+        if self.stats is not None:
+            self.stats.record_call(self.index, time.perf_counter() - started, bool(result))
+        return result
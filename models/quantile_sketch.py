@@ -0,0 +1,243 @@
+import heapq
+import math
+import zlib
+
+# Quantile estimates are within this fraction of the true value
+DEFAULT_RELATIVE_ACCURACY = 0.01
+
+# Buckets per sketch; at 1% accuracy they cover values 17 orders of magnitude apart
+DEFAULT_MAX_BINS = 2048
+
+# Keys with a sketch of their own; the rest share one
+DEFAULT_MAX_KEYS = 100
+
+# Keys listed in a summary, slowest first
+TOP_KEYS = 20
+
+OTHER_KEY = '<other>'
+
+# Smallest value with a bucket of its own; anything below counts as zero
+_MIN_VALUE = 1e-9
+
+
+class QuantileSketch:
+    """
+    Mergeable streaming quantile sketch with relative accuracy (DDSketch).
+
+    Values are counted in logarithmic buckets, bucket i holding the values in
+    (gamma^(i-1), gamma^i], so any quantile is estimated within the relative
+    accuracy and memory only grows with the logarithm of the range of values.
+    Merging adds bucket counts, so a sketch built from pieces of a log holds
+    the same counts as one built from the whole log, in any split. When the
+    range outgrows max_bins, the lowest buckets are folded into the lowest
+    kept one, which only loses accuracy at the low end.
+    """
+
+    def __init__(self, relative_accuracy=DEFAULT_RELATIVE_ACCURACY, max_bins=DEFAULT_MAX_BINS):
+        """
+        Create an empty sketch.
+
+        Args:
+            relative_accuracy (float): Relative error of the quantile estimates
+            max_bins (int): Most buckets kept
+        """
+        self.relative_accuracy = relative_accuracy
+        self.max_bins = max_bins
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.bins = {}
+        self.zero_count = 0
+        self.count = 0
+        self.min = None
+        self.max = None
+        self._floor = None
+
+    def add(self, value, count=1):
+        """
+        Count a value.
+
+        Args:
+            value (float): A non-negative value
+            count (int): Times to count it
+        """
+        self.count += count
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+        if value < _MIN_VALUE:
+            self.zero_count += count
+            return
+        self._add_bin(math.ceil(math.log(value) / self._log_gamma), count)
+
+    def merge(self, other):
+        """
+        Fold in the counts of another sketch with the same accuracy.
+
+        Args:
+            other (QuantileSketch): Sketch to fold in
+        """
+        if not other.count:
+            return
+        self.count += other.count
+        self.zero_count += other.zero_count
+        if self.min is None or other.min < self.min:
+            self.min = other.min
+        if self.max is None or other.max > self.max:
+            self.max = other.max
+        for index, count in other.bins.items():
+            self._add_bin(index, count)
+
+    def _add_bin(self, index, count):
+        """Add to a bucket, folding the lowest buckets when the range grows past max_bins."""
+        if self._floor is not None and index < self._floor:
+            index = self._floor
+        self.bins[index] = self.bins.get(index, 0) + count
+
+        floor = index - self.max_bins + 1
+        if self._floor is None or floor > self._floor:
+            self._floor = floor
+            folded = sum(self.bins.pop(low) for low in [low for low in self.bins if low < floor])
+            if folded:
+                self.bins[floor] = self.bins.get(floor, 0) + folded
+
+    def quantile(self, q):
+        """
+        Estimate a quantile.
+
+        Args:
+            q (float): Quantile between 0 and 1
+
+        Returns:
+            float: The estimate, or None for an empty sketch
+        """
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        if rank < self.zero_count:
+            return self.min
+
+        seen = self.zero_count
+        for index in sorted(self.bins):
+            seen += self.bins[index]
+            if seen > rank:
+                estimate = 2 * self.gamma ** index / (self.gamma + 1)
+                return min(max(estimate, self.min), self.max)
+        return self.max
+
+    def summary(self):
+        """
+        Describe the distribution.
+
+        Returns:
+            dict: count, min, p50, p95, p99 and max, rounded to 3 decimals
+        """
+        return {
+            'count': self.count,
+            'min': _rounded(self.min),
+            'p50': _rounded(self.quantile(0.5)),
+            'p95': _rounded(self.quantile(0.95)),
+            'p99': _rounded(self.quantile(0.99)),
+            'max': _rounded(self.max)
+        }
+
+
+class KeyedSketches:
+    """
+    Quantile sketches of one measure, overall and per key (endpoint or logger).
+
+    At most max_keys keys get a sketch of their own: the ones whose names have
+    the smallest CRC-32. The values of every other key go to the shared
+    OTHER_KEY sketch. The kept keys depend only on the set of keys, so memory
+    is bounded and a merge of the pieces of a log keeps the same keys, with
+    the same counts, as one pass over the whole log.
+    """
+
+    def __init__(self, max_keys=DEFAULT_MAX_KEYS):
+        """
+        Create empty sketches.
+
+        Args:
+            max_keys (int): Keys with a sketch of their own
+        """
+        self.max_keys = max_keys
+        self.overall = QuantileSketch()
+        self.by_key = {}
+        self.other = QuantileSketch()
+        self._ranked = []
+
+    def add(self, key, value):
+        """
+        Count a value.
+
+        Args:
+            key (str): Endpoint or logger the value belongs to, None for neither
+            value (float): The value
+        """
+        self.overall.add(value)
+        if key is None:
+            return
+        sketch = self.by_key.get(key)
+        if sketch is None:
+            sketch = self._admit(key)
+        sketch.add(value)
+
+    def merge(self, other):
+        """
+        Fold in the sketches of another piece of the same log.
+
+        Args:
+            other (KeyedSketches): Sketches to fold in
+        """
+        self.overall.merge(other.overall)
+        self.other.merge(other.other)
+        for key, sketch in other.by_key.items():
+            target = self.by_key.get(key)
+            if target is None:
+                target = self._admit(key)
+            target.merge(sketch)
+
+    def _admit(self, key):
+        """Sketch for a new key: its own if it ranks within max_keys, else the shared one."""
+        rank = (-_key_hash(key), key)
+        if len(self._ranked) >= self.max_keys:
+            if rank <= self._ranked[0]:
+                return self.other
+            evicted = heapq.heapreplace(self._ranked, rank)[1]
+            self.other.merge(self.by_key.pop(evicted))
+        else:
+            heapq.heappush(self._ranked, rank)
+        sketch = self.by_key[key] = QuantileSketch()
+        return sketch
+
+    def summary(self, unit):
+        """
+        Describe the distributions.
+
+        Args:
+            unit (str): Unit of the values
+
+        Returns:
+            dict: unit, the overall summary, and the TOP_KEYS keys with the
+                highest p99 with their summaries
+        """
+        keys = [dict(key=key, **sketch.summary()) for key, sketch in self.by_key.items()]
+        if self.other.count:
+            keys.append(dict(key=OTHER_KEY, **self.other.summary()))
+        keys.sort(key=lambda entry: (-entry['p99'], entry['key']))
+        return {
+            'unit': unit,
+            'overall': self.overall.summary(),
+            'by_key': keys[:TOP_KEYS]
+        }
+
+
+def _rounded(value):
+    """Round a summary value, keeping None."""
+    return round(value, 3) if value is not None else None
+
+
+def _key_hash(key):
+    """Stable hash of a key, the same in every process."""
+    return zlib.crc32(key.encode('utf-8', errors='surrogatepass'))
@@ -0,0 +1,46 @@
+"""
+Child process of the pattern engine that runs regex operations.
+
+Requests and replies are pickled on stdin and stdout. The script is started
+with ``python -I`` so it imports nothing but the standard library. It is
+killed whenever a match runs past its time budget, and the parent starts a
+new one.
+"""
+import re
+import sys
+import pickle
+
+
+def main():
+    requests = sys.stdin.buffer
+    replies = sys.stdout.buffer
+    compiled = {}
+
+    while True:
+        try:
+            op, pattern, flags, text = pickle.load(requests)
+        except EOFError:
+            return
+
+        try:
+            regex = compiled.get((pattern, flags))
+            if regex is None:
+                regex = compiled[(pattern, flags)] = re.compile(pattern, flags)
+
+            if op == 'search':
+                match = regex.search(text)
+                result = (match.span(), match.group(0), match.groups(), match.groupdict()) if match else None
+            elif op == 'findall':
+                result = regex.findall(text)
+            else:
+                raise ValueError(f"Unknown regex operation: {op}")
+            reply = (True, result)
+        except Exception as e:
+            reply = (False, f"{type(e).__name__}: {e}")
+
+        pickle.dump(reply, replies, protocol=pickle.HIGHEST_PROTOCOL)
+        replies.flush()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,187 @@
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+# Defaults sized for pasted CI logs: results are a few kilobytes to a few megabytes
+DEFAULT_MAX_ENTRIES = 256
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+DEFAULT_TTL_SECONDS = 3600
+
+
+class ResultCache:
+    """
+    In-process LRU cache of analysis results, addressed by log content.
+
+    Keys are BLAKE2 digests of the content together with a version string
+    describing everything else a result depends on (the error patterns and
+    the knowledge base). When the version changes every entry is dropped, so
+    a stale result is never served. Entries are evicted least recently used
+    first once there are more than ``max_entries`` of them or their estimated
+    size exceeds ``max_bytes``, and expire ``ttl`` seconds after they were
+    stored. The cache is safe to share between request threads.
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, max_bytes=DEFAULT_MAX_BYTES, ttl=DEFAULT_TTL_SECONDS):
+        """
+        Create an empty cache.
+
+        Args:
+            max_entries (int): Most results kept at once
+            max_bytes (int): Most bytes of results kept at once, estimated from
+                their JSON encoding
+            ttl (float): Seconds a result stays valid, None to keep results
+                until they are evicted
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.version = None
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self.lock = threading.Lock()
+
+    def set_version(self, *parts):
+        """
+        Set the version of the data results depend on, dropping every entry if it changed.
+
+        Args:
+            *parts: Values identifying the current patterns, knowledge base, etc.
+
+        Returns:
+            bool: True if the cache was invalidated
+        """
+        version = '/'.join(str(part) for part in parts)
+        with self.lock:
+            if version == self.version:
+                return False
+            if self.entries:
+                self.invalidations += 1
+            self.version = version
+            self._drop_all()
+            return True
+
+    def key(self, content, tag=None):
+        """
+        Compute the cache key of some content under the current version.
+
+        Args:
+            content (str or bytes-like): The analyzed content
+            tag (str, optional): Tells apart results computed differently from
+                the same content
+
+        Returns:
+            str: Hex digest identifying the content, tag and version
+        """
+        if isinstance(content, str):
+            content = content.encode('utf-8', errors='surrogatepass')
+        digest = hashlib.blake2b(digest_size=20, person=b'devdebug-result')
+        digest.update(str(self.version).encode('utf-8'))
+        digest.update(b'\0')
+        if tag is not None:
+            digest.update(str(tag).encode('utf-8'))
+        digest.update(b'\0')
+        digest.update(content)
+        return digest.hexdigest()
+
+    def get(self, key):
+        """
+        Look up a result.
+
+        Args:
+            key (str): Key from key()
+
+        Returns:
+            The cached result, or None on a miss
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            value, size, expires = entry
+            if expires is not None and time.monotonic() >= expires:
+                self._drop(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value, size=None):
+        """
+        Store a result, evicting the least recently used ones to make room.
+
+        Args:
+            key (str): Key from key()
+            value: The result; it must not be modified after it is stored
+            size (int, optional): Size of the result in bytes, estimated from
+                its JSON encoding when omitted
+
+        Returns:
+            bool: False if the result is larger than the whole cache
+        """
+        if size is None:
+            size = len(json.dumps(value, default=str))
+        if size > self.max_bytes or self.max_entries <= 0:
+            return False
+
+        expires = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self.lock:
+            if key in self.entries:
+                self._drop(key)
+            self.entries[key] = (value, size, expires)
+            self.total_bytes += size
+
+            while len(self.entries) > self.max_entries or self.total_bytes > self.max_bytes:
+                self._drop(next(iter(self.entries)))
+                self.evictions += 1
+        return True
+
+    def clear(self):
+        """Drop every entry, keeping the counters."""
+        with self.lock:
+            self._drop_all()
+
+    def stats(self):
+        """
+        Report the cache counters.
+
+        Returns:
+            dict: Hits, misses, hit rate, evictions, expirations, invalidations
+                and the current and maximum size
+        """
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations,
+                'entries': len(self.entries),
+                'bytes': self.total_bytes,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'ttl_seconds': self.ttl
+            }
+
+    def _drop(self, key):
+        """Remove one entry; the lock must be held."""
+        _, size, _ = self.entries.pop(key)
+        self.total_bytes -= size
+
+    def _drop_all(self):
+        """Remove every entry; the lock must be held."""
+        self.entries.clear()
+        self.total_bytes = 0
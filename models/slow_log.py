@@ -0,0 +1,99 @@
+import os
+import sys
+import json
+import hashlib
+import datetime
+import threading
+import logging
+from logging.handlers import RotatingFileHandler
+
+# Analyses that take longer than this are written to the slow log
+DEFAULT_SLOW_SECONDS = 5.0
+
+# Size of the slow log before it is rotated, and rotated files kept
+DEFAULT_MAX_BYTES = 10 * 1024 * 1024
+DEFAULT_BACKUP_COUNT = 5
+
+
+class _RaisingFileHandler(RotatingFileHandler):
+    """Rotating handler that lets write errors through instead of printing them."""
+
+    def handleError(self, record):
+        """Re-raise the error emit() caught, so the caller can tell nothing was written."""
+        raise sys.exc_info()[1]
+
+
+class SlowLog:
+    """
+    Rotating file of the analyses that took longer than a threshold.
+
+    Each entry is one JSON line with the time, the duration, a SHA-256 of
+    the analyzed content (or, for a log streamed from a URL, the URL) and the
+    stage breakdown of the analysis, so a slow analysis can be found again
+    and replayed offline. The content itself is never written.
+    """
+
+    def __init__(self, path, threshold_seconds=DEFAULT_SLOW_SECONDS, max_bytes=DEFAULT_MAX_BYTES,
+                 backup_count=DEFAULT_BACKUP_COUNT):
+        """
+        Open the slow log; the file is created on the first slow analysis.
+
+        Args:
+            path (str): Path of the slow log
+            threshold_seconds (float): Analyses taking longer are written
+            max_bytes (int): Size the file reaches before it is rotated
+            backup_count (int): Rotated files kept, as path.1, path.2, ...
+        """
+        self.path = path
+        self.threshold_seconds = threshold_seconds
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self._handler = None
+        self._lock = threading.Lock()
+
+    def record(self, timings, content, source, **details):
+        """
+        Write an analysis to the slow log if it took longer than the threshold.
+
+        Args:
+            timings (AnalysisTimings): Timings of the finished analysis
+            content (str or bytes-like): The analyzed content, to hash; None
+                for content that was streamed from elsewhere, such as a URL
+            source (str): Where the content came from, such as 'paste' or 'upload'
+            **details: More JSON-serializable fields for the entry
+
+        Returns:
+            bool: True if the analysis was written
+        """
+        summary = timings.summary()
+        if summary['total_wall_ms'] < self.threshold_seconds * 1000:
+            return False
+
+        if isinstance(content, str):
+            content = content.encode('utf-8', errors='surrogatepass')
+        entry = {
+            'time': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='milliseconds'),
+            'source': source,
+            'content_sha256': hashlib.sha256(content).hexdigest() if content is not None else None,
+            'content_bytes': len(content) if content is not None else None,
+            **details,
+            **summary
+        }
+
+        try:
+            with self._lock:
+                self._open().emit(logging.makeLogRecord({'msg': json.dumps(entry, default=str)}))
+        except (OSError, ValueError) as e:
+            print(f"Warning: Could not write to the slow log {self.path}: {e}")
+            return False
+        return True
+
+    def _open(self):
+        """The rotating handler of the file, opened on first use."""
+        if self._handler is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._handler = _RaisingFileHandler(self.path, maxBytes=self.max_bytes, backupCount=self.backup_count,
+                                                 encoding='utf-8', delay=True)
+        return self._handler
@@ -0,0 +1,425 @@
+import os
+import re
+import json
+import shutil
+import hashlib
+import threading
+import numpy as np
+
+# Hashed feature space; collisions between distinct words are rare at this size
+DEFAULT_FEATURES = 2 ** 20
+
+# Rows are re-weighted with fresh document frequencies once the rows added
+# since the last re-weighting reach this share of the index, or at least
+# REWEIGHT_MIN_ROWS of them
+DEFAULT_REWEIGHT_FRACTION = 0.1
+REWEIGHT_MIN_ROWS = 64
+
+# Indexes with fewer rows are always searched exhaustively
+EXACT_SEARCH_ROWS = 20000
+
+# Rows, found through the inverted lists of the query's words, that a search
+# of a larger index scores; more finds more of the true nearest rows, slower
+DEFAULT_SEARCH_CANDIDATES = 20000
+
+# Bumped whenever the saved arrays or their meaning change, so old saves are rebuilt
+INDEX_FORMAT = 2
+
+# Name of a saved index in its directory: digest of its texts and their count
+_SAVED_NAME = re.compile(r'^[0-9a-f]{32}-\d+$')
+
+
+class SolutionIndex:
+    """
+    TF-IDF index of solution texts that grows one row at a time.
+
+    Texts are turned into term counts by feature hashing, so there is no
+    vocabulary to refit, and the document frequency of every feature is kept
+    up to date as rows are added. A new row is weighted with the frequencies
+    of the moment and appended; rows added earlier keep their weights until
+    the whole index is re-weighted, in a background thread, once enough rows
+    were added. Adding a row therefore costs the same however large the index
+    is, and right after a re-weighting the similarities are those of a
+    TfidfVectorizer fitted on all the texts, but for the rare words whose
+    hashes collide.
+
+    New rows go into small blocks that are merged in pairs as they grow, like
+    the digits of a binary counter, so a search goes over a few blocks only.
+
+    An index given a directory saves its rows there as raw arrays whenever it
+    is built or re-weighted, under a digest of the texts they hold. build()
+    memory-maps a save that holds the first of its texts and adds the rest,
+    so processes starting on the same knowledge share the pages of the index
+    instead of each hashing and weighting every text.
+
+    Small indexes are searched exhaustively. Large ones also keep inverted
+    lists of their re-weighted rows: a search walks the lists of the query's
+    words, the most distinctive first, until it has about search_candidates
+    rows, and scores only those exactly, plus the rows added since. Rows
+    sharing no word with the query have no similarity anyway, so the search
+    is exact whenever the lists of all the query's words fit the budget.
+    """
+
+    def __init__(self, n_features=DEFAULT_FEATURES, reweight_fraction=DEFAULT_REWEIGHT_FRACTION, background=True,
+                 directory=None, search_candidates=DEFAULT_SEARCH_CANDIDATES):
+        """
+        Create an empty index.
+
+        Args:
+            n_features (int): Size of the hashed feature space
+            reweight_fraction (float): Share of rows added since the last
+                re-weighting that triggers the next one
+            background (bool): Re-weight in a daemon thread; otherwise
+                re-weighting runs in the add() call that triggers it
+            directory (str, optional): Where the index is saved
+            search_candidates (int): Rows a search of a large index scores;
+                0 scores every row
+        """
+        # scikit-learn is slow to import, so it is imported with the first index
+        from sklearn.feature_extraction.text import HashingVectorizer
+        self.hasher = HashingVectorizer(n_features=n_features, stop_words='english', alternate_sign=False,
+                                        norm=None)
+        self.n_features = n_features
+        self.reweight_fraction = reweight_fraction
+        self.background = background
+        self.directory = directory
+        self.search_candidates = search_candidates
+        self.document_frequencies = np.zeros(n_features, dtype=np.int64)
+        self.rows = 0
+        self.items = []
+        self.reweights = 0
+        # Digest of the texts of the rows so far, in order
+        self._digest = hashlib.blake2b(digest_size=16)
+        # (counts, weighted) CSR blocks in row order; blocks before _sealed are
+        # being re-weighted and must not be merged with newer ones
+        self._blocks = []
+        self._sealed = 0
+        self._weighted_rows = 0
+        self._reweighting = False
+        # (weighted block, indptr, rows) inverted lists of the first block, while it is that block
+        self._postings = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def build(cls, texts, items, directory=None, **options):
+        """
+        Index texts, starting from a saved index that holds the first of them.
+
+        Args:
+            texts (list): Texts to index
+            items (list): What each text describes
+            directory (str, optional): Where the index is saved and looked for
+            **options: More arguments of the index, see __init__
+
+        Returns:
+            SolutionIndex: The index, with one row per text
+        """
+        index = cls(directory=directory, **options)
+        loaded = index._load(texts, items) if directory else 0
+        index.add(texts[loaded:], items[loaded:])
+        if not loaded and texts:
+            with index._lock:
+                counts, weighted = index._blocks[0]
+                frequencies = index.document_frequencies
+                digest = index._digest.hexdigest()
+            postings = index._postings_of(weighted)
+            with index._lock:
+                index._postings = postings
+            if directory:
+                # Saved right away; later saves are made by re-weightings
+                index._save(counts, weighted, frequencies, digest, postings)
+        return index
+
+    def add(self, texts, items):
+        """
+        Append texts as rows of the index.
+
+        Args:
+            texts (list): Texts to index
+            items (list): What each text describes, such as its solution;
+                returned with the scores of the rows
+        """
+        if not texts:
+            return
+        counts = self.hasher.transform(texts)
+        with self._lock:
+            self.items.extend(items)
+            for text in texts:
+                self._update_digest(self._digest, text)
+            # A CSR row lists each feature once, so this counts documents
+            np.add.at(self.document_frequencies, counts.indices, 1)
+            self.rows += counts.shape[0]
+            self._append(counts, self._weigh(counts, self.document_frequencies, self.rows))
+            if self.rows == counts.shape[0]:
+                # The first texts are weighted with their own frequencies, so none are stale
+                self._weighted_rows = self.rows
+            stale = self.rows - self._weighted_rows
+            due = (not self._reweighting and
+                   stale >= max(REWEIGHT_MIN_ROWS, self.reweight_fraction * self._weighted_rows))
+            if due:
+                self._reweighting = True
+
+        if due:
+            if self.background:
+                thread = threading.Thread(target=self._reweight, name='solution-index-reweight')
+                thread.daemon = True
+                thread.start()
+            else:
+                self._reweight()
+
+    def reweight(self):
+        """Re-weight every row with the current document frequencies, in this thread."""
+        with self._lock:
+            if self._reweighting:
+                return
+            self._reweighting = True
+        self._reweight()
+
+    def top(self, text, limit, candidates=None):
+        """
+        Rows most similar to a text, by cosine similarity.
+
+        Args:
+            text (str): The query
+            limit (int): Rows to return
+            candidates (int, optional): Rows to score in a large index,
+                instead of the index's search_candidates; 0 scores every row
+
+        Returns:
+            list: (similarity, item) of up to limit rows, most similar first;
+                among equally similar rows the last added come first
+        """
+        if candidates is None:
+            candidates = self.search_candidates
+        counts = self.hasher.transform([text])
+        with self._lock:
+            blocks = [weighted for _, weighted in self._blocks]
+            rows = self.rows
+            postings = self._postings
+            if postings is not None and not (blocks and postings[0] is blocks[0]):
+                postings = None
+            # Words in no row are left out, as a fitted vocabulary would leave them out
+            counts.data[self.document_frequencies[counts.indices] == 0] = 0
+            counts.eliminate_zeros()
+            query = self._weigh(counts, self.document_frequencies, rows)
+        if not blocks or limit <= 0:
+            return []
+
+        # Rows and query are normalized, so their dot products are the cosines;
+        # sparse rows times a dense query is much faster than sparse times sparse
+        dense = np.zeros(self.n_features)
+        dense[query.indices] = query.data
+        ids, scores = [], []
+        offset = 0
+        for weighted in blocks:
+            found = None
+            if offset == 0 and postings is not None and candidates and rows >= EXACT_SEARCH_ROWS:
+                found = self._candidates(postings, query, candidates)
+            if found is not None:
+                ids.append(found)
+                scores.append(weighted[found] @ dense)
+            else:
+                ids.append(np.arange(offset, offset + weighted.shape[0]))
+                scores.append(weighted @ dense)
+            offset += weighted.shape[0]
+        ids = np.concatenate(ids)
+        scores = np.concatenate(scores)
+
+        if len(scores) > limit:
+            # The limit-th highest score; of the rows tied with it, the last
+            # added are kept, and ids ascend so those are the last positions
+            kth = np.partition(scores, len(scores) - limit)[len(scores) - limit]
+            above = np.flatnonzero(scores > kth)
+            tied = np.flatnonzero(scores == kth)
+            best = np.concatenate([above, tied[len(tied) - (limit - len(above)):]])
+        else:
+            best = np.arange(len(scores))
+        best = best[np.lexsort((-ids[best], -scores[best]))]
+        # The list only grows, so rows seen under the lock can be read without it
+        results = [(float(scores[i]), self.items[ids[i]]) for i in best]
+
+        if len(results) < min(limit, rows):
+            # Too few rows share a word with the query; the newest others follow
+            scored = set(ids.tolist())
+            for row in range(rows - 1, -1, -1):
+                if len(results) == limit:
+                    break
+                if row not in scored:
+                    results.append((0.0, self.items[row]))
+        return results
+
+    def status(self):
+        """
+        Report the size of the index.
+
+        Returns:
+            dict: rows, blocks, stale_rows (weighted with older frequencies)
+                and reweights done
+        """
+        with self._lock:
+            return {'rows': self.rows, 'blocks': len(self._blocks),
+                    'stale_rows': self.rows - self._weighted_rows, 'reweights': self.reweights}
+
+    def _append(self, counts, weighted):
+        """Append a block, merging the last blocks while the newer one is as large."""
+        import scipy.sparse
+        self._blocks.append((counts, weighted))
+        while (len(self._blocks) - self._sealed > 1 and
+               self._blocks[-1][0].shape[0] >= self._blocks[-2][0].shape[0]):
+            (older_counts, older_weighted), (newer_counts, newer_weighted) = self._blocks[-2:]
+            self._blocks[-2:] = [(scipy.sparse.vstack([older_counts, newer_counts], format='csr'),
+                                  scipy.sparse.vstack([older_weighted, newer_weighted], format='csr'))]
+
+    def _reweight(self):
+        """Rebuild the weights of the rows present now, then swap them in."""
+        import scipy.sparse
+        try:
+            with self._lock:
+                blocks = list(self._blocks)
+                self._sealed = len(blocks)
+                frequencies = self.document_frequencies.copy()
+                rows = self.rows
+                digest = self._digest.hexdigest()
+            if not blocks:
+                return
+
+            counts = scipy.sparse.vstack([block for block, _ in blocks], format='csr')
+            weighted = self._weigh(counts, frequencies, rows)
+            postings = self._postings_of(weighted)
+
+            with self._lock:
+                self._blocks[:len(blocks)] = [(counts, weighted)]
+                self._postings = postings
+                self._weighted_rows = rows
+                self.reweights += 1
+            if self.directory:
+                self._save(counts, weighted, frequencies, digest, postings)
+        finally:
+            with self._lock:
+                self._sealed = 0
+                self._reweighting = False
+
+    def _save(self, counts, weighted, frequencies, digest, postings):
+        """Save weighted rows under the digest of their texts, and make them the current save."""
+        name = f"{digest}-{counts.shape[0]}"
+        target = os.path.join(self.directory, name)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            if not os.path.isdir(target):
+                partial = os.path.join(self.directory, f".{name}.{os.getpid()}.{threading.get_ident()}")
+                os.makedirs(partial, exist_ok=True)
+                features = np.flatnonzero(frequencies)
+                arrays = {'indptr': counts.indptr, 'indices': counts.indices, 'counts': counts.data,
+                          'weighted': weighted.data, 'features': features,
+                          'frequencies': frequencies[features]}
+                if postings is not None:
+                    arrays.update(postings_indptr=postings[1], postings_rows=postings[2])
+                for key, array in arrays.items():
+                    np.save(os.path.join(partial, f"{key}.npy"), array)
+                try:
+                    os.rename(partial, target)
+                except OSError:
+                    # Another process saved the same rows first
+                    shutil.rmtree(partial, ignore_errors=True)
+
+            # The pointer is replaced in one step, so readers see the old save or the new one
+            pointer = os.path.join(self.directory, f".current.{os.getpid()}.{threading.get_ident()}")
+            with open(pointer, 'w') as f:
+                json.dump({'format': INDEX_FORMAT, 'n_features': self.n_features, 'name': name,
+                           'digest': digest, 'rows': counts.shape[0]}, f)
+            os.replace(pointer, os.path.join(self.directory, 'current.json'))
+        except OSError as e:
+            print(f"Warning: Could not save the solution index to {self.directory}: {e}")
+            return
+
+        # Processes still mapping older saves keep their pages after the files are removed
+        for entry in os.listdir(self.directory):
+            if entry != name and _SAVED_NAME.match(entry):
+                shutil.rmtree(os.path.join(self.directory, entry), ignore_errors=True)
+
+    def _load(self, texts, items):
+        """Map the current save if its texts are the first of texts; returns the rows loaded."""
+        import scipy.sparse
+        try:
+            with open(os.path.join(self.directory, 'current.json'), 'r') as f:
+                current = json.load(f)
+            rows = current['rows']
+            if (current['format'] != INDEX_FORMAT or current['n_features'] != self.n_features or
+                    not 0 < rows <= len(texts)):
+                return 0
+            digest = hashlib.blake2b(digest_size=16)
+            for text in texts[:rows]:
+                self._update_digest(digest, text)
+            if digest.hexdigest() != current['digest']:
+                return 0
+
+            path = os.path.join(self.directory, current['name'])
+            arrays = {key: np.load(os.path.join(path, f"{key}.npy"), mmap_mode='r')
+                      for key in ('indptr', 'indices', 'counts', 'weighted')}
+            features = np.load(os.path.join(path, 'features.npy'))
+            frequencies = np.load(os.path.join(path, 'frequencies.npy'))
+            if os.path.exists(os.path.join(path, 'postings_rows.npy')):
+                postings = (np.load(os.path.join(path, 'postings_indptr.npy'), mmap_mode='r'),
+                            np.load(os.path.join(path, 'postings_rows.npy'), mmap_mode='r'))
+            else:
+                postings = None
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            if not isinstance(e, FileNotFoundError):
+                print(f"Warning: Could not load the solution index from {self.directory}: {e}")
+            return 0
+
+        shape = (rows, self.n_features)
+        counts = scipy.sparse.csr_matrix((arrays['counts'], arrays['indices'], arrays['indptr']), shape=shape,
+                                         copy=False)
+        weighted = scipy.sparse.csr_matrix((arrays['weighted'], arrays['indices'], arrays['indptr']), shape=shape,
+                                           copy=False)
+        with self._lock:
+            self.document_frequencies[features] = frequencies
+            self._blocks = [(counts, weighted)]
+            self._postings = (weighted,) + postings if postings is not None else None
+            self.rows = self._weighted_rows = rows
+            self.items.extend(items[:rows])
+            self._digest = digest
+        return rows
+
+    @staticmethod
+    def _postings_of(weighted):
+        """Inverted lists of a block large enough to search through them, or None."""
+        if weighted.shape[0] < EXACT_SEARCH_ROWS:
+            return None
+        # Column by column, the row indices of a CSC matrix are the rows holding each feature
+        postings = weighted.tocsc()
+        return weighted, postings.indptr, postings.indices
+
+    @staticmethod
+    def _candidates(postings, query, budget):
+        """
+        Rows in the inverted lists of the query's words, most distinctive words
+        first, up to about budget; None when scoring every row is cheaper.
+        """
+        weighted, indptr, rows = postings
+        if not query.nnz:
+            return np.zeros(0, dtype=np.int64)
+        starts = indptr[query.indices]
+        lengths = indptr[query.indices + 1] - starts
+        # Rare words weigh the most, have the shortest lists, and their rows score highest
+        order = np.argsort(-query.data, kind='stable')
+        total = np.cumsum(lengths[order])
+        take = max(1, int(np.searchsorted(total, budget, side='right')))
+        if total[take - 1] * 4 >= weighted.shape[0]:
+            return None
+        return np.unique(np.concatenate([rows[starts[j]:starts[j] + lengths[j]] for j in order[:take]]))
+
+    @staticmethod
+    def _update_digest(digest, text):
+        """Add a text to a digest of texts."""
+        digest.update(text.encode('utf-8', errors='surrogatepass'))
+        digest.update(b'\0')
+
+    @staticmethod
+    def _weigh(counts, frequencies, rows):
+        """TF-IDF rows of term counts, with smoothed idf and L2 norm as TfidfVectorizer computes them."""
+        from sklearn.preprocessing import normalize
+        weighted = counts.astype(np.float64)
+        weighted.data *= np.log((1 + rows) / (1 + frequencies[weighted.indices])) + 1
+        return normalize(weighted, copy=False)
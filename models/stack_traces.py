@@ -0,0 +1,277 @@
+import re
+import copy
+
+# Frames kept per exception of a trace; Python prints the innermost call last
+# and keeps its last frames, other runtimes print it first and keep their first
+MAX_TRACE_FRAMES = 30
+
+PYTHON_HEADER = 'Traceback (most recent call last)'
+CAUSED_BY = 'Caused by:'
+CHAIN_MARKERS = ('During handling of the above exception', 'The above exception was the direct cause')
+
+# Unindented lines that can continue a trace; a log is never split next to one
+CONTINUATION_PREFIXES = (PYTHON_HEADER, CAUSED_BY) + CHAIN_MARKERS
+_SPLIT_PREFIXES = tuple(prefix.encode('ascii') for prefix in CONTINUATION_PREFIXES)
+_SPLIT_BLANK = (b'', b' ', b'\t', b'\r', b'\n')
+
+# Frames of Java, JavaScript and .NET ("\tat com.app.Db.query(Db.java:42)")
+# and of Python ('  File "/app/db.py", line 42, in query')
+_FRAME = re.compile(r'\s+at\s+(\S.*)')
+_PYTHON_FRAME = re.compile(r'\s+File "')
+
+# An exception line, "java.io.IOException: disk full", and an exception
+# class named somewhere in a log line
+_EXCEPTION = re.compile(r'(?:Exception in thread "[^"]*" )?([A-Za-z_$][\w$]*(?:\.[\w$]+)*)(?::\s*(.*))?$')
+_EXCEPTION_IN_TEXT = re.compile(r'([A-Za-z_$][\w$]*(?:\.[\w$]+)*(?:Exception|Error|Throwable))\b(?::\s*(.*))?')
+
+# States of an open trace
+_STACK, _PYTHON, _PYTHON_END, _CHAIN = range(4)
+
+
+def can_split(last_line, next_line):
+    """
+    Check that a log can be cut between two lines without cutting a stack trace.
+
+    Args:
+        last_line (bytes): Start of the line before the cut
+        next_line (bytes): Start of the line after the cut
+
+    Returns:
+        bool: False if either line is blank, indented or may continue a trace
+    """
+    return (last_line[:1] not in _SPLIT_BLANK and next_line[:1] not in _SPLIT_BLANK and
+            not last_line.startswith(_SPLIT_PREFIXES) and not next_line.startswith(_SPLIT_PREFIXES))
+
+
+def shift_trace(trace, line_offset):
+    """Copy a trace with its line numbers moved by ``line_offset``."""
+    shifted = dict(trace)
+    shifted['line_number'] += line_offset
+    shifted['end_line'] += line_offset
+    return shifted
+
+
+def join_traces(first, first_count, second, second_count, limit=None):
+    """
+    Join the traces kept for two consecutive pieces of a log.
+
+    Args:
+        first (list): Traces kept for the first piece: all of them, or the
+            first and last ``limit`` when there were more than twice as many
+        first_count (int): Traces of the first piece
+        second (list): Traces kept for the second piece, the same way
+        second_count (int): Traces of the second piece
+        limit (int, optional): Traces to keep from each end; None keeps all
+
+    Returns:
+        list: The traces kept for both pieces, the same way
+    """
+    joined = first + second
+    if limit is None or first_count + second_count <= 2 * limit:
+        return joined
+    return joined[:limit] + joined[-limit:] if limit > 0 else []
+
+
+def _exception(text):
+    """Exception class and message named in a line, (None, text) if there is none."""
+    match = _EXCEPTION.match(text) or _EXCEPTION_IN_TEXT.search(text)
+    if match is None:
+        return None, text.strip() or None
+    return match.group(1), match.group(2)
+
+
+class StackTraceAssembler:
+    """
+    Groups the lines of multiline stack traces into one event per trace.
+
+    A streaming state machine fed one line at a time. It recognizes Python
+    tracebacks, including chained ones ("During handling of the above
+    exception..."), and the "at ..." frames of Java, JavaScript and .NET with
+    their "Caused by:" causes. A Python trace starts at its "Traceback" line;
+    any other starts at the line before its first frame, which names the
+    exception. Every later line of a trace is absorbed into it.
+
+    Each trace is a dict with line_number and end_line (1-based, inclusive),
+    its kind ('python' or 'stack') and its segments, one [exception class,
+    message, frames, frame count] per exception in the order printed.
+    """
+
+    def __init__(self, state=None, limit=None):
+        """
+        Create an assembler.
+
+        Args:
+            state (tuple, optional): state() of the assembler of the lines just
+                before these, with line numbers relative to the first line here
+            limit (int, optional): Closed traces kept from the start and from the
+                end of the lines, all of them are counted; None keeps every trace
+        """
+        self.traces = []
+        self.count = 0
+        self.limit = limit
+        self.trace, self._last = copy.deepcopy(state) if state is not None else (None, None)
+        self._next = 1
+
+    def state(self):
+        """
+        Capture what the next lines of the log need to continue a trace.
+
+        Returns:
+            tuple: The open trace or None, and the last line if it may head a trace
+        """
+        return self.trace, self._last
+
+    def feed(self, line_number, line):
+        """
+        Process the next line.
+
+        Lines may be skipped when they are known not to belong to a trace,
+        which closes the open one.
+
+        Args:
+            line_number (int): 1-based line number
+            line (str): The line, without its newline
+
+        Returns:
+            bool: True if the line was absorbed into a trace started before it
+        """
+        if line_number != self._next:
+            self.close()
+            self._last = None
+        self._next = line_number + 1
+
+        trace = self.trace
+        if trace is not None:
+            if self._continue(trace, line):
+                # Blank lines after a Python trace only count if a chained one follows
+                if line.strip():
+                    trace['end_line'] = line_number
+                self._last = None
+                return True
+            self.close()
+
+        if line.startswith(PYTHON_HEADER):
+            self.trace = {'line_number': line_number, 'end_line': line_number, 'kind': 'python',
+                          'state': _PYTHON, 'segments': [[None, None, [], 0]]}
+            self._last = None
+            return False
+
+        if line[:1] in (' ', '\t'):
+            match = _FRAME.match(line)
+            if match is not None:
+                # The line before the first frame names the exception
+                header = self._last
+                if header is not None and header.strip():
+                    exception, message = _exception(header)
+                    start = line_number - 1
+                else:
+                    exception = message = None
+                    start = line_number
+                self.trace = {'line_number': start, 'end_line': line_number, 'kind': 'stack',
+                              'state': _STACK, 'segments': [[exception, message, [], 0]]}
+                self._add_frame(self.trace, match.group(1))
+                self._last = None
+                return start < line_number
+
+        self._last = line
+        return False
+
+    def close(self):
+        """Close the open trace, if any."""
+        if self.trace is not None:
+            self.traces.append(self.trace)
+            self.count += 1
+            if self.limit is not None and len(self.traces) > 2 * self.limit:
+                del self.traces[self.limit]
+            self.trace = None
+
+    def _continue(self, trace, line):
+        """Absorb a line into the open trace if it belongs to it."""
+        state = trace['state']
+        indented = line[:1] in (' ', '\t')
+
+        if state == _STACK:
+            if indented:
+                match = _FRAME.match(line)
+                if match is not None:
+                    self._add_frame(trace, match.group(1))
+                return True  # "... 5 more", "Suppressed: ..." and the like
+            if line.startswith(CAUSED_BY):
+                exception, message = _exception(line[len(CAUSED_BY):].strip())
+                trace['segments'].append([exception, message, [], 0])
+                return True
+            return False
+
+        if state == _PYTHON:
+            if indented:
+                if _PYTHON_FRAME.match(line):
+                    self._add_frame(trace, line.strip())
+                return True  # Source lines and caret markers
+            match = _EXCEPTION.match(line)
+            if match is None:
+                return False
+            segment = trace['segments'][-1]
+            segment[0], segment[1] = match.group(1), match.group(2)
+            trace['state'] = _PYTHON_END
+            return True
+
+        # After the exception line, a chained traceback may follow
+        if not line.strip():
+            return True
+        if state == _PYTHON_END and line.startswith(CHAIN_MARKERS):
+            trace['state'] = _CHAIN
+            return True
+        if state == _CHAIN and line.startswith(PYTHON_HEADER):
+            trace['segments'].append([None, None, [], 0])
+            trace['state'] = _PYTHON
+            return True
+        return False
+
+    def _add_frame(self, trace, frame):
+        """Count a frame of the current exception, keeping at most MAX_TRACE_FRAMES."""
+        segment = trace['segments'][-1]
+        segment[3] += 1
+        frames = segment[2]
+        if trace['kind'] == 'python':
+            frames.append(frame)
+            if len(frames) > MAX_TRACE_FRAMES:
+                del frames[0]
+        elif len(frames) < MAX_TRACE_FRAMES:
+            frames.append(frame)
+
+
+def trace_entry(trace):
+    """
+    Describe a trace for the exceptions list of an analysis.
+
+    The exception is the one the trace ended with: the last printed by Python,
+    the first printed otherwise. The root cause is the one at the other end
+    of the chain, when the trace has more than one.
+
+    Args:
+        trace (dict): A trace from StackTraceAssembler
+
+    Returns:
+        dict: line_number, end_line, exception, message, frames, frame_count
+            over every exception of the trace, and root_cause (exception,
+            message and frames, or None)
+    """
+    segments = trace['segments']
+    if trace['kind'] == 'python':
+        top, root = segments[-1], segments[0]
+    else:
+        top, root = segments[0], segments[-1]
+
+    return {
+        'line_number': trace['line_number'],
+        'end_line': trace['end_line'],
+        'exception': top[0],
+        'message': top[1],
+        'frames': list(top[2]),
+        'frame_count': sum(segment[3] for segment in segments),
+        'root_cause': {
+            'exception': root[0],
+            'message': root[1],
+            'frames': list(root[2])
+        } if len(segments) > 1 else None
+    }
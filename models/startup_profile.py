@@ -0,0 +1,164 @@
+"""
+Import-time profile of the web app.
+
+Run ``python -m models.startup_profile`` from the project root. It imports
+app.py in a fresh interpreter with ``-X importtime`` and every network
+connection refused, builds each component, and reports the slowest imports,
+how long each component took to build, and any attempt to reach the network.
+The exit status is 1 if startup tried to use the network.
+"""
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+# Runs in the profiled interpreter: refuses and records network use, imports
+# the app, builds its components and prints a JSON report as the last line
+_PROBE = r'''
+import json
+import socket
+import time
+
+attempts = []
+
+def refuse(*args, **kwargs):
+    attempts.append(repr(args[1:] if args and isinstance(args[0], socket.socket) else args)[:200])
+    raise OSError("network access during startup")
+
+socket.socket.connect = refuse
+socket.socket.connect_ex = refuse
+socket.create_connection = refuse
+socket.getaddrinfo = refuse
+
+started = time.perf_counter()
+import app
+import_seconds = time.perf_counter() - started
+
+components = []
+for component in app.components:
+    try:
+        component.resolve()
+        error = None
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    status = component.status()
+    status['error'] = error
+    components.append(status)
+
+print(json.dumps({'import_seconds': import_seconds, 'components': components, 'network_attempts': attempts}))
+'''
+
+
+def parse_importtime(stderr):
+    """
+    Parse the report of ``python -X importtime``.
+
+    Args:
+        stderr (str): The interpreter's standard error
+
+    Returns:
+        list: One dict per imported module with name, self_us, cumulative_us
+            and depth (0 for modules imported directly by the profiled code)
+    """
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        fields = line[len('import time:'):].split('|')
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue  # The header line
+        name = fields[2].rstrip()
+        stripped = name.lstrip()
+        modules.append({
+            'name': stripped,
+            'self_us': int(fields[0]),
+            'cumulative_us': int(fields[1]),
+            'depth': (len(name) - len(stripped) - 1) // 2
+        })
+    return modules
+
+
+def profile_startup(root=None, top=15):
+    """
+    Profile importing the app and building its components.
+
+    Args:
+        root (str, optional): Project root holding app.py, defaults to the parent
+            of this package
+        top (int): Number of modules to list in each ranking
+
+    Returns:
+        dict: import_seconds, components, network_attempts, slowest packages by
+            cumulative time and slowest modules by their own time
+
+    Raises:
+        RuntimeError: If the app could not be imported
+    """
+    root = root or os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, COMPONENT_INIT='lazy', PYTHONDONTWRITEBYTECODE='1')
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', _PROBE],
+                            cwd=root, env=env, capture_output=True, text=True)
+    report_lines = result.stdout.strip().splitlines()
+    if result.returncode != 0 or not report_lines:
+        raise RuntimeError(f"Importing the app failed:\n{result.stderr[-2000:]}")
+
+    report = json.loads(report_lines[-1])
+    modules = parse_importtime(result.stderr)
+    # Imports of app.py itself, and those made later while building components
+    top_level = [module for module in modules
+                 if module['depth'] == 1 or (module['depth'] == 0 and module['name'] != 'app')]
+    report['slowest_packages'] = sorted(top_level, key=lambda m: m['cumulative_us'], reverse=True)[:top]
+    report['slowest_modules'] = sorted(modules, key=lambda m: m['self_us'], reverse=True)[:top]
+    report['modules_imported'] = len(modules)
+    return report
+
+
+def format_report(report):
+    """Render a profile report as text."""
+    lines = [f"Importing app: {report['import_seconds']:.3f}s ({report['modules_imported']} modules)", '']
+
+    lines.append('Slowest packages (cumulative):')
+    for module in report['slowest_packages']:
+        lines.append(f"  {module['cumulative_us'] / 1e6:8.3f}s  {module['name']}")
+    lines.append('')
+
+    lines.append('Slowest modules (own time):')
+    for module in report['slowest_modules']:
+        lines.append(f"  {module['self_us'] / 1e6:8.3f}s  {module['name']}")
+    lines.append('')
+
+    lines.append('Components:')
+    for component in report['components']:
+        if component['error']:
+            lines.append(f"  {component['name']}: failed: {component['error']}")
+        else:
+            lines.append(f"  {component['build_seconds']:8.3f}s  {component['name']}")
+    lines.append('')
+
+    if report['network_attempts']:
+        lines.append('Network access during startup:')
+        lines.extend(f"  {attempt}" for attempt in report['network_attempts'])
+    else:
+        lines.append('No network access during startup')
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Profile the import time and startup of the app.')
+    parser.add_argument('--top', type=int, default=15, help='modules to list in each ranking')
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    args = parser.parse_args()
+
+    try:
+        report = profile_startup(top=args.top)
+    except RuntimeError as e:
+        print(e, file=sys.stderr)
+        return 2
+
+    print(json.dumps(report, indent=2) if args.json else format_report(report))
+    return 1 if report['network_attempts'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,253 @@
+import re
+import copy
+import hashlib
+
+# Variable parts of a log line, masked before tokens are compared; order matters
+# because later masks would otherwise eat pieces of the earlier ones
+MASKS = [
+    ('<TIME>', re.compile(r'\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}:\d{2}(?:[.,]\d+)?(?:Z|[+-]\d{2}:?\d{2})?|\b\d{2}:\d{2}:\d{2}(?:[.,]\d+)?\b')),
+    ('<UUID>', re.compile(r'\b[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}\b')),
+    ('<IP>', re.compile(r'\b(?:\d{1,3}\.){3}\d{1,3}(?::\d+)?\b')),
+    ('<PATH>', re.compile(r'(?:[A-Za-z]:\\|~?/)[\w.\-]+(?:[/\\][\w.\-]+)+')),
+    ('<HEX>', re.compile(r'\b0[xX][0-9a-fA-F]+\b|\b(?=[0-9a-fA-F]*\d)[0-9a-fA-F]{8,}\b')),
+    ('<NUM>', re.compile(r'[-+]?\b\d+(?:\.\d+)?\b')),
+]
+
+WILDCARD = '<*>'
+
+# Lines a miner keeps to be replayed when merged, more than a content-defined
+# chunk of analyze() holds (chunk_scan.CHUNK_MAX_LINES), so chunk merges are exact
+DEFAULT_REPLAY_LINES = 5000
+
+_DIGIT = re.compile(r'\d')
+
+
+class _Cluster:
+    """A group of log lines that share one template."""
+
+    __slots__ = ('tokens', 'kind', 'count', 'first_line', 'last_line', 'samples')
+
+    def __init__(self, tokens, kind, line_number):
+        self.tokens = tokens
+        self.kind = kind
+        self.count = 0
+        self.first_line = line_number
+        self.last_line = line_number
+        self.samples = []
+
+
+class TemplateMiner:
+    """
+    Online log template miner based on Drain's fixed-depth parse tree.
+
+    Lines are masked, split into tokens and routed by category, token count
+    and their first tokens to a small list of clusters; the most similar
+    cluster above a threshold absorbs the line and generalizes its template,
+    otherwise a new cluster is created. Each line is handled in time
+    independent of the number of lines seen so far.
+
+    Clusters depend on the order lines arrive in, so miners of consecutive
+    pieces of a log only merge into the clusters of a single pass when the
+    later piece's lines are replayed. A miner keeps its first replay_limit
+    lines for that; a piece with more lines is folded in by its templates,
+    and sampling() counts the lines whose clusters may then differ.
+    """
+
+    def __init__(self, depth=4, similarity=0.5, max_children=100, max_samples=3,
+                 replay_limit=DEFAULT_REPLAY_LINES):
+        """
+        Create an empty miner.
+
+        Args:
+            depth (int): Depth of the parse tree, including the root and leaf levels
+            similarity (float): Fraction of matching tokens needed to join a cluster
+            max_children (int): Children per tree node before new tokens share a wildcard
+            max_samples (int): Example lines kept per cluster
+            replay_limit (int): Lines kept to replay when the miner is merged
+        """
+        self.depth = depth
+        self.similarity = similarity
+        self.max_children = max_children
+        self.max_samples = max_samples
+        self.replay_limit = replay_limit
+        self.root = {}
+        self.clusters = []
+        self.total = 0
+        # Lines merged by their templates rather than replayed
+        self.approximate = 0
+        # Masked lines as (masked, kind, line number, line), None once there
+        # were more than replay_limit
+        self.replay = []
+
+    def mask(self, line):
+        """Replace variable parts of a line with placeholders."""
+        for placeholder, regex in MASKS:
+            line = regex.sub(placeholder, line)
+        return line
+
+    def add(self, line, line_number, kind=None):
+        """
+        Add one line to its cluster.
+
+        Args:
+            line (str): The log line
+            line_number (int): 1-based line number
+            kind (str, optional): Category of the line, such as its error type
+        """
+        masked = self.mask(line)
+        self._absorb(masked.split(), kind, line_number, line)
+        self._keep(masked, kind, line_number, line)
+
+    def merge(self, other, line_offset=0):
+        """
+        Fold the clusters of a miner that covered a later piece of the same log.
+
+        The other miner's lines are replayed when it kept them all, which gives
+        the clusters of a single pass; otherwise its clusters are folded in by
+        template. The other miner is left as it is.
+
+        Args:
+            other (TemplateMiner): Miner to fold in
+            line_offset (int): Lines before the other miner's piece
+        """
+        if not other.total:
+            return
+
+        if not self.total:
+            # Nothing to replay onto: the other miner's clusters are the clusters
+            self.root, self.clusters = copy.deepcopy((other.root, other.clusters))
+            for cluster in self.clusters:
+                cluster.first_line += line_offset
+                cluster.last_line += line_offset
+                cluster.samples = [(line_number + line_offset, line) for line_number, line in cluster.samples]
+            self.total = other.total
+            self.approximate = other.approximate
+            self.replay = None if other.replay is None else [
+                (masked, kind, line_number + line_offset, line) for masked, kind, line_number, line in other.replay]
+            return
+
+        if other.replay is not None:
+            for masked, kind, line_number, line in other.replay:
+                self._absorb(masked.split(), kind, line_number + line_offset, line)
+                self._keep(masked, kind, line_number + line_offset, line)
+            self.approximate += other.approximate
+            return
+
+        for cluster in other.clusters:
+            self._fold(cluster, line_offset)
+        self.total += other.total
+        self.approximate += other.total
+        self.replay = None
+
+    def sampling(self):
+        """
+        Describe how exact the clusters are.
+
+        Returns:
+            dict: Lines clustered, clusters, and the lines that were merged by
+                template, whose clusters may differ from a single pass
+        """
+        return {'total': self.total, 'clusters': len(self.clusters), 'approximate': self.approximate}
+
+    def _keep(self, masked, kind, line_number, line):
+        """Keep a line for replay, or give up on replay once there are too many."""
+        if self.replay is None:
+            return
+        if len(self.replay) < self.replay_limit:
+            self.replay.append((masked, kind, line_number, line))
+        else:
+            self.replay = None
+
+    def _absorb(self, tokens, kind, line_number, line):
+        """Merge a line into the best cluster, creating one if needed."""
+        leaf = self._leaf(kind, tokens)
+        cluster = self._best_match(leaf, tokens)
+
+        if cluster is None:
+            cluster = _Cluster(tokens, kind, line_number)
+            leaf.append(cluster)
+            self.clusters.append(cluster)
+        else:
+            cluster.tokens = [token if token == other else WILDCARD
+                              for token, other in zip(cluster.tokens, tokens)]
+
+        cluster.count += 1
+        cluster.last_line = line_number
+        self.total += 1
+        # Lines arrive in order, so the first ones are the samples
+        if len(cluster.samples) < self.max_samples:
+            cluster.samples.append((line_number, line))
+
+    def _fold(self, other, line_offset):
+        """Merge a cluster of a later piece into the cluster of its template, creating one if needed."""
+        tokens = list(other.tokens)
+        leaf = self._leaf(other.kind, tokens)
+        cluster = self._best_match(leaf, tokens)
+
+        if cluster is None:
+            cluster = _Cluster(tokens, other.kind, other.first_line + line_offset)
+            leaf.append(cluster)
+            self.clusters.append(cluster)
+        else:
+            cluster.tokens = [token if token == theirs else WILDCARD
+                              for token, theirs in zip(cluster.tokens, tokens)]
+
+        cluster.count += other.count
+        cluster.last_line = other.last_line + line_offset
+        if len(cluster.samples) < self.max_samples:
+            cluster.samples.extend((line_number + line_offset, line)
+                                   for line_number, line in other.samples[:self.max_samples - len(cluster.samples)])
+
+    def _leaf(self, kind, tokens):
+        """Find or create the leaf cluster list for a token sequence."""
+        node = self.root.setdefault((kind, len(tokens)), {})
+
+        for token in tokens[:self.depth - 2]:
+            # Tokens carrying numbers are too variable to route on
+            key = WILDCARD if _DIGIT.search(token) else token
+            if key not in node:
+                if key != WILDCARD and len(node) >= self.max_children:
+                    key = WILDCARD
+                node = node.setdefault(key, {})
+            else:
+                node = node[key]
+
+        return node.setdefault(None, [])
+
+    def _best_match(self, leaf, tokens):
+        """Return the most similar cluster in a leaf, if similar enough."""
+        best = None
+        best_key = None
+        for cluster in leaf:
+            same = wildcards = 0
+            for token, other in zip(cluster.tokens, tokens):
+                if token == WILDCARD:
+                    wildcards += 1
+                elif token == other:
+                    same += 1
+            score = same / len(tokens) if tokens else 1.0
+            if score >= self.similarity and (best_key is None or (score, wildcards) > best_key):
+                best = cluster
+                best_key = (score, wildcards)
+        return best
+
+    def summary(self):
+        """
+        List the clusters, largest first.
+
+        Returns:
+            list: One dict per cluster with its fingerprint, template, count,
+                first/last line and sample lines
+        """
+        clusters = sorted(self.clusters, key=lambda cluster: (-cluster.count, cluster.first_line))
+        return [{
+            'fingerprint': hashlib.blake2b(f"{cluster.kind}:{' '.join(cluster.tokens)}".encode('utf-8'),
+                                           digest_size=8).hexdigest(),
+            'template': ' '.join(cluster.tokens),
+            'error_type': cluster.kind,
+            'count': cluster.count,
+            'first_line': cluster.first_line,
+            'last_line': cluster.last_line,
+            'samples': [{'line_number': line_number, 'message': line}
+                        for line_number, line in cluster.samples]
+        } for cluster in clusters]
@@ -0,0 +1,435 @@
+import time
+from array import array
+import numpy as np
+
+_MONTHS = 'Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec'
+
+# Timestamp formats, one named group each, in the order of their kind codes:
+# ISO-8601 (also log4j's default ISO8601 layout with a comma before the millis),
+# log4j's DATE layout, syslog (no year) and epoch milliseconds
+TIMESTAMP_FORMATS = [
+    ('iso8601', r'\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}:\d{2}(?:[.,]\d+)?(?:Z|[-+]\d{2}:?\d{2})?'),
+    ('log4j', r'\d{2} (?:' + _MONTHS + r') \d{4} \d{2}:\d{2}:\d{2}(?:,\d{3})?'),
+    ('syslog', r'(?:' + _MONTHS + r') [ \d]\d \d{2}:\d{2}:\d{2}'),
+    ('epoch_ms', r'(?<!\d)1\d{12}(?!\d)')
+]
+
+TIMESTAMP_KINDS = [kind for kind, _ in TIMESTAMP_FORMATS]
+TIMESTAMP_KIND_CODES = {kind: code for code, kind in enumerate(TIMESTAMP_KINDS)}
+
+# Only ASCII digits are meant; str regexes should be compiled with re.ASCII.
+# The leading lookahead lists every character a stamp can start with, which
+# lets the regex engine skip other positions without trying each format.
+TIMESTAMP_PATTERN = '(?=[0-9JFMASOND])(?:' + '|'.join('(?P<%s>%s)' % (kind, pattern)
+                                                      for kind, pattern in TIMESTAMP_FORMATS) + ')'
+
+# Level of a line for the per-bucket counters
+OTHER, WARNING, ERROR = 0, 1, 2
+
+# Stamps parsed per batch; the raw strings of a batch are dropped once parsed
+DEFAULT_BATCH_SIZE = 65536
+
+# Approximate number of buckets in the error-rate series, and the bucket widths to pick from
+TARGET_BUCKETS = 60
+BUCKET_SECONDS = [1, 5, 10, 30, 60, 300, 600, 900, 1800, 3600, 3 * 3600, 6 * 3600, 12 * 3600, 86400, 7 * 86400]
+
+# Marker for stamps that match a format but are not a valid date
+INVALID = np.iinfo(np.int64).min
+
+# Syslog stamps carry no year; they are parsed into this leap year and moved
+# to the log's own year once the whole log has been seen
+SYSLOG_REFERENCE_YEAR = 2000
+
+DAY_MS = 86400 * 1000
+
+# Month names packed into one integer each, sorted for searchsorted, and their numbers
+_MONTH_TABLE = sorted((ord(name[0]) << 16 | ord(name[1]) << 8 | ord(name[2]), number)
+                      for number, name in enumerate(_MONTHS.split('|'), 1))
+_MONTH_CODES = np.array([code for code, _ in _MONTH_TABLE], dtype=np.int64)
+_MONTH_NUMBERS = np.array([number for _, number in _MONTH_TABLE], dtype=np.int64)
+
+
+def _number(chars, start, width):
+    """Read a fixed-width decimal field from every row of a character matrix."""
+    value = np.zeros(len(chars), dtype=np.int64)
+    for column in range(start, start + width):
+        value = value * 10 + (chars[:, column] - 48)
+    return value
+
+
+def _month(chars, start):
+    """Read a three-letter month name from every row, 0 where it is not one."""
+    code = chars[:, start] << 16 | chars[:, start + 1] << 8 | chars[:, start + 2]
+    position = np.minimum(np.searchsorted(_MONTH_CODES, code), len(_MONTH_CODES) - 1)
+    return np.where(_MONTH_CODES[position] == code, _MONTH_NUMBERS[position], 0)
+
+
+def _milliseconds(year, month, day, hour, minute, second, millis):
+    """Combine date and time fields into epoch milliseconds, INVALID for impossible dates."""
+    valid = (month >= 1) & (month <= 12) & (day >= 1) & (hour < 24) & (minute < 60) & (second < 61)
+    month = np.where(valid, month, 1)
+    day = np.where(valid, day, 1)
+
+    months = (year - 1970).astype('datetime64[Y]').astype('datetime64[M]') + (month - 1).astype('timedelta64[M]')
+    days = months.astype('datetime64[D]') + (day - 1).astype('timedelta64[D]')
+
+    # Day 31 of a 30-day month rolls over into the next month
+    valid &= days.astype('datetime64[M]') == months
+
+    value = (days.astype(np.int64) * 86400 + (hour * 60 + minute) * 60 + second) * 1000 + millis
+    return np.where(valid, value, INVALID)
+
+
+def _fraction(chars, start):
+    """Milliseconds of a fraction whose digits start at a column, and the number of digits."""
+    digits = (chars[:, start:] >= 48) & (chars[:, start:] <= 57)
+    run = np.cumprod(digits, axis=1)
+    millis = np.zeros(len(chars), dtype=np.int64)
+    for column in range(3):
+        millis = millis * 10 + np.where(run[:, column], chars[:, start + column] - 48, 0)
+    return millis, run.sum(axis=1)
+
+
+def _parse_iso8601(chars):
+    """Parse ISO-8601 stamps, with an optional fraction and UTC offset."""
+    rows = np.arange(len(chars))
+    has_fraction = (chars[:, 19] == ord('.')) | (chars[:, 19] == ord(','))
+    millis, length = _fraction(chars, 20)
+    millis = np.where(has_fraction, millis, 0)
+
+    # Offset from UTC, in minutes, right after the seconds or the fraction
+    zone = np.where(has_fraction, 20 + length, 19)
+    sign = chars[rows, zone]
+    colon = (chars[rows, zone + 3] == ord(':')).astype(np.int64)
+    hours = (chars[rows, zone + 1] - 48) * 10 + chars[rows, zone + 2] - 48
+    minutes = (chars[rows, zone + 3 + colon] - 48) * 10 + chars[rows, zone + 4 + colon] - 48
+    offset = np.where(sign == ord('+'), 1, np.where(sign == ord('-'), -1, 0)) * (hours * 60 + minutes)
+
+    value = _milliseconds(_number(chars, 0, 4), _number(chars, 5, 2), _number(chars, 8, 2),
+                          _number(chars, 11, 2), _number(chars, 14, 2), _number(chars, 17, 2), millis)
+    return np.where(value == INVALID, INVALID, value - offset * 60000)
+
+
+def _parse_log4j(chars):
+    """Parse log4j DATE stamps such as ``01 Mar 2024 10:00:00,123``."""
+    millis = np.where(chars[:, 20] == ord(','), _number(chars, 21, 3), 0)
+    return _milliseconds(_number(chars, 7, 4), _month(chars, 3), _number(chars, 0, 2),
+                         _number(chars, 12, 2), _number(chars, 15, 2), _number(chars, 18, 2), millis)
+
+
+def _parse_syslog(chars, year):
+    """Parse syslog stamps such as ``Mar  1 10:00:00`` in the given year."""
+    day = np.where(chars[:, 4] == ord(' '), 0, chars[:, 4] - 48) * 10 + chars[:, 5] - 48
+    return _milliseconds(np.full(len(chars), year, dtype=np.int64), _month(chars, 0), day,
+                         _number(chars, 7, 2), _number(chars, 10, 2), _number(chars, 13, 2), 0)
+
+
+def parse_timestamps(texts, kinds, year=None):
+    """
+    Parse a batch of timestamp strings without a Python-level loop per stamp.
+
+    Stamps of each format are laid out as rows of a character matrix and
+    their fields are read column by column with NumPy.
+
+    Args:
+        texts (list): Timestamp strings, as matched by TIMESTAMP_PATTERN
+        kinds (sequence): Kind code of each string, from TIMESTAMP_KIND_CODES
+        year (int, optional): Year assumed for syslog stamps, defaults to the current year
+
+    Returns:
+        numpy.ndarray: Milliseconds since the epoch (UTC when the stamp carries
+            an offset), INVALID where a stamp is not a real date
+    """
+    if year is None:
+        year = time.gmtime().tm_year
+
+    kinds = np.asarray(kinds, dtype=np.uint8)
+    result = np.full(len(texts), INVALID, dtype=np.int64)
+
+    for code, kind in enumerate(TIMESTAMP_KINDS):
+        indices = np.flatnonzero(kinds == code)
+        if not len(indices):
+            continue
+
+        # One row per stamp, padded with zeros so fixed columns past the end read as 0
+        strings = np.array([texts[i] for i in indices])
+        width = strings.dtype.itemsize // 4
+        chars = np.zeros((len(indices), width + 8), dtype=np.int64)
+        chars[:, :width] = strings.view(np.uint32).reshape(len(indices), width)
+
+        if kind == 'iso8601':
+            result[indices] = _parse_iso8601(chars)
+        elif kind == 'log4j':
+            result[indices] = _parse_log4j(chars)
+        elif kind == 'syslog':
+            result[indices] = _parse_syslog(chars, year)
+        else:
+            result[indices] = _number(chars, 0, 13)
+
+    return result
+
+
+def _resolve_syslog(values, year):
+    """
+    Move syslog stamps parsed in SYSLOG_REFERENCE_YEAR to the given year.
+
+    A stamp more than half a year before the previous one is taken to be in the
+    next year, so a log that runs past New Year stays in order.
+    """
+    reference = np.datetime64(SYSLOG_REFERENCE_YEAR - 1970, 'Y').astype('datetime64[D]').astype(np.int64) * DAY_MS
+    offsets = values - reference
+
+    rollovers = np.concatenate(([0], np.cumsum(np.diff(values) < -183 * DAY_MS)))
+    years = year + rollovers
+    starts = (years - 1970).astype('datetime64[Y]').astype('datetime64[D]').astype(np.int64) * DAY_MS
+
+    # Past February the reference year is a day ahead of a common year
+    leap = (years % 4 == 0) & ((years % 100 != 0) | (years % 400 == 0))
+    offsets = offsets - np.where(~leap & (offsets >= 60 * DAY_MS), DAY_MS, 0)
+    return starts + offsets
+
+
+def _counter(values):
+    """Copy a sequence of counts into an unsigned int array."""
+    counter = array('I')
+    counter.frombytes(np.asarray(values, dtype=np.uint32).tobytes())
+    return counter
+
+
+def _iso(milliseconds, unit='s'):
+    """Format epoch milliseconds as an ISO-8601 string."""
+    return str(np.datetime_as_string(np.datetime64(int(milliseconds), 'ms'), unit=unit))
+
+
+class TimeSeries:
+    """
+    Parsed timestamps of a log and the lines, errors and warnings under each.
+
+    Every line with a timestamp starts an event; lines without one (such as
+    stack trace frames) count towards the event before them. Raw stamps are
+    buffered and parsed in vectorized batches, so only a few integers per
+    event are kept, and series built for consecutive pieces of a log can be
+    merged.
+    """
+
+    def __init__(self, batch_size=DEFAULT_BATCH_SIZE, year=None):
+        """
+        Create an empty series.
+
+        Args:
+            batch_size (int): Number of raw stamps buffered before they are parsed
+            year (int, optional): Year assumed for syslog stamps, which carry
+                none, when the log has no stamps with a year either; defaults
+                to the current year
+        """
+        self.batch_size = batch_size
+        self.year = year if year is not None else time.gmtime().tm_year
+        self.kinds = array('B')
+        self.lines = array('I')
+        self.times = []
+
+        # Event index of every error and warning line
+        self.error_events = array('I')
+        self.warning_events = array('I')
+        self.pending = []
+
+        # Lines, errors and warnings before the first timestamp
+        self.lead = [0, 0, 0]
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def add(self, text, kind, level=OTHER):
+        """
+        Start an event at a line with a timestamp.
+
+        Args:
+            text (str): The timestamp as matched by TIMESTAMP_PATTERN
+            kind (int): Its code from TIMESTAMP_KIND_CODES
+            level (int): ERROR, WARNING or OTHER for the line
+        """
+        self.pending.append(text)
+        self.kinds.append(kind)
+        self.lines.append(1)
+        if level == ERROR:
+            self.error_events.append(len(self.lines) - 1)
+        elif level == WARNING:
+            self.warning_events.append(len(self.lines) - 1)
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def count(self, level=OTHER):
+        """Count a line without a timestamp towards the current event."""
+        if not self.lines:
+            self.lead[0] += 1
+            self.lead[1] += level == ERROR
+            self.lead[2] += level == WARNING
+            return
+        self.lines[-1] += 1
+        if level == ERROR:
+            self.error_events.append(len(self.lines) - 1)
+        elif level == WARNING:
+            self.warning_events.append(len(self.lines) - 1)
+
+    def add_many(self, texts, kinds):
+        """
+        Start one event per timestamp, with the line counts filled in later by set_counts().
+
+        Args:
+            texts (list): Timestamps as matched by TIMESTAMP_PATTERN
+            kinds (list): Their codes from TIMESTAMP_KIND_CODES
+        """
+        self.pending.extend(texts)
+        self.kinds.extend(kinds)
+        self.flush()
+
+    def set_counts(self, lines, error_events, warning_events, lead):
+        """
+        Replace the line counters, for callers that count lines in bulk.
+
+        Args:
+            lines (sequence): Lines per event
+            error_events (sequence): Event index of every error line after the first event
+            warning_events (sequence): Event index of every warning line after the first event
+            lead (list): Lines, errors and warnings before the first event
+        """
+        self.lines = _counter(lines)
+        self.error_events = _counter(error_events)
+        self.warning_events = _counter(warning_events)
+        self.lead = [int(value) for value in lead]
+
+    def flush(self):
+        """Parse the buffered raw stamps."""
+        if self.pending:
+            start = len(self.kinds) - len(self.pending)
+            self.times.append(parse_timestamps(self.pending, self.kinds[start:], SYSLOG_REFERENCE_YEAR))
+            self.pending = []
+
+    def merge(self, other):
+        """
+        Append the events of a series that covered the next piece of the same log.
+
+        Args:
+            other (TimeSeries): Series to append
+        """
+        self.flush()
+        other.flush()
+
+        # Lines at the start of the next piece belong to this piece's last event
+        lead_lines, lead_errors, lead_warnings = other.lead
+        if self.lines:
+            last = len(self.lines) - 1
+            self.lines[-1] += lead_lines
+            self.error_events.extend([last] * lead_errors)
+            self.warning_events.extend([last] * lead_warnings)
+        else:
+            self.lead = [self.lead[0] + lead_lines, self.lead[1] + lead_errors, self.lead[2] + lead_warnings]
+
+        offset = len(self.lines)
+        self.error_events.extend(_counter(np.frombuffer(other.error_events, dtype=np.uint32) + offset))
+        self.warning_events.extend(_counter(np.frombuffer(other.warning_events, dtype=np.uint32) + offset))
+        self.kinds.extend(other.kinds)
+        self.lines.extend(other.lines)
+        self.times.extend(other.times)
+
+    def summary(self):
+        """
+        Describe the parsed timestamps.
+
+        Returns:
+            dict: Start, end and duration, the number of stamps per format, the
+                per-bucket line, error and warning counts, error bursts and the
+                distribution of gaps between consecutive events; empty when
+                fewer than two stamps could be parsed
+        """
+        self.flush()
+        times = np.concatenate(self.times) if self.times else np.empty(0, dtype=np.int64)
+        kinds = np.frombuffer(self.kinds, dtype=np.uint8)
+        valid = times != INVALID
+
+        # Syslog stamps take the year of the first stamp that has one
+        syslog = valid & (kinds == TIMESTAMP_KIND_CODES['syslog'])
+        if syslog.any():
+            dated = np.flatnonzero(valid & ~syslog)
+            year = (int(np.datetime64(int(times[dated[0]]), 'ms').astype('datetime64[Y]').astype(np.int64)) + 1970
+                    if len(dated) else self.year)
+            times = times.copy()
+            times[syslog] = _resolve_syslog(times[syslog], year)
+
+        times = times[valid]
+        if len(times) < 2:
+            return {}
+
+        events = len(self.lines)
+        lines = np.frombuffer(self.lines, dtype=np.uint32)[valid].astype(np.int64)
+        errors = np.bincount(np.frombuffer(self.error_events, dtype=np.uint32), minlength=events)[valid]
+        warnings = np.bincount(np.frombuffer(self.warning_events, dtype=np.uint32), minlength=events)[valid]
+        kinds = kinds[valid]
+
+        ordered = np.sort(times)
+        start, end = int(ordered[0]), int(ordered[-1])
+
+        # Bucket width: the smallest round width that gives about TARGET_BUCKETS
+        # buckets, or whole multiples of the widest one for very long logs
+        span = end - start
+        widest = BUCKET_SECONDS[-1] * 1000
+        width = next((seconds * 1000 for seconds in BUCKET_SECONDS if seconds * 1000 * TARGET_BUCKETS >= span),
+                     -(-span // (TARGET_BUCKETS * widest)) * widest)
+        first_bucket = start - start % width
+        buckets = (times - first_bucket) // width
+        size = int(buckets.max()) + 1
+        bucket_lines = np.bincount(buckets, weights=lines, minlength=size).astype(np.int64)
+        bucket_errors = np.bincount(buckets, weights=errors, minlength=size).astype(np.int64)
+        bucket_warnings = np.bincount(buckets, weights=warnings, minlength=size).astype(np.int64)
+
+        gaps = np.diff(ordered) / 1000.0
+        largest = int(np.argmax(gaps))
+        percentiles = np.percentile(gaps, [50, 90, 99])
+
+        return {
+            'start': _iso(start, 'ms'),
+            'end': _iso(end, 'ms'),
+            'duration_seconds': span / 1000.0,
+            'parsed_count': int(len(times)),
+            'formats': {kind: int(count)
+                        for kind, count in zip(TIMESTAMP_KINDS, np.bincount(kinds, minlength=len(TIMESTAMP_KINDS)))
+                        if count},
+            'bucket_seconds': width // 1000,
+            'buckets': [{
+                'start': _iso(first_bucket + i * width),
+                'lines': int(bucket_lines[i]),
+                'errors': int(bucket_errors[i]),
+                'warnings': int(bucket_warnings[i])
+            } for i in range(size)],
+            'bursts': self._bursts(bucket_errors, bucket_lines, first_bucket, width),
+            'gaps': {
+                'p50_seconds': round(float(percentiles[0]), 3),
+                'p90_seconds': round(float(percentiles[1]), 3),
+                'p99_seconds': round(float(percentiles[2]), 3),
+                'mean_seconds': round(float(gaps.mean()), 3),
+                'max_seconds': round(float(gaps[largest]), 3),
+                'longest': {'start': _iso(ordered[largest], 'ms'), 'end': _iso(ordered[largest + 1], 'ms')}
+            }
+        }
+
+    def _bursts(self, errors, lines, first_bucket, width):
+        """Runs of buckets whose error count is far above the typical bucket."""
+        median = float(np.median(errors))
+        spread = 1.4826 * float(np.median(np.abs(errors - median)))
+        threshold = median + 3 * max(spread, np.sqrt(median), 1.0)
+
+        bursts = []
+        hot = np.flatnonzero(errors > threshold)
+        if not len(hot):
+            return bursts
+
+        # Split the hot buckets into runs of consecutive ones
+        for run in np.split(hot, np.flatnonzero(np.diff(hot) > 1) + 1):
+            bursts.append({
+                'start': _iso(first_bucket + int(run[0]) * width),
+                'end': _iso(first_bucket + (int(run[-1]) + 1) * width),
+                'errors': int(errors[run].sum()),
+                'lines': int(lines[run].sum()),
+                'peak_errors': int(errors[run].max())
+            })
+        return bursts
@@ -1,22 +1,33 @@
-import requests
-from bs4 import BeautifulSoup
 import re
+import io
 import json
 import os
 import time
 from urllib.parse import urlparse
 import logging
+from .log_source import open_log, detect_compression, MAGIC_BYTES, CorruptLog, LogTooLarge, DEFAULT_MAX_UPLOAD_BYTES
 
 class WebScraper:
     """
     Handles web scraping to fetch log content from URLs and learn from technical documentation.
     """
     
-    def __init__(self):
-        """Initialize the web scraper with necessary configurations."""
+    def __init__(self, max_log_bytes=DEFAULT_MAX_UPLOAD_BYTES):
+        """
+        Initialize the web scraper with necessary configurations.
+        
+        Args:
+            max_log_bytes (int, optional): Most bytes of decompressed content
+                read from a URL; None reads content of any size
+        """
+        self.max_log_bytes = max_log_bytes
         self.headers = {
             'User-Agent': 'DevOpsDebugWizard/1.0 (Learning Tool for DevOps Debugging)'
         }
+        
+        # requests and BeautifulSoup are imported on first use, as they are
+        # slow to import and not needed to analyze pasted logs
+        import requests
         self.session = requests.Session()
         self.session.headers.update(self.headers)
         self.logger = logging.getLogger(__name__)
@@ -80,26 +91,57 @@ class WebScraper:
             return json.load(f)
     
     def fetch_content(self, url):
-        """Fetch content from a URL."""
+        """
+        Fetch content from a URL.
+        
+        Logs compressed with gzip, bzip2, xz or zstd, such as CI artifacts, are
+        recognized by their magic bytes and returned decompressed. Content is
+        read as it downloads and cut off at max_log_bytes once decompressed, so
+        a small compressed file cannot unpack to gigabytes.
+        """
         if not url:
             return None
-            
+        
+        import requests
+        from urllib3.exceptions import HTTPError as TransferError
         max_retries = 3
         retry_count = 0
         
         while retry_count < max_retries:
             try:
-                response = self.session.get(url, timeout=10)
-                response.raise_for_status()  # Raise an exception for 4XX/5XX responses
-                
-                # Check if it's likely a text-based content
-                content_type = response.headers.get('Content-Type', '').lower()
-                if 'text' in content_type or 'json' in content_type or 'xml' in content_type:
-                    return response.text
+                with self._get(url) as response:
+                    body = io.BufferedReader(response.raw)
+                    content_type = response.headers.get('Content-Type', '').lower()
                     
-                # For binary content, log a warning and return a placeholder
-                self.logger.warning(f"Binary content detected at {url}")
-                return f"Binary content from {url} (could not parse as text)"
+                    # Compressed logs are served under all sorts of content types
+                    compressed = detect_compression(body.peek(MAGIC_BYTES)[:MAGIC_BYTES]) is not None
+                    
+                    # Check if it's likely a text-based content
+                    if compressed or 'text' in content_type or 'json' in content_type or 'xml' in content_type:
+                        with open_log(body, max_bytes=self.max_log_bytes) as stream:
+                            encoding = 'utf-8' if compressed else response.encoding or 'utf-8'
+                            return stream.read().decode(encoding, errors='replace')
+                    
+                    # For binary content, log a warning and return a placeholder
+                    self.logger.warning(f"Binary content detected at {url}")
+                    return f"Binary content from {url} (could not parse as text)"
+                
+            except LogTooLarge as e:
+                self.logger.error(f"Content from {url} is too large: {str(e)}")
+                return f"Error reading {url}: the content is larger than {self.max_log_bytes} bytes once decompressed"
+            
+            except CorruptLog as e:
+                self.logger.error(f"Error decompressing content from {url}: {str(e)}")
+                return f"Error reading compressed log from {url}: {str(e)}"
+            
+            except ValueError as e:
+                # A zstd-compressed log without the zstandard package
+                self.logger.error(f"Error decompressing content from {url}: {str(e)}")
+                return f"Error reading compressed log from {url}: {str(e)}"
+            
+            except TransferError as e:
+                self.logger.error(f"Error downloading content from {url}: {str(e)}")
+                return f"Error accessing {url}: the download failed: {str(e)}"
                 
             except requests.ConnectionError as e:
                 retry_count += 1
@@ -128,6 +170,48 @@ class WebScraper:
                 
                 return f"Error accessing {url}: {error_message}"
     
+    def open_content(self, url):
+        """
+        Open the content of a URL as a stream, for a log too large to fetch whole.
+        
+        The content is read as it downloads and decompressed if needed, as
+        fetch_content() does, so it is never held in memory at once.
+        
+        Args:
+            url (str): URL of the log
+            
+        Returns:
+            io.BufferedReader: The decompressed content, iterable by lines;
+                reading past max_log_bytes raises LogTooLarge, and reading
+                truncated or corrupt compressed data raises CorruptLog
+            
+        Raises:
+            requests.RequestException: If the URL cannot be fetched
+            ValueError: If the log is zstd-compressed and the zstandard package
+                is not installed
+        """
+        response = self._get(url)
+        try:
+            return open_log(response.raw, close_source=True, max_bytes=self.max_log_bytes)
+        except Exception:
+            response.close()
+            raise
+    
+    def _get(self, url):
+        """Start downloading a URL, raising for error statuses; the body is left unread."""
+        # Only gzip transfer encoding is accepted: the raw body is then decompressed
+        # by open_log(), which recognizes gzip by its magic bytes, within the size limit
+        response = self.session.get(url, timeout=10, stream=True, headers={'Accept-Encoding': 'gzip'})
+        # The body is read through io wrappers, which refuse to read a stream that
+        # reports itself closed, as urllib3 does on its own once the body is exhausted
+        response.raw.auto_close = False
+        try:
+            response.raise_for_status()
+        except Exception:
+            response.close()
+            raise
+        return response
+    
     def extract_knowledge(self, content, url):
         """
         Extract knowledge from content for learning.
@@ -176,6 +260,7 @@ class WebScraper:
     
     def _extract_log_from_html(self, html_content, url):
         """Extract log content from HTML."""
+        from bs4 import BeautifulSoup
         soup = BeautifulSoup(html_content, 'html.parser')
         
         # Look for common log containers
@@ -214,6 +299,7 @@ class WebScraper:
         knowledge = []
         
         # Extract headings and their content
+        from bs4 import BeautifulSoup
         soup = BeautifulSoup(content, 'html.parser')
         headings = soup.find_all(['h1', 'h2', 'h3', 'h4'])
         
@@ -274,6 +360,7 @@ class WebScraper:
     
     def _extract_from_stackoverflow(self, content, url):
         """Extract knowledge from Stack Overflow."""
+        from bs4 import BeautifulSoup
         soup = BeautifulSoup(content, 'html.parser')
         
         knowledge = []
@@ -0,0 +1,184 @@
+import os
+import signal
+import sqlite3
+import weakref
+import threading
+from collections import Counter
+
+# Pending changes are written at least this often...
+DEFAULT_FLUSH_SECONDS = 2.0
+# ...or as soon as this many have piled up
+DEFAULT_FLUSH_EVENTS = 500
+
+# Every buffer, so forked children can drop what their parent will write
+_buffers = weakref.WeakSet()
+
+
+def _reset_after_fork():
+    """Give every buffer an empty state, a fresh lock and no flusher in a forked child."""
+    for buffer in list(_buffers):
+        buffer._lock = threading.Lock()
+        buffer._wake = threading.Event()
+        buffer._counts = Counter()
+        buffer._solutions = {}
+        buffer._events = 0
+        buffer._thread = None
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def exit_on_sigterm():
+    """
+    Make SIGTERM exit the process the way Ctrl+C does, running atexit hooks.
+
+    Only replaces the default action, which kills the process without any
+    cleanup; servers that handle SIGTERM themselves, such as gunicorn, keep
+    their handler. Must be called from the main thread.
+
+    Returns:
+        bool: True if the handler was installed
+    """
+    if threading.current_thread() is not threading.main_thread():
+        return False
+    if signal.getsignal(signal.SIGTERM) is not signal.SIG_DFL:
+        return False
+
+    def handle(signum, frame):
+        raise SystemExit(128 + signum)
+
+    signal.signal(signal.SIGTERM, handle)
+    return True
+
+
+class WriteBehind:
+    """
+    Buffers statistics counters and solution counters of a knowledge store.
+
+    Increments add up in memory and a daemon thread writes them in one
+    transaction every few seconds, or sooner once enough have piled up, so
+    recording an analysis does no disk I/O. A solution whose counters changed
+    is written whole, as it is at flush time. close() writes what is left;
+    the knowledge base calls it at exit. A crash loses the increments of the
+    last interval at most.
+    """
+
+    def __init__(self, store, interval=DEFAULT_FLUSH_SECONDS, max_events=DEFAULT_FLUSH_EVENTS):
+        """
+        Create a buffer; its flusher starts with the first change.
+
+        Args:
+            store (KnowledgeStore): Where changes are written
+            interval (float): Seconds between flushes
+            max_events (int): Changes that trigger a flush before the interval ends
+        """
+        self.store = store
+        self.interval = interval
+        self.max_events = max_events
+        self.flushes = 0
+        self._counts = Counter()
+        self._solutions = {}
+        self._events = 0
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._closed = False
+        _buffers.add(self)
+
+    def count(self, kind, name, increment=1):
+        """
+        Add to a statistics counter.
+
+        Args:
+            kind (str): Kind of statistic, such as 'error_types'
+            name (str): Counter within the kind
+            increment (int): Amount to add
+        """
+        with self._lock:
+            self._counts[(kind, name)] += increment
+            self._changed()
+
+    def touch(self, solution):
+        """
+        Mark a solution whose counters changed, to be written with the next flush.
+
+        Args:
+            solution (dict): A solution already in the store
+        """
+        with self._lock:
+            self._solutions[id(solution)] = solution
+            self._changed()
+
+    def pending(self):
+        """
+        Report what waits to be written.
+
+        Returns:
+            dict: counters and solutions waiting, and flushes done
+        """
+        with self._lock:
+            return {'counters': len(self._counts), 'solutions': len(self._solutions), 'flushes': self.flushes}
+
+    def flush(self):
+        """
+        Write the pending changes now, in one transaction.
+
+        Returns:
+            int: Counters and solutions written; 0 if there was nothing to
+                write or the write failed (the changes are then kept for the
+                next flush)
+        """
+        with self._lock:
+            counts, self._counts = self._counts, Counter()
+            solutions, self._solutions = self._solutions, {}
+            self._events = 0
+        if not counts and not solutions:
+            return 0
+
+        try:
+            self.store.save(updated=list(solutions.values()),
+                            counts=[(kind, name, increment) for (kind, name), increment in counts.items()])
+        except (sqlite3.Error, OSError) as e:
+            print(f"Warning: Could not write knowledge base statistics: {e}")
+            with self._lock:
+                counts.update(self._counts)
+                self._counts = counts
+                solutions.update(self._solutions)
+                self._solutions = solutions
+            return 0
+
+        with self._lock:
+            self.flushes += 1
+        return len(counts) + len(solutions)
+
+    def close(self):
+        """Stop the flusher and write what is left."""
+        with self._lock:
+            self._closed = True
+            thread = self._thread
+        self._wake.set()
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(self.interval + 5)
+        self.flush()
+
+    def _changed(self):
+        """Count a change and start or wake the flusher as needed; called with the lock held."""
+        self._events += 1
+        if self._closed:
+            return
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='knowledge-base-flush')
+            self._thread.daemon = True
+            self._thread.start()
+        elif self._events >= self.max_events:
+            self._wake.set()
+
+    def _run(self):
+        """Flush every interval, or when woken, until closed."""
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            if self._closed:
+                return
+            self.flush()